@@ -1,8 +1,12 @@
+import re
 import yaml
 from typing import List
 from vpnspeed.errors import *
 from vpnspeed.model import VPN
 from vpnspeed.service.model import Context
+from vpnspeed.service.interval import POLICIES as INTERVAL_POLICIES
+from vpnspeed.service.scheduler import METHODS as SCHEDULING_METHODS
+from vpnspeed.tester import TESTERS
 from vpnspeed.tester.interfaces import Tester
 from vpnspeed import resources
 from vpnspeed.vpn.dynamic import PROVIDERS
@@ -41,8 +45,226 @@ def validate_format(config: dict):
     _valid_field_type("common_cities", config["config"]["common_cities"], bool)
 
 
+def _validate_concurrency(config):
+    limits = {"concurrency": config.concurrency}
+    for name, limit in (config.vpn_concurrency or {}).items():
+        limits["vpn_concurrency.{}".format(name)] = limit
+    for name, limit in (config.technology_concurrency or {}).items():
+        limits["technology_concurrency.{}".format(name)] = limit
+    for field, limit in limits.items():
+        if limit is None:
+            continue
+        _valid_field_type(field, limit, int)
+        if limit < 1:
+            raise VPNSpeedError(
+                "Value '{}' for field '{}' is invalid. Field should be at least 1".format(
+                    limit, field
+                )
+            )
+
+
+def _validate_interval_policy(policy):
+    if policy.name is not None and policy.name not in INTERVAL_POLICIES:
+        raise VPNSpeedError(
+            "Interval policy '{}' is not supported. Available policies are: [{}]".format(
+                policy.name, ", ".join(INTERVAL_POLICIES.keys())
+            )
+        )
+    for field, minimum in (("min_interval", 0), ("reference_bytes", 1)):
+        value = getattr(policy, field)
+        if value is None:
+            continue
+        _valid_field_type("interval_policy." + field, value, int)
+        if value < minimum:
+            raise VPNSpeedError(
+                "Value '{}' for field 'interval_policy.{}' is invalid. Field should be at least {}".format(
+                    value, field, minimum
+                )
+            )
+
+
+def _validate_adaptive(adaptive):
+    if adaptive.confidence is not None:
+        _valid_field_type("adaptive.confidence", adaptive.confidence, float)
+        if not 0 < adaptive.confidence < 1:
+            raise VPNSpeedError(
+                "Value '{}' for field 'adaptive.confidence' is invalid. Field should be between 0 and 1".format(
+                    adaptive.confidence
+                )
+            )
+    for field, minimum in (("min_runs", 2), ("max_runs", 1)):
+        value = getattr(adaptive, field)
+        if value is None:
+            continue
+        _valid_field_type("adaptive." + field, value, int)
+        if value < minimum:
+            raise VPNSpeedError(
+                "Value '{}' for field 'adaptive.{}' is invalid. Field should be at least {}".format(
+                    value, field, minimum
+                )
+            )
+
+
+# Docker cpuset format, e.g. "0-3" or "1,3"
+_CPUSET = re.compile(r"^\d+(-\d+)?(,\d+(-\d+)?)*$")
+# iperf3 server as host, host:port or [IPv6]:port
+_IPERF3_SERVER = re.compile(r"^(\[[0-9a-fA-F:.]+\](:\d+)?|[^\s:\[\]]+(:\d+)?|[0-9a-fA-F:]+)$")
+# iperf3 bitrate, e.g. "500M"
+_BITRATE = re.compile(r"^\d+(\.\d+)?[KMGkmg]?$")
+
+
+def _validate_iperf3(options):
+    if options.servers is not None:
+        _valid_field_type("iperf3.servers", options.servers, list)
+        for server in options.servers:
+            _valid_field_type("iperf3.servers", server, str)
+            if not _IPERF3_SERVER.match(server):
+                raise VPNSpeedError(
+                    "Value '{}' for field 'iperf3.servers' is invalid. Field should list servers as host or host:port".format(
+                        server
+                    )
+                )
+    # iperf3 runs at most 128 streams
+    for field, minimum, maximum in (("streams", 1, 128), ("duration", 1, None)):
+        value = getattr(options, field)
+        if value is None:
+            continue
+        _valid_field_type("iperf3." + field, value, int)
+        if value < minimum or maximum is not None and value > maximum:
+            raise VPNSpeedError(
+                "Value '{}' for field 'iperf3.{}' is invalid. Field should be at least {}{}".format(
+                    value, field, minimum, maximum and " and at most {}".format(maximum) or ""
+                )
+            )
+    for field in ("reverse", "udp"):
+        if getattr(options, field) is not None:
+            _valid_field_type("iperf3." + field, getattr(options, field), bool)
+    if options.bitrate is not None:
+        _valid_field_type("iperf3.bitrate", options.bitrate, (str, int))
+        if not _BITRATE.match(str(options.bitrate)):
+            raise VPNSpeedError(
+                "Value '{}' for field 'iperf3.bitrate' is invalid. Field should be bits per second, e.g. '500M' or '1G'".format(
+                    options.bitrate
+                )
+            )
+
+
+def _validate_resources(limits):
+    if limits.cpuset is not None:
+        _valid_field_type("resources.cpuset", limits.cpuset, (str, int))
+        if not _CPUSET.match(str(limits.cpuset)):
+            raise VPNSpeedError(
+                "Value '{}' for field 'resources.cpuset' is invalid. Field should list CPUs, e.g. '0-3' or '1,3'".format(
+                    limits.cpuset
+                )
+            )
+    if limits.cpus is not None:
+        _valid_field_type("resources.cpus", limits.cpus, (int, float))
+        if limits.cpus <= 0:
+            raise VPNSpeedError(
+                "Value '{}' for field 'resources.cpus' is invalid. Field should be positive".format(
+                    limits.cpus
+                )
+            )
+    # Docker minimums: 6 MiB of memory and CPU shares of 2
+    for field, minimum in (("memory", 6), ("cpu_shares", 2)):
+        value = getattr(limits, field)
+        if value is None:
+            continue
+        _valid_field_type("resources." + field, value, int)
+        if value < minimum:
+            raise VPNSpeedError(
+                "Value '{}' for field 'resources.{}' is invalid. Field should be at least {}".format(
+                    value, field, minimum
+                )
+            )
+
+
 def validate_values(context: Context):
-    if not context.config or not context.config.vpns:
+    if not context.config:
+        return
+
+    _validate_concurrency(context.config)
+    if context.config.prefetch is not None:
+        _valid_field_type("prefetch", context.config.prefetch, int)
+        if context.config.prefetch < 0:
+            raise VPNSpeedError(
+                "Value '{}' for field 'prefetch' is invalid. Field should not be negative".format(
+                    context.config.prefetch
+                )
+            )
+
+    if context.config.pool is not None:
+        for field in ("max_uses", "max_age"):
+            value = getattr(context.config.pool, field)
+            if value is None:
+                continue
+            _valid_field_type("pool." + field, value, int)
+            if value < 1:
+                raise VPNSpeedError(
+                    "Value '{}' for field 'pool.{}' is invalid. Field should be at least 1".format(
+                        value, field
+                    )
+                )
+        if context.config.pool.share_images is not None:
+            _valid_field_type(
+                "pool.share_images", context.config.pool.share_images, bool
+            )
+
+    if context.config.resources is not None:
+        _validate_resources(context.config.resources)
+
+    if context.config.interval_policy is not None:
+        _validate_interval_policy(context.config.interval_policy)
+
+    if context.config.adaptive is not None:
+        _validate_adaptive(context.config.adaptive)
+
+    if (
+        context.config.scheduling is not None
+        and context.config.scheduling not in SCHEDULING_METHODS
+    ):
+        raise VPNSpeedError(
+            "Scheduling '{}' is not supported. Available methods are: [{}]".format(
+                context.config.scheduling, ", ".join(SCHEDULING_METHODS)
+            )
+        )
+
+    if context.config.ip_echo is not None:
+        _valid_field_type("ip_echo", context.config.ip_echo, list)
+        if not context.config.ip_echo:
+            raise VPNSpeedError(
+                "Value '[]' for field 'ip_echo' is invalid. Field should list at least one URL"
+            )
+        for url in context.config.ip_echo:
+            _valid_field_type("ip_echo", url, str)
+            if not url.startswith(("http://", "https://")):
+                raise VPNSpeedError(
+                    "Value '{}' for field 'ip_echo' is invalid. Field should list HTTP(S) URLs".format(
+                        url
+                    )
+                )
+
+    if context.config.server_choice is not None:
+        _valid_field_type("server_choice", context.config.server_choice, int)
+        if context.config.server_choice < 1:
+            raise VPNSpeedError(
+                "Value '{}' for field 'server_choice' is invalid. Field should be at least 1".format(
+                    context.config.server_choice
+                )
+            )
+
+    if context.config.tester is not None and context.config.tester not in TESTERS:
+        raise VPNSpeedError(
+            "Tester '{}' is not supported. Available testers are: [{}]".format(
+                context.config.tester, ", ".join(TESTERS)
+            )
+        )
+
+    if context.config.iperf3 is not None:
+        _validate_iperf3(context.config.iperf3)
+
+    if not context.config.vpns:
         return
 
     for vpn in context.config.vpns:
@@ -1,4 +1,39 @@
 # DEFAULTS
 DEFAULT_SESSION_NAME = "vpnspeed"
 DEFAULT_TESTING_INTERVAL = 180  # Time beetween test in seconds
+DEFAULT_INTERVAL_REFERENCE_BYTES = 500 * 1024 ** 2  # Traffic worth full interval
 DEFAULT_SUBPROCESS_TIMEOUT = 180
+DEFAULT_CONNECT_TIMEOUT = 180  # Seconds to wait for VPN tunnel to pass traffic
+DEFAULT_CONCURRENCY = 1  # Test runs executed in parallel
+DEFAULT_POOL_MAX_USES = 10  # Test runs served by single pooled container
+DEFAULT_POOL_MAX_AGE = 3600  # Pooled container lifetime in seconds
+DEFAULT_ADAPTIVE_CONFIDENCE = 0.95  # Confidence level of compared intervals
+DEFAULT_ADAPTIVE_MIN_RUNS = 5  # Test runs before case interval is trusted
+DEFAULT_ADAPTIVE_MAX_RUNS = 30  # Test runs budget per case in adaptive mode
+DEFAULT_BREAKER_THRESHOLD = 3  # Consecutive failures opening a breaker
+DEFAULT_BREAKER_COOLDOWN = 600  # Seconds breaker stays open after first trip
+DEFAULT_BREAKER_MAX_COOLDOWN = 86400  # Upper bound of doubling cooldown
+DEFAULT_DOCKER_API_CONCURRENCY = 16  # Docker API calls awaiting response at once
+DEFAULT_DOCKER_KEEPALIVE = 60  # Seconds idle Docker API connections are kept
+DEFAULT_EXEC_MAX_LINE = 1024 ** 2  # Bytes of streamed output line before it is split
+DEFAULT_JSON_MAX_SIZE = 16 * 1024 ** 2  # Characters of single streamed JSON value
+DEFAULT_REAPER_INTERVAL = 300  # Seconds between orphan test container checks
+DEFAULT_REAPER_GRACE = 60  # Seconds untracked new containers are not reaped
+DEFAULT_LATENCY_TIMEOUT = 3  # Seconds per TCP connect measuring host latency
+DEFAULT_LATENCY_TTL = 300  # Seconds measured host latencies are reused
+DEFAULT_LATENCY_CONCURRENCY = 32  # TCP connects measuring host latency at once
+DEFAULT_GEOIP_CACHE_SIZE = 4096  # IP locations kept in memory
+DEFAULT_GEOIP_TTL = 86400  # Seconds IP location is reused
+DEFAULT_EGRESS_HEDGE_DELAY = 1.0  # Seconds before next IP echo endpoint is asked
+DEFAULT_SERVER_LIST_TTL = 21600  # Seconds cached speedtest server list is used
+DEFAULT_SERVER_LIST_REFRESH = 3600  # Seconds before cached server list is refreshed
+DEFAULT_SERVER_CHECK_TTL = 86400  # Seconds server check and connect time are kept
+DEFAULT_SERVER_FAILURE_TTL = 3600  # Seconds failed server is skipped
+DEFAULT_SERVER_CHECK_CONCURRENCY = 8  # Speedtest servers measured at once
+DEFAULT_SERVER_CHOICE = 3  # Fastest speedtest servers one is chosen from
+DEFAULT_TESTER = "speedtest"  # Tester used unless configured otherwise
+DEFAULT_IPERF3_PORT = 5201  # Port of iperf3 servers listed without one
+DEFAULT_IPERF3_STREAMS = 4  # Parallel iperf3 streams
+DEFAULT_IPERF3_DURATION = 10  # Seconds iperf3 measures each direction
+DEFAULT_IPERF3_BITRATE = "1G"  # Bits per second iperf3 sends over UDP
+DEFAULT_IPERF3_GRACE = 30  # Seconds iperf3 may take beyond its duration
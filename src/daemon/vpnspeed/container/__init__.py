@@ -1,2 +1,25 @@
+from .client import DockerClients, EndpointStats, docker_clients
+from .images import (
+    ImageRegistry,
+    ImageState,
+    ImageStatus,
+    image_registry,
+    images_for,
+    shared_image,
+)
+from .registry import (
+    ContainerRegistry,
+    RegistryStats,
+    TrackedContainer,
+    container_registry,
+)
+from .stream import (
+    ExecOutput,
+    ExecStream,
+    JSONStreamDecoder,
+    LineDecoder,
+    json_values,
+)
 from .containersutils import ContainerUtils
 from .containerenvironment import ContainerEnvironment
+from .pool import ContainerPool, PooledEnvironment, PoolStats
@@ -0,0 +1,88 @@
+"""
+Per command cost of Docker exec against the container shell channel.
+
+    python3 -m vpnspeed.container.benchmark --image debian:10 --commands 200
+"""
+
+import argparse
+import asyncio
+import logging
+import statistics
+from typing import List
+
+from .client import docker_clients
+from .containersutils import ContainerUtils
+
+
+async def _measure(
+    container: ContainerUtils, channel: bool, commands: int, parallel: int
+) -> List[float]:
+    loop = asyncio.get_event_loop()
+    latencies = []
+
+    async def run(count: int):
+        for _ in range(count):
+            started = loop.time()
+            status, _ = await container.exec(
+                ["cat", "/etc/hostname"], output=True, channel=channel
+            )
+            if status != 0:
+                raise RuntimeError("Benchmark command failed")
+            latencies.append(loop.time() - started)
+
+    await asyncio.gather(*(run(commands // parallel) for _ in range(parallel)))
+    return latencies
+
+
+def _summary(name: str, latencies: List[float], elapsed: float) -> str:
+    latencies = sorted(latencies)
+    return "{:<8} mean {:7.2f}ms  p50 {:7.2f}ms  p95 {:7.2f}ms  {:7.1f} cmd/s".format(
+        name,
+        statistics.mean(latencies) * 1000,
+        latencies[len(latencies) // 2] * 1000,
+        latencies[int(len(latencies) * 0.95)] * 1000,
+        len(latencies) / elapsed,
+    )
+
+
+async def _benchmark(args):
+    container = ContainerUtils()
+    await container.create(args.image, "vpnspeed_benchmark", args.cmd)
+    if container.get_error_message() is not None:
+        raise RuntimeError(container.get_error_message())
+    try:
+        await container.connect()
+        # Warm up both paths, the channel handshake is not measured
+        for channel in (False, True):
+            await _measure(container, channel, 5, 1)
+        loop = asyncio.get_event_loop()
+        for parallel in sorted({1, args.parallel}):
+            print("{} command(s) in parallel:".format(parallel))
+            for name, channel in (("exec", False), ("channel", True)):
+                started = loop.time()
+                latencies = await _measure(container, channel, args.commands, parallel)
+                print("  " + _summary(name, latencies, loop.time() - started))
+    finally:
+        await container.delete()
+        await docker_clients.close()
+
+
+def _main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--image", default="debian:10")
+    parser.add_argument("--cmd", default="/bin/bash", help="Command ending in a shell")
+    parser.add_argument("--commands", type=int, default=200)
+    parser.add_argument("--parallel", type=int, default=8)
+    parser.add_argument(
+        "-l",
+        "--log-level",
+        default="critical",
+        choices=["critical", "error", "warning", "info", "debug", "notset"],
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging._nameToLevel.get(args.log_level.upper()))
+    asyncio.run(_benchmark(args))
+
+
+if __name__ == "__main__":
+    _main()
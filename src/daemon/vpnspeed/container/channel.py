@@ -0,0 +1,259 @@
+import asyncio
+import base64
+import itertools
+import shlex
+from typing import Dict, List, Optional
+
+import aiohttp
+
+from vpnspeed import log
+
+
+# Frames written by the shell, one per line:
+#   @@VS <id> o <base64 chunk>  stdout of request
+#   @@VS <id> e <base64 chunk>  stderr of request
+#   @@VS <id> x <exit code>     request finished
+#   @@VS ready <token> <uid>    handshake, user id of the shell
+_FRAME = "@@VS"
+
+# Loaded into the container shell once. Requests run in the background,
+# so they are multiplexed, output goes through files and is framed in
+# chunks small enough for atomic pipe writes, so frames never interleave.
+# Commands run in their own session, `__vs_kill` stops one with all the
+# processes it started.
+_AGENT = r"""
+__vs_dir=${__vs_dir:-$(mktemp -d)}
+__vs_send() { base64 -w 3000 "$3" | while read -r l; do printf '@@VS %s %s %s\n' "$1" "$2" "$l"; done; }
+__vs() {
+    local id=$1 out err rc; shift
+    out=$(mktemp); err=$(mktemp)
+    setsid "$@" >"$out" 2>"$err" </dev/null & echo $! > "$__vs_dir/$id"
+    wait $!; rc=$?
+    rm -f "$__vs_dir/$id"
+    __vs_send "$id" o "$out"; __vs_send "$id" e "$err"
+    printf '@@VS %s x %s\n' "$id" "$rc"
+    rm -f "$out" "$err"
+}
+__vs_kill() { local pid; pid=$(cat "$__vs_dir/$1" 2>/dev/null) && kill -KILL -- "-$pid"; }
+"""
+
+_HANDSHAKE = "printf '@@VS ready %s %s\\n' {} \"$(id -u)\"\n"
+
+# Exit codes of commands which could not be executed at all
+_NOT_EXECUTED = (126, 127)
+
+
+class ChannelClosed(Exception):
+    pass
+
+
+class Transport:
+    """Byte stream to the shell of a container."""
+
+    async def send(self, data: bytes):
+        raise NotImplementedError()
+
+    async def receive(self) -> Optional[bytes]:
+        """Next received bytes, None once closed."""
+        raise NotImplementedError()
+
+
+class WebSocketTransport(Transport):
+    """Attached container stdin and stdout."""
+
+    def __init__(self, ws: aiohttp.ClientWebSocketResponse):
+        self._ws = ws
+
+    async def send(self, data: bytes):
+        await self._ws.send_bytes(data)
+
+    async def receive(self) -> Optional[bytes]:
+        while True:
+            message = await self._ws.receive()
+            if message.type == aiohttp.WSMsgType.BINARY:
+                return message.data
+            if message.type == aiohttp.WSMsgType.TEXT:
+                return message.data.encode()
+            if message.type in (
+                aiohttp.WSMsgType.CLOSE,
+                aiohttp.WSMsgType.CLOSING,
+                aiohttp.WSMsgType.CLOSED,
+                aiohttp.WSMsgType.ERROR,
+            ):
+                return None
+
+
+class _Request:
+    def __init__(self):
+        self.stdout: List[bytes] = []
+        self.stderr: List[bytes] = []
+        self.done = asyncio.get_event_loop().create_future()
+
+
+class CommandChannel:
+    """
+    Runs commands through the long running shell of a container.
+
+    Unlike a Docker exec per command, a request is a single line written to
+    the shell and its framed output read back, requests are multiplexed by
+    id. The channel is opened on first use. Once the shell does not answer
+    the handshake, runs as another user than `uid` or the stream closes,
+    `exec` raises `ChannelClosed` for requests it could not send and
+    callers fall back to Docker exec. Cancelled requests are killed.
+    """
+
+    def __init__(
+        self, transport: Transport, handshake_timeout: float = 5, uid: int = None
+    ):
+        self._transport = transport
+        self._handshake_timeout = handshake_timeout
+        self._uid = uid
+        self._ids = itertools.count()
+        self._requests: Dict[str, _Request] = dict()
+        self._reader: asyncio.Task = None
+        self._ready: asyncio.Future = None
+        self._opening: asyncio.Lock = None
+        self._closed = False
+
+    @property
+    def available(self) -> bool:
+        return not self._closed
+
+    async def exec(
+        self, cmd: List[str], output: bool = False, allow_error: bool = False
+    ) -> list:
+        """Same results as `ContainerUtils.exec`, raises ChannelClosed if not sent."""
+        await self._open()
+        id_ = str(next(self._ids))
+        request = self._requests[id_] = _Request()
+        try:
+            line = "__vs {} {} &\n".format(id_, " ".join(map(shlex.quote, cmd)))
+            try:
+                await self._transport.send(line.encode())
+            except Exception as e:
+                self._close()
+                raise ChannelClosed(str(e))
+            try:
+                returncode = await request.done
+            except asyncio.CancelledError:
+                # Timed out, the command must not keep running
+                await self._kill(id_)
+                raise
+        finally:
+            self._requests.pop(id_, None)
+
+        stdout = b"".join(request.stdout).decode(errors="replace")
+        stderr = b"".join(request.stderr).decode(errors="replace")
+        if returncode in _NOT_EXECUTED or (stderr and not allow_error):
+            return [-1, None]
+        if not output:
+            return [0, None]
+        messages = [m for m in (stdout, stderr if allow_error else "") if m]
+        if not messages:
+            return [-1, None]
+        return [0, messages]
+
+    async def _kill(self, id_: str):
+        try:
+            await self._transport.send("__vs_kill {}\n".format(id_).encode())
+        except Exception as e:
+            log.debug("Failed to kill command {}: {}".format(id_, e))
+
+    async def close(self):
+        self._close()
+        if self._reader is not None:
+            self._reader.cancel()
+            await asyncio.gather(self._reader, return_exceptions=True)
+
+    async def _open(self):
+        if self._closed:
+            raise ChannelClosed("Channel closed")
+        if self._opening is None:
+            self._opening = asyncio.Lock()
+        async with self._opening:
+            if self._ready is not None and self._ready.done():
+                return
+            self._ready = asyncio.get_event_loop().create_future()
+            if self._reader is None:
+                self._reader = asyncio.create_task(self._read())
+            # Entrypoint may still run before the shell reads its input,
+            # anything it consumes is resent
+            loop = asyncio.get_event_loop()
+            deadline = loop.time() + self._handshake_timeout
+            token = 0
+            while not self._ready.done():
+                token += 1
+                try:
+                    await self._transport.send(
+                        (_AGENT + _HANDSHAKE.format(token)).encode()
+                    )
+                    await asyncio.wait_for(
+                        asyncio.shield(self._ready),
+                        min(1, max(deadline - loop.time(), 0)),
+                    )
+                except asyncio.TimeoutError:
+                    if loop.time() >= deadline:
+                        self._close()
+                        raise ChannelClosed("Container shell did not answer")
+                except ChannelClosed:
+                    raise
+                except Exception as e:
+                    self._close()
+                    raise ChannelClosed(str(e))
+
+    async def _read(self):
+        buffer = b""
+        try:
+            while True:
+                data = await self._transport.receive()
+                if data is None:
+                    break
+                buffer += data
+                *lines, buffer = buffer.split(b"\n")
+                for line in lines:
+                    self._handle(line.decode(errors="replace").strip())
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            log.warning("Command channel failed:\n%s", e)
+        finally:
+            self._close()
+
+    def _handle(self, line: str):
+        parts = line.split(" ", 3)
+        if len(parts) < 3 or parts[0] != _FRAME:
+            return
+        if parts[1] == "ready":
+            if self._ready is None or self._ready.done():
+                return
+            uid = parts[3] if len(parts) > 3 else None
+            if self._uid is not None and uid != str(self._uid):
+                # Commands would run with the wrong privileges
+                self._ready.set_exception(
+                    ChannelClosed("Container shell runs as uid {}".format(uid))
+                )
+                self._ready.exception()
+                self._close()
+                return
+            self._ready.set_result(None)
+            return
+        request = self._requests.get(parts[1])
+        if request is None or request.done.done():
+            return
+        if parts[2] == "x":
+            request.done.set_result(int(parts[3]) if len(parts) > 3 else -1)
+            return
+        chunk = base64.b64decode(parts[3]) if len(parts) > 3 else b""
+        (request.stdout if parts[2] == "o" else request.stderr).append(chunk)
+
+    def _close(self):
+        if self._closed:
+            return
+        self._closed = True
+        if self._ready is not None and not self._ready.done():
+            self._ready.set_exception(ChannelClosed("Channel closed"))
+            # Retrieved or not, do not warn about it
+            self._ready.exception()
+        for request in self._requests.values():
+            if not request.done.done():
+                request.done.set_result(-1)
@@ -0,0 +1,174 @@
+import asyncio
+import os
+import re
+import threading
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+import aiohttp
+from aiodocker.docker import Docker
+from yarl import URL
+
+from vpnspeed import log
+from vpnspeed.constans import DEFAULT_DOCKER_API_CONCURRENCY, DEFAULT_DOCKER_KEEPALIVE
+
+
+_DEFAULT_SOCKET = "/var/run/docker.sock"
+_UNIX_PREFIX = "unix://"
+
+# Path segments following these are object ids or names
+_COLLECTIONS = {"containers", "exec", "networks", "volumes"}
+_ACTIONS = {"create", "json", "prune"}
+_API_VERSION = re.compile(r"^v\d+\.\d+$")
+
+
+@dataclass
+class EndpointStats:
+    calls: int = 0
+    errors: int = 0
+    # Seconds until response headers, streamed bodies are not included
+    total_time: float = 0.0
+    max_time: float = 0.0
+    mean_time: float = 0.0
+
+    def add(self, elapsed: float, failed: bool = False):
+        self.calls += 1
+        self.errors += int(failed)
+        self.total_time += elapsed
+        self.max_time = max(self.max_time, elapsed)
+        self.mean_time = self.total_time / self.calls
+
+
+def endpoint(method: str, url: URL) -> str:
+    """Docker API endpoint of request with ids and names replaced."""
+    parts = [part for part in url.path.split("/") if part]
+    if parts and _API_VERSION.match(parts[0]):
+        parts = parts[1:]
+    if len(parts) > 2 and parts[0] == "images":
+        # Image names contain slashes
+        parts = ["images", "{name}", parts[-1]]
+    for i in range(1, len(parts)):
+        if parts[i - 1] in _COLLECTIONS and parts[i] not in _ACTIONS:
+            parts[i] = "{id}"
+    return "{} /{}".format(method, "/".join(parts))
+
+
+class DockerClients:
+    """
+    Process wide Docker client shared by all containers.
+
+    Requests reuse keep-alive connections of a single Unix socket connector
+    instead of each container opening its own client. At most
+    `concurrency` API calls wait for a response at once, streams (exec
+    output, attached websockets) do not count once their response started.
+    """
+
+    _docker: Optional[Docker]
+    _loop: Optional[asyncio.AbstractEventLoop]
+    _semaphore: Optional[asyncio.Semaphore]
+    _stats: Dict[str, EndpointStats]
+
+    def __init__(
+        self,
+        concurrency: int = DEFAULT_DOCKER_API_CONCURRENCY,
+        keepalive: float = DEFAULT_DOCKER_KEEPALIVE,
+    ):
+        self._concurrency = concurrency
+        self._keepalive = keepalive
+        self._docker = None
+        self._loop = None
+        self._semaphore = None
+        self._stats = dict()
+
+    def get(self) -> Docker:
+        """Client bound to the running event loop, created on first use."""
+        loop = asyncio.get_event_loop()
+        if self._docker is None or self._loop is not loop:
+            if self._docker is not None:
+                self._discard(self._docker, self._loop)
+            self._docker = self._make_client()
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self._concurrency)
+        return self._docker
+
+    def stats(self) -> Dict[str, EndpointStats]:
+        return {key: EndpointStats(**vars(value)) for key, value in self._stats.items()}
+
+    async def close(self):
+        docker, self._docker, self._loop = self._docker, None, None
+        if docker is not None:
+            await _close_client(docker)
+
+    @staticmethod
+    def _discard(docker: Docker, loop: asyncio.AbstractEventLoop):
+        """Close client of an event loop which is no longer used."""
+        if loop.is_running():
+            # Loop of another thread
+            asyncio.run_coroutine_threadsafe(_close_client(docker), loop)
+        elif not loop.is_closed():
+            # This thread runs the new loop, the idle one runs in a helper
+            thread = threading.Thread(
+                target=loop.run_until_complete, args=(_close_client(docker),)
+            )
+            thread.start()
+            thread.join()
+        else:
+            # Transports of a closed loop can not be closed any more, like
+            # aiohttp does the connector drops them
+            connector = docker.session.connector
+            docker.session.detach()
+            if connector is not None:
+                asyncio.ensure_future(connector.close())
+
+    def _make_client(self) -> Docker:
+        host = os.environ.get("DOCKER_HOST", _UNIX_PREFIX + _DEFAULT_SOCKET)
+        if not host.startswith(_UNIX_PREFIX):
+            log.info("Docker host {} is not a Unix socket, not pooling".format(host))
+            return Docker(host)
+        connector = aiohttp.UnixConnector(
+            host[len(_UNIX_PREFIX) :], limit=0, keepalive_timeout=self._keepalive
+        )
+        session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=None),
+            trace_configs=[self._trace_config()],
+        )
+        # Host is only used to compose URLs, the connector picks the socket
+        return Docker("unix://localhost", connector=connector, session=session)
+
+    def _trace_config(self) -> aiohttp.TraceConfig:
+        trace = aiohttp.TraceConfig()
+        trace.on_request_start.append(self._on_request_start)
+        trace.on_request_end.append(self._on_request_end)
+        trace.on_request_exception.append(self._on_request_exception)
+        return trace
+
+    async def _on_request_start(self, session, context, params):
+        semaphore = self._semaphore
+        await semaphore.acquire()
+        context.semaphore = semaphore
+        context.started = asyncio.get_event_loop().time()
+
+    async def _on_request_end(self, session, context, params):
+        self._finish(context, params, params.response.status >= 400)
+
+    async def _on_request_exception(self, session, context, params):
+        self._finish(context, params, True)
+
+    def _finish(self, context, params, failed: bool):
+        if not hasattr(context, "started"):
+            # Cancelled while waiting for a slot
+            return
+        context.semaphore.release()
+        elapsed = asyncio.get_event_loop().time() - context.started
+        key = endpoint(params.method, params.url)
+        self._stats.setdefault(key, EndpointStats()).add(elapsed, failed)
+
+
+async def _close_client(docker: Docker):
+    await docker.close()
+    # Session passed to the client is not closed with it
+    await docker.session.close()
+
+
+docker_clients = DockerClients()
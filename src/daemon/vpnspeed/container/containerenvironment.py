@@ -1,31 +1,59 @@
 import asyncio
-from typing import List
+import base64
+from contextlib import asynccontextmanager
+from typing import Dict, List
 from aiodocker.docker import Docker, DockerContainer
 from aiodocker.exceptions import DockerError
 import aiohttp
 import string
 import time
-from vpnspeed import log, resources
+from vpnspeed import log
+from vpnspeed.model import Resources
+from vpnspeed.timeline import Timeline
 from vpnspeed.container import ContainerUtils
-from vpnspeed.utils import try_json
+from .images import image_name
+from .stream import ExecStream, JSONStreamDecoder
 from vpnspeed.errors import *
-import yaml
+
+
+# Write base64 `$1` to `$2` from inside the container
+_WRITE_FILE = 'printf %s "$1" | base64 -d > "$2"'
 
 
 class ContainerEnvironment:
-    _CONFIG = yaml.safe_load(resources.resource_stream("static.yaml"))
     _dockerContainer: ContainerUtils
     _vpn: str
     _technology: str
+    _instance: int
     _error_message: str = None
+    # Steps of the test run the environment is used for
+    timeline: Timeline
+    resources: Resources
 
     def get_error_message(self) -> str:
         return self._error_message
 
-    def __init__(self, vpn: str, technology: str = "none"):
+    def __init__(
+        self,
+        vpn: str,
+        technology: str = "none",
+        instance: int = None,
+        resources: Resources = None,
+    ):
         self._dockerContainer = ContainerUtils()
         self._vpn = vpn
         self._technology = technology
+        self._instance = instance
+        self.timeline = Timeline()
+        self.resources = resources
+
+    @property
+    def name(self) -> str:
+        name = "{}_{}".format(self._vpn, self._technology.replace("/", "-"))
+        if self._instance is not None:
+            # Parallel runs need distinct containers for the same (vpn, technology)
+            name += "_{}".format(self._instance)
+        return name
 
     async def exec(
         self,
@@ -53,27 +81,61 @@ class ContainerEnvironment:
         if output and stdout is None:
             return [-1, None]
         if resp_json:
+            # Values may be split across output messages
+            decoder = JSONStreamDecoder()
             for result in stdout:
-                json = try_json(result)
-                if json is not None:
-                    return [0, json]
+                values = decoder.feed(result)
+                if values:
+                    return [0, values[0]]
             return [-2, stdout]
         stdout = "".join(stdout) if type(stdout) is list else stdout
         return [0, stdout]
 
+    def stream_exec(
+        self, cmd: str, args=None, timeout: float = 600, user: str = "root"
+    ) -> ExecStream:
+        """
+        Output lines of a long running command as they arrive, in bounded
+        memory, use `json_values` on it for JSON output.
+        """
+        cmd_list = [cmd] + (args if type(args) is list else [args] if args else [])
+        log.debug("Streaming cmd: {}".format(cmd_list))
+        return self._dockerContainer.stream_exec(cmd_list, user, timeout)
+
     async def read_file(self, name: str) -> str:
         retcode, stdout = await self.exec("cat", "{}".format(name), output=True)
         await asyncio.sleep(0)
         return stdout
 
     async def write_file(self, name: str, data: str):
-        await self.exec("write_to_file", [data, name])
-        await asyncio.sleep(0)
+        """
+        Overwrite `name` in place from inside the container, unlike archive
+        uploads this writes the file the container sees when Docker manages
+        it (e.g. /etc/resolv.conf, which the entrypoint unmounts).
+        """
+        content = base64.b64encode(data.encode()).decode()
+        await self.exec("bash", ["-c", _WRITE_FILE, "write_file", content, name])
+
+    async def write_files(self, files: Dict[str, str], mode: int = 0o600) -> bool:
+        """Write all files with one archive upload, instead of a command each."""
+        return await self._dockerContainer.put_files(files, mode)
 
     async def delete_file(self, name: str):
         await self.exec("rm", "{}".format(name))
         await asyncio.sleep(0)
 
+    async def delete_files(self, names: List[str]):
+        await self.exec("rm", ["-f", *names])
+
+    @asynccontextmanager
+    async def staged_files(self, files: Dict[str, str], mode: int = 0o600):
+        """Files present for the duration of the block, e.g. credentials."""
+        await self.write_files(files, mode)
+        try:
+            yield
+        finally:
+            await self.delete_files(list(files))
+
     async def sub_exec(self, cmd: str, args=None) -> int:
         if (args is not None) and (type(args) is not list):
             args = args.split()
@@ -94,29 +156,38 @@ class ContainerEnvironment:
         return returncode
 
     def get_image(self, vpn: str, technology: str) -> str:
-        imageDictionary = self._CONFIG["plugin"]["images"]
-        if vpn in imageDictionary:
-            return "vpnspeed/{}".format(imageDictionary[vpn])
-        if technology in imageDictionary:
-            return "vpnspeed/{}".format(imageDictionary[technology])
-        return None
+        return image_name(vpn, technology)
 
-    async def __aenter__(self):
+    async def start(self):
         await self._dockerContainer.add_mount("/dev/net/tun", "/dev/net/tun")
         image_name = self.get_image(self._vpn, self._technology)
         if image_name is None:
             return None
-        container_name = "{}_{}".format(self._vpn, self._technology.replace("/", "-"))
+        container_name = self.name
         container_cmd = "/entrypoint.sh"
         log.info("Container cmd: {}".format(container_cmd))
-        await self._dockerContainer.create(image_name, container_name, container_cmd)
+        with self.timeline.phase("image"):
+            # Create checks again, served from the image cache by then
+            await self._dockerContainer.image_exist(image_name)
+        with self.timeline.phase("create"):
+            await self._dockerContainer.create(
+                image_name, container_name, container_cmd, self.resources
+            )
         self._error_message = self._dockerContainer.get_error_message()
         if self._error_message is not None:
             raise VPNSpeedError(
                 "Unavailable to create env '{}'".format(self._error_message)
             )
-        await self._dockerContainer.connect()
+        with self.timeline.phase("start"):
+            await self._dockerContainer.connect()
         return self
 
+    async def stop(self):
+        with self.timeline.phase("delete"):
+            await self._dockerContainer.delete()
+
+    async def __aenter__(self):
+        return await self.start()
+
     async def __aexit__(self, exc_type, exc_val, exc_tb):
-        await self._dockerContainer.delete()
+        await self.stop()
@@ -1,22 +1,68 @@
 import asyncio
+import io
+import tarfile
 from aiodocker.docker import Docker, DockerContainer
 from aiodocker.exceptions import DockerError
 import aiohttp
 import string
 import time
+from typing import Dict, List, Union
 from vpnspeed import log
+from vpnspeed.model import Resources
+from .client import docker_clients
+from .channel import ChannelClosed, CommandChannel, WebSocketTransport
+from .images import image_registry
+from .registry import container_registry
+from .stream import ExecStream
+
+
+def make_archive(files: Dict[str, Union[str, bytes]], mode: int = 0o644) -> bytes:
+    """In memory tar of `files` by path, relative paths are taken from root."""
+    buffer = io.BytesIO()
+    now = time.time()
+    with tarfile.open(fileobj=buffer, mode="w") as tar:
+        for path, content in files.items():
+            data = content.encode() if isinstance(content, str) else content
+            info = tarfile.TarInfo(path.lstrip("/"))
+            info.size = len(data)
+            # Permissions are set on extraction, files are never exposed
+            info.mode = mode
+            info.mtime = now
+            tar.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+def host_limits(resources: Resources = None) -> dict:
+    """Docker host config of resource limits, next to the other host fields."""
+    if resources is None:
+        return {}
+    limits = {
+        "CpusetCpus": resources.cpuset and str(resources.cpuset),
+        "NanoCpus": resources.cpus and int(resources.cpus * 10 ** 9),
+        "Memory": resources.memory and resources.memory * 1024 ** 2,
+        "CpuShares": resources.cpu_shares,
+    }
+    return {key: value for key, value in limits.items() if value}
 
 
 class ContainerUtils:
-    _docker: Docker
     _mount_list: list
     _container: DockerContainer
     _container_ws: aiohttp.ClientWebSocketResponse
+    _channel: CommandChannel
+    _run: str
     _error_message: str = None
 
     def __init__(self):
-        self._docker = Docker()
         self._mount_list = []
+        self._container = None
+        self._channel = None
+        self._run = None
+
+    @property
+    def _docker(self) -> Docker:
+        # Shared by all containers, never closed here
+        return docker_clients.get()
 
     def get_error_message(self) -> str:
         return self._error_message
@@ -29,14 +75,10 @@ class ContainerUtils:
             return False
 
     async def image_exist(self, image: str) -> str:
-        try:
-            await self._docker.images.inspect(image)
+        # Resolved once and cached until Docker reports the image changed
+        if await image_registry.ensure(image) is not None:
             return None
-        except DockerError as e:
-            if e.status == 404:
-                if await self.pull_docker_image(image):
-                    return None
-            return "Error retrieving {} image.".format(image)
+        return "Error retrieving {} image.".format(image)
 
     async def add_mount(self, source: str, target: str):
         mountConfig = {
@@ -54,14 +96,19 @@ class ContainerUtils:
         image: str = "debian:10",
         container_name: str = "default",
         container_cmd: str = "/bin/bash",
+        resources: Resources = None,
     ):
         self._container = await self.make_container(
-            image, container_name, container_cmd
+            image, container_name, container_cmd, resources
         )
         return self
 
     async def make_container(
-        self, image: str, container_name: str, container_cmd: str
+        self,
+        image: str,
+        container_name: str,
+        container_cmd: str,
+        resources: Resources = None,
     ) -> DockerContainer:
         status = await self.image_exist(image)
         if status is not None:
@@ -79,16 +126,46 @@ class ContainerUtils:
             "Privileged": True,
             "Sysctls": {"net.ipv6.conf.all.disable_ipv6": "0"},
             "Mounts": self._mount_list,
+            **host_limits(resources),
         }
-        return await self._docker.containers.create_or_replace(
-            config=config, name=container_name
-        )
+        # Labels find the container again if the daemon dies before delete
+        self._run = container_registry.new_run()
+        config["Labels"] = container_registry.labels(self._run)
+        try:
+            container = await self._docker.containers.create_or_replace(
+                config=config, name=container_name
+            )
+        except BaseException:
+            container_registry.untrack(None, self._run)
+            raise
+        container_registry.track(container.id, container_name, self._run)
+        return container
+
+    async def put_files(
+        self, files: Dict[str, Union[str, bytes]], mode: int = 0o644
+    ) -> bool:
+        """
+        Upload files with a single archive request, works before and after
+        the container is started.
+        """
+        try:
+            await self._container.put_archive("/", make_archive(files, mode))
+            return True
+        except DockerError as e:
+            log.warning("Failed to upload {}:\n{}".format(", ".join(files), e))
+            return False
 
     async def connect(self):
         self._container_ws = await self._container.websocket(
             stdin=True, stdout=True, stderr=True, stream=True
         )
         await self._container.start()
+        # Commands are sent to the shell the entrypoint ends with. Images
+        # with another USER (e.g. expressvpn, pure) run it unprivileged,
+        # root commands then use Docker exec.
+        self._channel = CommandChannel(
+            WebSocketTransport(self._container_ws), uid=0
+        )
         await asyncio.sleep(0)
         # print("Connection started...")
 
@@ -120,6 +197,12 @@ class ContainerUtils:
             message = await result_stream.read_out()
         return message_list
 
+    def stream_exec(
+        self, cmd: List[str], user: str = "root", timeout: float = 600
+    ) -> ExecStream:
+        """Output lines as the command writes them, see `ExecStream`."""
+        return ExecStream(self._container, cmd, user, timeout)
+
     async def exec(
         self,
         cmd: str,
@@ -127,7 +210,26 @@ class ContainerUtils:
         timeout=600,
         allow_error: bool = False,
         user: str = "root",
+        channel: bool = True,
     ):
+        """
+        Run command, over the container shell channel when possible,
+        `channel` False forces a Docker exec.
+        """
+        if (
+            channel
+            and user == "root"
+            and self._channel is not None
+            and self._channel.available
+        ):
+            try:
+                return await asyncio.wait_for(
+                    self._channel.exec(cmd, output, allow_error), timeout
+                )
+            except asyncio.TimeoutError:
+                return [-1, "timeout"]
+            except ChannelClosed as e:
+                log.info("Command channel unavailable, using exec: {}".format(e))
         return_list = list()
         try:
             message_list = await asyncio.wait_for(
@@ -147,11 +249,17 @@ class ContainerUtils:
             return [-1, "timeout"]
 
     async def disconnect(self):
+        if self._channel is not None:
+            await self._channel.close()
         await self._container_ws.close()
         # print("Connection closed.")
 
     async def delete(self):
+        if self._channel is not None:
+            await self._channel.close()
         if self._container is not None:
-            await self._container.delete(force=True)
-        if self._docker is not None:
-            await self._docker.close()
+            try:
+                await self._container.delete(force=True)
+            finally:
+                # Left over containers are reaped as untracked
+                container_registry.untrack(self._container.id, self._run)
@@ -0,0 +1,218 @@
+import asyncio
+import json
+from dataclasses import dataclass
+from enum import Enum
+from typing import Dict, Iterable, List, Optional, Set
+
+from aiodocker.exceptions import DockerError
+import yaml
+
+from vpnspeed import log, resources
+from vpnspeed.model import VPN
+from .client import docker_clients
+
+
+_IMAGES = yaml.safe_load(resources.resource_stream("static.yaml"))["plugin"]["images"]
+
+# Seconds before watching Docker image events again after the stream ended
+_EVENTS_RETRY = 10
+
+
+class ImageState(Enum):
+    unknown = 0
+    pulling = 1
+    ready = 2
+    failed = 3
+
+    def __getstate__(self):
+        return self.name
+
+
+@dataclass
+class ImageStatus:
+    image: str
+    state: ImageState = ImageState.unknown
+    id: str = None
+    error: str = None
+    # Pull progress over all layers
+    layers: int = 0
+    layers_done: int = 0
+    downloaded: int = 0
+    total: int = 0
+
+
+class _Progress:
+    """Pull progress of an image from the streamed messages of its layers."""
+
+    def __init__(self, status: ImageStatus):
+        self._status = status
+        self._layers: Dict[str, dict] = dict()
+
+    def update(self, message: dict):
+        layer = message.get("id")
+        if layer is None or "progressDetail" not in message:
+            return
+        entry = self._layers.setdefault(layer, {"current": 0, "total": 0, "done": False})
+        detail = message.get("progressDetail") or {}
+        if message.get("status") == "Downloading" and detail.get("total"):
+            entry["current"] = detail.get("current", 0)
+            entry["total"] = detail["total"]
+        if message.get("status") in ("Pull complete", "Already exists"):
+            entry["done"] = True
+            entry["current"] = entry["total"]
+        layers = self._layers.values()
+        self._status.layers = len(self._layers)
+        self._status.layers_done = sum(1 for e in layers if e["done"])
+        self._status.downloaded = sum(e["current"] for e in layers)
+        self._status.total = sum(e["total"] for e in layers)
+
+
+def image_name(vpn: str, technology: str) -> Optional[str]:
+    """Image of a VPN app if it has one, otherwise of the technology."""
+    if vpn in _IMAGES:
+        return "vpnspeed/{}".format(_IMAGES[vpn])
+    if technology in _IMAGES:
+        return "vpnspeed/{}".format(_IMAGES[technology])
+    return None
+
+
+def shared_image(vpn: str, technology: str) -> Optional[str]:
+    """Generic technology image of a VPN without an app image of its own."""
+    if vpn in _IMAGES:
+        return None
+    return image_name(vpn, technology)
+
+
+def images_for(vpns: Iterable[VPN]) -> Set[str]:
+    """Images containers of configured VPNs use, incl. technology-less ones."""
+    images = set()
+    for vpn in vpns or []:
+        for technology in [t.name for t in vpn.technologies or []] + ["none"]:
+            image = image_name(vpn.name, technology)
+            if image is not None:
+                images.add(image)
+    return images
+
+
+class ImageRegistry:
+    """
+    Ready images by name, resolved once instead of before each container.
+
+    Missing images are pulled in the background. Resolved images are
+    served from memory until a Docker image event touches them, or the
+    event stream breaks and nothing can be trusted.
+    """
+
+    _status: Dict[str, ImageStatus]
+    _tasks: Dict[str, asyncio.Task]
+    _watcher: Optional[asyncio.Task]
+
+    def __init__(self):
+        self._status = dict()
+        self._tasks = dict()
+        self._watcher = None
+
+    def status(self) -> List[ImageStatus]:
+        return [ImageStatus(**vars(status)) for status in self._status.values()]
+
+    def prefetch(self, images: Iterable[str]):
+        """Resolve `images` in the background, pulling missing ones."""
+        self._watch()
+        for image in images:
+            self._resolve(image)
+
+    async def ensure(self, image: str) -> Optional[str]:
+        """Id of the ready image, pulled if missing, None if unavailable."""
+        self._watch()
+        status = self._status.get(image)
+        if status is not None and status.state == ImageState.ready:
+            return status.id
+        # Pull continues for other waiters if this one is cancelled
+        return await asyncio.shield(self._resolve(image))
+
+    async def close(self):
+        tasks = list(self._tasks.values())
+        if self._watcher is not None:
+            tasks.append(self._watcher)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks.clear()
+        self._watcher = None
+
+    def _resolve(self, image: str) -> asyncio.Task:
+        task = self._tasks.get(image)
+        if task is None or task.done():
+            task = self._tasks[image] = asyncio.create_task(self._fetch(image))
+        return task
+
+    async def _fetch(self, image: str) -> Optional[str]:
+        status = self._status[image] = ImageStatus(image=image)
+        docker = docker_clients.get()
+        try:
+            try:
+                status.id = (await docker.images.inspect(image))["Id"]
+            except DockerError as e:
+                if e.status != 404:
+                    raise
+                log.info("Pulling image {}".format(image))
+                status.state = ImageState.pulling
+                progress = _Progress(status)
+                async for message in docker.images.pull(image, stream=True):
+                    if "error" in message:
+                        raise DockerError(500, {"message": message["error"]})
+                    progress.update(message)
+                status.id = (await docker.images.inspect(image))["Id"]
+            status.state = ImageState.ready
+        except DockerError as e:
+            log.warning("Image {} is unavailable:\n{}".format(image, e))
+            status.state = ImageState.failed
+            status.id = None
+            status.error = str(e)
+        return status.id
+
+    def _invalidate(self, event: dict):
+        actor = event.get("Actor") or {}
+        names = {actor.get("ID"), (actor.get("Attributes") or {}).get("name")}
+        for image, status in list(self._status.items()):
+            if status.id in names or image in names or image + ":latest" in names:
+                log.info(
+                    "Image {} changed ({}), revalidating".format(image, event.get("Action"))
+                )
+                self._forget(image)
+
+    def _forget(self, image: str):
+        task = self._tasks.get(image)
+        if task is not None and not task.done():
+            return
+        self._status.pop(image, None)
+        self._tasks.pop(image, None)
+
+    def _watch(self):
+        if self._watcher is None or self._watcher.done():
+            self._watcher = asyncio.create_task(self._watch_events())
+
+    async def _watch_events(self):
+        while True:
+            docker = docker_clients.get()
+            subscriber = docker.events.subscribe(
+                filters=json.dumps({"type": ["image"]})
+            )
+            try:
+                while True:
+                    event = await subscriber.get()
+                    if event is None:
+                        break
+                    self._invalidate(event)
+            finally:
+                try:
+                    await docker.events.stop()
+                except Exception as e:
+                    log.debug("Docker events stream failed: %s", e)
+            # Events may have been missed meanwhile
+            for image in list(self._status):
+                self._forget(image)
+            await asyncio.sleep(_EVENTS_RETRY)
+
+
+image_registry = ImageRegistry()
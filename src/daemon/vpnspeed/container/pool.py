@@ -0,0 +1,194 @@
+import asyncio
+from dataclasses import dataclass
+from typing import Any, Dict, List, Tuple
+
+from vpnspeed import log
+from vpnspeed.model import Pool, Probe
+from vpnspeed.constans import DEFAULT_POOL_MAX_USES, DEFAULT_POOL_MAX_AGE
+from .containerenvironment import ContainerEnvironment
+from .images import shared_image
+
+
+_RESOLV_CONF = "/etc/resolv.conf"
+
+# Routing state a tunnel changes, compared before reuse
+_ROUTES = "ip -4 route show table all; ip -4 rule show"
+
+# Key prefix of containers shared by providers of the same image
+_IMAGE_KEY = "image"
+
+
+@dataclass
+class PoolStats:
+    idle: int = 0
+    hits: int = 0
+    misses: int = 0
+    reuses: int = 0
+    recycled: int = 0
+    # Reuses by another provider of the same generic image
+    shared: int = 0
+    hit_rate: float = 0.0
+
+
+@dataclass
+class PooledEnvironment:
+    env: ContainerEnvironment
+    key: Tuple[str, str]
+    probe: Probe
+    resolv_conf: str
+    routes: str
+    created: float
+    uses: int = 1
+    # Owner data kept together with container, e.g. logged in VPN session
+    state: Any = None
+
+
+class ContainerPool:
+    """
+    Keeps started containers between test runs of the same (vpn, technology).
+
+    Containers are leased to a single run at a time. After the run the owner
+    verifies the container is clean and releases it back, containers past
+    `max_uses` or `max_age` seconds are recycled. With `share_images`,
+    providers without an image of their own share containers by image.
+    """
+
+    stats: PoolStats
+    _config: Pool
+    _idle: Dict[Tuple[str, str], List[PooledEnvironment]]
+    _leased: Dict[ContainerEnvironment, PooledEnvironment]
+
+    def __init__(self):
+        self.stats = PoolStats()
+        self._config = Pool(enabled=False)
+        self._idle = dict()
+        self._leased = dict()
+
+    @property
+    def enabled(self) -> bool:
+        return self._config.enabled
+
+    async def configure(self, config: Pool = None):
+        config = config or Pool(enabled=False)
+        if config != self._config:
+            self._config = config
+            await self.clear()
+
+    def owns(self, env: ContainerEnvironment) -> bool:
+        return env in self._leased
+
+    def get(self, env: ContainerEnvironment) -> PooledEnvironment:
+        return self._leased.get(env)
+
+    def key(self, vpn: str, technology: str) -> Tuple[str, str]:
+        """Pool key of containers for runs of `vpn` with `technology`."""
+        if self._config.share_images:
+            image = shared_image(vpn, technology)
+            if image is not None:
+                return (_IMAGE_KEY, image)
+        return (vpn, technology)
+
+    async def acquire(self, key: Tuple[str, str]) -> PooledEnvironment:
+        """Lease idle container for `key`, None if there is none."""
+        idle = self._idle.get(key, [])
+        while idle:
+            pooled = idle.pop()
+            if self._expired(pooled):
+                await self._recycle(pooled)
+                continue
+            pooled.uses += 1
+            self._leased[pooled.env] = pooled
+            self.stats.hits += 1
+            self.stats.reuses += 1
+            self._update_stats()
+            log.debug("Reusing container {} ({} uses)".format(pooled.env.name, pooled.uses))
+            return pooled
+        self.stats.misses += 1
+        self._update_stats()
+        return None
+
+    async def lease(
+        self,
+        key: Tuple[str, str],
+        env: ContainerEnvironment,
+        probe: Probe,
+        state: Any = None,
+    ) -> PooledEnvironment:
+        """Track freshly started container, so it can be released to the pool."""
+        resolv_conf = await env.read_file(_RESOLV_CONF)
+        pooled = PooledEnvironment(
+            env=env,
+            key=key,
+            probe=probe,
+            resolv_conf=resolv_conf,
+            routes=await _routes(env),
+            created=asyncio.get_event_loop().time(),
+            state=state,
+        )
+        self._leased[env] = pooled
+        return pooled
+
+    async def reset(self, env: ContainerEnvironment):
+        """Restore container settings changed by VPN connection."""
+        pooled = self._leased[env]
+        # Some apps lock resolv.conf while connected
+        await env.exec("/usr/bin/chattr", ["-i", _RESOLV_CONF], allow_error=True)
+        if pooled.resolv_conf is not None:
+            await env.write_file(_RESOLV_CONF, pooled.resolv_conf)
+
+    async def verify(self, env: ContainerEnvironment) -> str:
+        """What differs from the container when it was leased, None if clean."""
+        pooled = self._leased[env]
+        if await _routes(env) != pooled.routes:
+            return "Routing table differs after disconnect"
+        if (await env.read_file(_RESOLV_CONF)) != pooled.resolv_conf:
+            return "{} differs after disconnect".format(_RESOLV_CONF)
+        return None
+
+    def shared_reuse(self):
+        self.stats.shared += 1
+
+    async def release(self, env: ContainerEnvironment, state: Any = None):
+        pooled = self._leased.pop(env)
+        pooled.state = state
+        if not self.enabled or self._expired(pooled):
+            await self._recycle(pooled)
+            return
+        self._idle.setdefault(pooled.key, []).append(pooled)
+        self._update_stats()
+
+    async def dispose(self, env: ContainerEnvironment):
+        """Stop container without returning it to the pool."""
+        self._leased.pop(env, None)
+        await env.stop()
+
+    async def clear(self):
+        idle, self._idle = self._idle, dict()
+        for pooled in (pooled for entries in idle.values() for pooled in entries):
+            await self._recycle(pooled)
+        self._update_stats()
+
+    def _expired(self, pooled: PooledEnvironment) -> bool:
+        max_uses = self._config.max_uses or DEFAULT_POOL_MAX_USES
+        max_age = self._config.max_age or DEFAULT_POOL_MAX_AGE
+        age = asyncio.get_event_loop().time() - pooled.created
+        return pooled.uses >= max_uses or age >= max_age
+
+    async def _recycle(self, pooled: PooledEnvironment):
+        log.debug("Recycling container {}".format(pooled.env.name))
+        self.stats.recycled += 1
+        try:
+            await pooled.env.stop()
+        except Exception as e:
+            log.warning("Failed to stop pooled container:\n%s", e)
+        self._update_stats()
+
+    def _update_stats(self):
+        self.stats.idle = sum(len(entries) for entries in self._idle.values())
+        requests = self.stats.hits + self.stats.misses
+        self.stats.hit_rate = requests and round(self.stats.hits / requests, 3) or 0.0
+
+
+async def _routes(env: ContainerEnvironment) -> str:
+    _, stdout = await env.exec("bash", ["-c", _ROUTES], output=True)
+    return (stdout or "").strip()
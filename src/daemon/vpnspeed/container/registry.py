@@ -0,0 +1,215 @@
+import asyncio
+import json
+import os
+import time
+import uuid
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from aiodocker.exceptions import DockerError
+
+from vpnspeed import log
+from vpnspeed.constans import DEFAULT_REAPER_INTERVAL, DEFAULT_REAPER_GRACE
+from .client import docker_clients
+
+
+DEFAULT_CONTAINERS_PATH = "/var/run/vpnspeed/containers.json"
+
+# Labels of every test container
+INSTANCE_LABEL = "vpnspeed.instance"
+RUN_LABEL = "vpnspeed.run"
+
+
+@dataclass
+class TrackedContainer:
+    id: str
+    name: str
+    run: str
+    # Wall clock seconds, kept across restarts in the state file
+    created: float
+    age: float = None
+
+
+@dataclass
+class RegistryStats:
+    instance: str = None
+    running: int = 0
+    oldest_age: float = 0.0
+    reaped: int = 0
+    last_reap: float = None
+    containers: List[TrackedContainer] = field(default_factory=list)
+
+
+class ContainerRegistry:
+    """
+    Test containers of this daemon instance.
+
+    Containers are labeled with the daemon instance id and a run id and
+    written to a state file, so containers left behind by a killed daemon
+    are found on the next start and removed. Periodic reaping also removes
+    containers of this instance which are no longer tracked, e.g. after a
+    failed delete. Containers of other live daemons on the host are left
+    alone, only the instance of the state file is taken over.
+    """
+
+    instance: str
+    _containers: Dict[str, TrackedContainer]
+    _pending: Dict[str, float]
+    _task: Optional[asyncio.Task]
+
+    def __init__(self, path: str = None):
+        self.instance = uuid.uuid4().hex[:12]
+        self._path = path
+        self._containers = dict()
+        self._pending = dict()
+        self._task = None
+        self._previous = None
+        self._reaped = 0
+        self._last_reap = None
+
+    async def start(
+        self,
+        path: str = DEFAULT_CONTAINERS_PATH,
+        interval: float = DEFAULT_REAPER_INTERVAL,
+    ):
+        """Reap containers of previous instances, then keep reaping."""
+        self._path = path
+        self._previous, known = self._load()
+        try:
+            await self.reap(self._previous, known)
+        except Exception as e:
+            log.warning("Container reaping failed:\n%s", e)
+        self._save()
+        if self._task is None:
+            self._task = asyncio.create_task(self._reap_periodically(interval))
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def labels(self, run: str) -> Dict[str, str]:
+        return {INSTANCE_LABEL: self.instance, RUN_LABEL: run}
+
+    def new_run(self) -> str:
+        """Run id of a container about to be created."""
+        run = uuid.uuid4().hex[:12]
+        self._pending[run] = time.time()
+        return run
+
+    def track(self, container_id: str, name: str, run: str):
+        self._pending.pop(run, None)
+        self._containers[container_id] = TrackedContainer(
+            id=container_id, name=name, run=run, created=time.time()
+        )
+        self._save()
+
+    def untrack(self, container_id: str, run: str = None):
+        self._pending.pop(run, None)
+        if self._containers.pop(container_id, None) is not None:
+            self._save()
+
+    def stats(self) -> RegistryStats:
+        now = time.time()
+        containers = [
+            TrackedContainer(**{**asdict(c), "age": round(now - c.created, 1)})
+            for c in self._containers.values()
+        ]
+        return RegistryStats(
+            instance=self.instance,
+            running=len(containers),
+            oldest_age=max((c.age for c in containers), default=0.0),
+            reaped=self._reaped,
+            last_reap=self._last_reap,
+            containers=containers,
+        )
+
+    async def reap(self, previous: str = None, known: List[str] = ()) -> int:
+        """
+        Remove containers of the `previous` instance, incl. `known` ids, and
+        ones of this instance which are not tracked, returns the count.
+        """
+        docker = docker_clients.get()
+        orphans = set(known) - set(self._containers)
+        try:
+            labeled = await docker.containers.list(
+                all=True, filters=json.dumps({"label": [INSTANCE_LABEL]})
+            )
+        except DockerError as e:
+            log.warning("Failed to list test containers:\n{}".format(e))
+            labeled = []
+        now = time.time()
+        for container in labeled:
+            labels = container["Labels"] or {}
+            instance = labels.get(INSTANCE_LABEL)
+            if container.id in self._containers:
+                continue
+            if instance == self.instance:
+                # Created, but not tracked yet
+                if labels.get(RUN_LABEL) in self._pending:
+                    continue
+                if now - (container["Created"] or now) < DEFAULT_REAPER_GRACE:
+                    continue
+            elif previous is None or instance != previous:
+                continue
+            orphans.add(container.id)
+
+        reaped = 0
+        for container_id in orphans:
+            try:
+                await docker.containers.container(container_id).delete(force=True)
+                reaped += 1
+            except DockerError as e:
+                if e.status != 404:
+                    log.warning(
+                        "Failed to remove orphan container {}:\n{}".format(
+                            container_id[:12], e
+                        )
+                    )
+        if reaped:
+            log.info("Removed {} orphan container(s)".format(reaped))
+        self._reaped += reaped
+        self._last_reap = now
+        return reaped
+
+    async def _reap_periodically(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                # Previous instance too, its containers may have failed to stop
+                await self.reap(self._previous)
+            except Exception as e:
+                log.warning("Container reaping failed:\n%s", e)
+
+    def _load(self) -> Tuple[Optional[str], List[str]]:
+        """Instance and container ids in the state file, left by a previous run."""
+        if self._path is None:
+            return None, []
+        try:
+            with open(self._path) as f:
+                data = json.load(f)
+            return data.get("instance"), [c["id"] for c in data.get("containers", [])]
+        except FileNotFoundError:
+            return None, []
+        except Exception as e:
+            log.warning("Failed to load container state:\n%s", e)
+            return None, []
+
+    def _save(self):
+        if self._path is None:
+            return
+        data = {
+            "instance": self.instance,
+            "containers": [asdict(c) for c in self._containers.values()],
+        }
+        try:
+            temp = self._path + ".tmp"
+            with open(temp, "w") as f:
+                json.dump(data, f)
+            os.replace(temp, self._path)
+        except OSError as e:
+            log.warning("Failed to save container state:\n%s", e)
+
+
+container_registry = ContainerRegistry()
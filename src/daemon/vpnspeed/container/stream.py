@@ -0,0 +1,223 @@
+import asyncio
+import json
+from collections import deque
+from typing import Any, AsyncIterable, AsyncIterator, Deque, Dict, List, NamedTuple
+
+from aiodocker.docker import DockerContainer
+from aiodocker.exceptions import DockerError
+
+from vpnspeed import log
+from vpnspeed.constans import DEFAULT_EXEC_MAX_LINE, DEFAULT_JSON_MAX_SIZE
+
+
+# Stream numbers as in Docker exec messages
+STDOUT = 1
+STDERR = 2
+
+# Characters a JSON value may start with after an opening bracket, tells
+# JSON arrays from bracketed text like "[error] ..."
+_ARRAY_ITEM_START = set('{["-0123456789tfn]')
+
+# Last stderr lines kept for error messages
+_STDERR_TAIL = 20
+
+
+class ExecOutput(NamedTuple):
+    stream: int
+    line: str
+
+
+class LineDecoder:
+    """Splits streamed bytes into lines, longer lines are cut at `max_line`."""
+
+    def __init__(self, max_line: int = DEFAULT_EXEC_MAX_LINE):
+        self._max_line = max_line
+        self._buffer = b""
+
+    def feed(self, data: bytes) -> List[str]:
+        *lines, self._buffer = (self._buffer + data).split(b"\n")
+        while len(self._buffer) > self._max_line:
+            lines.append(self._buffer[: self._max_line])
+            self._buffer = self._buffer[self._max_line :]
+        return [_decode(line) for line in lines]
+
+    def flush(self) -> List[str]:
+        buffer, self._buffer = self._buffer, b""
+        return [_decode(buffer)] if buffer else []
+
+
+class JSONStreamDecoder:
+    """
+    Decodes JSON objects and arrays from streamed text as they complete.
+
+    Values may be split across chunks, spread over lines or several on a
+    line, text between them is skipped. Only the value being read is kept,
+    one larger than `max_size` characters is dropped.
+    """
+
+    def __init__(self, max_size: int = DEFAULT_JSON_MAX_SIZE):
+        self._max_size = max_size
+        self._reset()
+
+    def feed(self, text: str) -> List[Any]:
+        values = []
+        start = 0 if self._depth else None
+        for i, c in enumerate(text):
+            if self._depth == 0:
+                if c in "{[":
+                    self._depth = 1
+                    self._array = c == "["
+                    start = i
+                continue
+            if self._string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._string = False
+                continue
+            if self._array:
+                if c.isspace():
+                    continue
+                self._array = False
+                if c not in _ARRAY_ITEM_START:
+                    self._reset()
+                    start = None
+                    continue
+            if c == '"':
+                self._string = True
+            elif c in "{[":
+                self._depth += 1
+            elif c in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._parts.append(text[start : i + 1])
+                    value = "".join(self._parts)
+                    self._reset()
+                    start = None
+                    try:
+                        values.append(json.loads(value))
+                    except ValueError as e:
+                        log.debug("Skipping invalid JSON in output: %s", e)
+        if start is not None:
+            self._parts.append(text[start:])
+            self._size += len(text) - start
+            if self._size > self._max_size:
+                log.warning(
+                    "Skipping JSON value larger than {} characters".format(
+                        self._max_size
+                    )
+                )
+                self._reset()
+        return values
+
+    def _reset(self):
+        self._parts: List[str] = []
+        self._size = 0
+        self._depth = 0
+        self._string = False
+        self._escape = False
+        self._array = False
+
+
+class ExecStream:
+    """
+    Output lines of a command run with Docker exec, as they are written.
+
+    Iterate within `async with`, which stops the command output stream if
+    the iteration ends early. Once iterated to the end `returncode` is set,
+    -1 if the command could not be run. Iteration raises
+    `asyncio.TimeoutError` when the command runs longer than `timeout`.
+    """
+
+    returncode: int = None
+    stderr: Deque[str]
+
+    def __init__(
+        self,
+        container: DockerContainer,
+        cmd: List[str],
+        user: str = "root",
+        timeout: float = 600,
+    ):
+        self._container = container
+        self._cmd = cmd
+        self._user = user
+        self._timeout = timeout
+        self._lines: AsyncIterator[ExecOutput] = None
+        self.stderr = deque(maxlen=_STDERR_TAIL)
+
+    def __aiter__(self) -> AsyncIterator[ExecOutput]:
+        if self._lines is None:
+            self._lines = self._read()
+        return self._lines
+
+    async def __aenter__(self) -> "ExecStream":
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def close(self):
+        if self._lines is not None:
+            await self._lines.aclose()
+
+    async def _read(self) -> AsyncIterator[ExecOutput]:
+        log.debug("stream exec cmd:\n {}".format(self._cmd))
+        try:
+            execute_cmd = await self._container.exec(
+                self._cmd,
+                stderr=True,
+                stdout=True,
+                stdin=False,
+                tty=False,
+                privileged=True,
+                user=self._user,
+            )
+        except DockerError as e:
+            log.warning("Failed to exec {}:\n{}".format(self._cmd, e))
+            self.returncode = -1
+            return
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + self._timeout
+        decoders: Dict[int, LineDecoder] = {STDOUT: LineDecoder(), STDERR: LineDecoder()}
+        result_stream = execute_cmd.start()
+        try:
+            while True:
+                message = await asyncio.wait_for(
+                    result_stream.read_out(), max(deadline - loop.time(), 0)
+                )
+                if message is None:
+                    break
+                for line in decoders[message.stream].feed(message.data):
+                    yield self._output(message.stream, line)
+            for stream, decoder in decoders.items():
+                for line in decoder.flush():
+                    yield self._output(stream, line)
+        finally:
+            await result_stream.close()
+        self.returncode = (await execute_cmd.inspect()).get("ExitCode")
+        if self.returncode is None:
+            self.returncode = -1
+
+    def _output(self, stream: int, line: str) -> ExecOutput:
+        if stream == STDERR:
+            log.debug("exec stderr: {}".format(line))
+            self.stderr.append(line)
+        return ExecOutput(stream, line)
+
+
+async def json_values(
+    lines: AsyncIterable[ExecOutput], max_size: int = DEFAULT_JSON_MAX_SIZE
+) -> AsyncIterator[Any]:
+    """JSON values of stdout, line delimited or spread over lines."""
+    decoder = JSONStreamDecoder(max_size)
+    async for output in lines:
+        if output.stream == STDOUT:
+            for value in decoder.feed(output.line + "\n"):
+                yield value
+
+
+def _decode(line: bytes) -> str:
+    return line.decode(errors="replace").rstrip("\r")
@@ -6,7 +6,8 @@ from os import makedirs, path
 from vpnspeed.api import ApiServer
 from vpnspeed.service import Service, Context
 from vpnspeed.datasink import DynamicDataSink
-from vpnspeed.tester import SpeedTestCliTester
+from vpnspeed.tester import DynamicTester
+from vpnspeed.geoip import DEFAULT_GEOIP_PATH, geo_resolver
 from logging.handlers import RotatingFileHandler
 
 
@@ -35,11 +36,17 @@ async def _main():
     parser.add_argument("--tlscacert", default="/etc/vpnspeed/certs/ca.pem")
     parser.add_argument("--tlscert", default="/etc/vpnspeed/certs/server-cert.pem")
     parser.add_argument("--tlskey", default="/etc/vpnspeed/certs/server-key.pem")
+    parser.add_argument(
+        "--geoip-db",
+        default=DEFAULT_GEOIP_PATH,
+        help="GeoLite2 City or Country database, online lookup is used without it",
+    )
 
-    server = ApiServer(Service(SpeedTestCliTester()))
+    server = ApiServer(Service(DynamicTester()))
 
     args = parser.parse_args()
     _init_logger(args)
+    geo_resolver.open(args.geoip_db)
     await server.listen(args.path, args=args)
 
 
@@ -1,5 +1,6 @@
 import aiosqlite
 import dataclasses
+import json
 import pandas as pd
 import numpy as np
 from datetime import date, datetime
@@ -54,6 +55,15 @@ class CSV(DataBackup):
         except FileExistsError:
             pass
 
+    def _migrate(self):
+        """Rewrite files created before new fields were added."""
+        header = pd.read_csv(self._path, nrows=0).columns
+        if set(_COLUMNS).issubset(header):
+            return
+        log.info("Adding missing columns to {}".format(self._path))
+        df = pd.read_csv(self._path, keep_default_na=False)
+        df.reindex(columns=_COLUMNS, fill_value="").to_csv(self._path, index=False)
+
     async def stop(self):
         pass
 
@@ -61,6 +71,11 @@ class CSV(DataBackup):
         def prefixed(prefix, obj) -> dict:
             return {f"{prefix}_{k}": v for k, v in obj.__dict__.items()}
 
+        if run.phases is not None:
+            # Single cell, decoded again on retrieve
+            phases = [dataclasses.asdict(phase) for phase in run.phases]
+            run = dataclasses.replace(run, phases=json.dumps(phases))
+
         df = pd.concat(
             [
                 self._base,
@@ -79,6 +94,7 @@ class CSV(DataBackup):
 
         df = df.applymap(lambda x: x.isoformat() if isinstance(x, datetime) else x)
 
+        self._migrate()
         df.to_csv(self._path, mode="a", header=False, index=False)
 
     async def retrieve(
@@ -99,7 +115,11 @@ class CSV(DataBackup):
             df = df[df["date"] <= end]
         del df["date"]
 
-        return [clean_dict(d) for d in df.to_dict(orient="records")]
+        rows = [clean_dict(d) for d in df.to_dict(orient="records")]
+        for row in rows:
+            if "run_phases" in row:
+                row["run_phases"] = json.loads(row["run_phases"])
+        return rows
 
     async def retrieve_groups(self) -> Set[TestGroup]:
         df: pd.DataFrame = pd.read_csv(self._path, keep_default_na=False)
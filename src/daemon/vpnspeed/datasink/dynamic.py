@@ -2,7 +2,7 @@ import asyncio
 
 from typing import List, Tuple, Dict, Set
 from .interfaces import DataSink, DataBackup
-from vpnspeed.model import Probe, TestGroup, TestCase, TestRun
+from vpnspeed.model import Probe, TestGroup, TestCase, TestRun, ServerCheck
 from vpnspeed import log
 
 
@@ -92,3 +92,9 @@ class DynamicDataBackup(DynamicDataSink, DataBackup):
 
     async def retrieve_groups(self) -> Set[TestGroup]:
         return await self._plugin.retrieve_groups()
+
+    async def retrieve_server_checks(self) -> List[ServerCheck]:
+        return await self._plugin.retrieve_server_checks()
+
+    async def save_server_check(self, check: ServerCheck):
+        await self._plugin.save_server_check(check)
@@ -1,7 +1,7 @@
 from abc import ABC, abstractmethod, abstractclassmethod
 from typing import List, Tuple, Set
 from datetime import date
-from vpnspeed.model import Probe, TestGroup, TestCase, TestRun
+from vpnspeed.model import Probe, TestGroup, TestCase, TestRun, ServerCheck
 
 
 class DataSink(ABC):
@@ -32,3 +32,10 @@ class DataBackup(DataSink):
     @abstractmethod
     async def retrieve_groups(self) -> Set[TestGroup]:
         raise NotImplementedError()
+
+    async def retrieve_server_checks(self) -> List[ServerCheck]:
+        """Latest check of every speedtest server, if the backup keeps them."""
+        return []
+
+    async def save_server_check(self, check: ServerCheck):
+        pass
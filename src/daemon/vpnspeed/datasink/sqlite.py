@@ -2,13 +2,17 @@ import aiosqlite
 import dataclasses
 from datetime import date, datetime
 from pathlib import Path
-from typing import Tuple, Set
+from typing import Dict, Tuple, Set
 from vpnspeed.model import *
 from vpnspeed.utils import clean_dict
 from .dynamic import dynamic_backup
 from .interfaces import DataBackup
 
 
+# Run fields kept in a table of their own, a row per item
+_RUN_CHILDREN = {"phases": ("test_run_phase", Phase)}
+
+
 @dynamic_backup
 class SQLite(DataBackup):
 
@@ -22,7 +26,11 @@ class SQLite(DataBackup):
 
     @staticmethod
     def _fields(cls: type) -> List[str]:
-        return [field.name for field in dataclasses.fields(cls)]
+        return [
+            field.name
+            for field in dataclasses.fields(cls)
+            if cls is not TestRun or field.name not in _RUN_CHILDREN
+        ]
 
     async def _create_table(
         self, table_name: str, from_obj: type, foreign_table: str, unique: bool
@@ -45,6 +53,20 @@ class SQLite(DataBackup):
         )
         cursor = await self._db.execute(sql_create_table)
         await cursor.close()
+        await self._add_missing_columns(table_name, from_obj)
+
+    async def _add_missing_columns(self, table_name: str, from_obj: type):
+        """Migrate tables created before new fields were added."""
+        rows = await self._db.execute_fetchall(
+            "PRAGMA table_info({})".format(table_name)
+        )
+        existing = {row["name"] for row in rows}
+        for field in self._fields(from_obj):
+            if field not in existing:
+                cursor = await self._db.execute(
+                    "ALTER TABLE {} ADD COLUMN {}".format(table_name, field)
+                )
+                await cursor.close()
 
     async def start(self, url: str, params: dict):
         if not url or url != ":memory:" and not Path(url).is_absolute():
@@ -60,6 +82,14 @@ class SQLite(DataBackup):
         await self._create_table("test_group", TestGroup, "probe", True)
         await self._create_table("test_case", TestCase, "test_group", True)
         await self._create_table("test_run", TestRun, "test_case", False)
+        for table, child in _RUN_CHILDREN.values():
+            await self._create_table(table, child, "test_run", False)
+        # Latest check by server
+        cursor = await self._db.execute(
+            "CREATE TABLE IF NOT EXISTS speedtest_server_check"
+            "(host, port, valid, checked, UNIQUE(host, port))"
+        )
+        await cursor.close()
 
     async def stop(self):
         await self._db.close()
@@ -75,8 +105,10 @@ class SQLite(DataBackup):
             filters.append(f)
         return " AND ".join(filters).replace("None", "''")
 
-    async def _insert_row(self, table_name: str, obj, additional_fields: dict) -> int:
-        obj_fields = obj.__dict__
+    async def _insert_row(
+        self, table_name: str, obj, additional_fields: dict, unique: bool = True
+    ) -> int:
+        obj_fields = {k: getattr(obj, k) for k in self._fields(type(obj))}
         types = {field.name: field.type for field in dataclasses.fields(obj)}
 
         def adapt(k, v):
@@ -84,7 +116,7 @@ class SQLite(DataBackup):
 
             if isinstance(v, (datetime, date)):
                 return v.isoformat()
-            if v is None:  # Map None to default value for propper uniqueness
+            if v is None and unique:  # Map None to default value for propper uniqueness
                 if issubclass(t, (int, float)):
                     return 0
                 return ""
@@ -115,7 +147,15 @@ class SQLite(DataBackup):
         probe_id = await self._insert_row("probe", probe, {})
         group_id = await self._insert_row("test_group", group, {"probe_id": probe_id})
         case_id = await self._insert_row("test_case", case, {"test_group_id": group_id})
-        await self._insert_row("test_run", run, {"test_case_id": case_id})
+        # Runs are not unique, keep unknown metrics (e.g. connect_time) empty
+        run_id = await self._insert_row(
+            "test_run", run, {"test_case_id": case_id}, unique=False
+        )
+        for name, (table, _) in _RUN_CHILDREN.items():
+            for item in getattr(run, name) or ():
+                await self._insert_row(
+                    table, item, {"test_run_id": run_id}, unique=False
+                )
         await self._db.commit()
 
     async def retrieve(
@@ -138,8 +178,10 @@ class SQLite(DataBackup):
             + ", ".join(
                 f'r.{field} as "run_{field}"' for field in self._fields(TestRun)
             )
-            + " "
-            + "FROM probe AS p "
+            + ', r.rowid as "run_rowid" '
+        )
+        sql_from = (
+            "FROM probe AS p "
             + "JOIN test_group AS g ON g.probe_id = p.rowid "
             + "JOIN test_case  AS c ON c.test_group_id = g.rowid "
             + "JOIN test_run   AS r ON r.test_case_id = c.rowid "
@@ -157,9 +199,35 @@ class SQLite(DataBackup):
         if end:
             where.append(f'date(r.timestamp) <= date("{end.isoformat()}")')
         if len(where) > 0:
-            sql_select += "WHERE " + " AND ".join(where)
+            sql_from += "WHERE " + " AND ".join(where)
 
-        return self._filter_rows(await self._db.execute_fetchall(sql_select))
+        rows = await self._db.execute_fetchall(sql_select + sql_from)
+        rows = self._filter_rows(rows)
+        children = await self._retrieve_children(sql_from)
+        for row in rows:
+            run_id = row.pop("run_rowid")
+            for name in _RUN_CHILDREN:
+                items = children[name].get(run_id)
+                if items:
+                    row["run_" + name] = items
+        return rows
+
+    async def _retrieve_children(self, sql_from: str) -> Dict[str, Dict[int, list]]:
+        """Child rows by name and run of runs matching the retrieve query."""
+        children = dict()
+        for name, (table, child) in _RUN_CHILDREN.items():
+            fields = self._fields(child)
+            sql_select = (
+                "SELECT test_run_id, {} FROM {} ".format(", ".join(fields), table)
+                + "WHERE test_run_id IN (SELECT r.rowid {}) ".format(sql_from)
+                + "ORDER BY rowid"
+            )
+            by_run = children[name] = dict()
+            for row in await self._db.execute_fetchall(sql_select):
+                by_run.setdefault(row["test_run_id"], []).append(
+                    {field: row[field] for field in fields}
+                )
+        return children
 
     async def retrieve_groups(self) -> Set[TestGroup]:
         sql_select = (
@@ -169,5 +237,28 @@ class SQLite(DataBackup):
 
         return {TestGroup(**group) for group in groups}
 
+    async def retrieve_server_checks(self) -> List[ServerCheck]:
+        rows = await self._db.execute_fetchall(
+            "SELECT host, port, valid, checked FROM speedtest_server_check"
+        )
+        return [
+            ServerCheck(
+                host=row["host"],
+                port=row["port"],
+                valid=bool(row["valid"]),
+                checked=datetime.fromisoformat(row["checked"]),
+            )
+            for row in rows
+        ]
+
+    async def save_server_check(self, check: ServerCheck):
+        cursor = await self._db.execute(
+            "INSERT OR REPLACE INTO speedtest_server_check"
+            "(host, port, valid, checked) VALUES(?, ?, ?, ?)",
+            [check.host, check.port, int(check.valid), check.checked.isoformat()],
+        )
+        await cursor.close()
+        await self._db.commit()
+
     def _filter_rows(self, rows):
         return [clean_dict(dict(row)) for row in rows]
@@ -0,0 +1,252 @@
+import asyncio
+import ipaddress
+from dataclasses import dataclass, replace
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+import aiohttp
+
+from vpnspeed import log
+from vpnspeed.constans import DEFAULT_EGRESS_HEDGE_DELAY
+from vpnspeed.container import ContainerEnvironment
+from vpnspeed.container.stream import STDOUT
+
+
+# Plain text egress IP echo endpoints, asked in this order until answer
+# times are known
+DEFAULT_IP_ECHO = [
+    "https://api.ipify.org",
+    "https://icanhazip.com",
+    "https://ifconfig.me/ip",
+    "https://checkip.amazonaws.com",
+]
+
+# Weight of the newest answer time in endpoint latency
+_LATENCY_WEIGHT = 0.3
+# Consecutive failures beyond which endpoints are ordered alike
+_UNHEALTHY = 3
+# Shortest hedge delay in seconds
+_MIN_HEDGE_DELAY = 0.1
+
+# Ask endpoints `$3...` one by one, `$1` seconds apart, each answer is
+# printed as "<url> <curl exit code> <body> <seconds>" once it arrives
+_DETECT = """
+delay=$1; max=$2; shift 2
+for url in "$@"; do
+    (
+        out=$(curl -s --fail -m "$max" -w ' %{time_total}' "$url")
+        rc=$?
+        printf '%s %s %s\\n' "$url" "$rc" "$(printf '%s' "$out" | head -c 256 | tr -s '[:space:]' ' ')"
+    ) &
+    sleep "$delay"
+done
+wait
+"""
+
+# Answer of single endpoint: url, egress IP or None, seconds
+Answer = Tuple[str, Optional[str], Optional[float]]
+
+
+def egress_ip(text: str) -> Optional[str]:
+    """IP address in IP echo response, None if it is not one."""
+    try:
+        return str(ipaddress.ip_address((text or "").strip()))
+    except ValueError:
+        return None
+
+
+@dataclass
+class EchoStats:
+    url: str
+    requests: int = 0
+    failures: int = 0
+    # Failures since the last answer, failing endpoints are asked later
+    consecutive_failures: int = 0
+    # Weighted moving average of answer times in seconds
+    latency: float = None
+
+
+class EgressDetector:
+    """
+    Egress IP detection with hedged requests to several echo endpoints.
+
+    The fastest healthy endpoint is asked first, the next one only if no
+    answer arrived within the hedge delay, and so on. The first IP answered
+    by `agree` endpoints wins, requests still pending are abandoned. Answer
+    times and failures of every endpoint decide the order of the next
+    detection.
+    """
+
+    _stats: Dict[str, EchoStats]
+
+    def __init__(self, urls: List[str] = None, agree: int = 1):
+        self._agree = agree
+        self._stats = dict()
+        self.set_endpoints(urls or DEFAULT_IP_ECHO)
+
+    def set_endpoints(self, urls: List[str]):
+        """Use `urls`, stats of endpoints used before are kept."""
+        self._stats = {
+            url: self._stats.get(url) or EchoStats(url)
+            for url in (urls or DEFAULT_IP_ECHO)
+        }
+
+    def endpoints(self) -> List[str]:
+        """Endpoints in the order they are asked."""
+        return [
+            stats.url
+            for stats in sorted(
+                self._stats.values(),
+                key=lambda s: (
+                    min(s.consecutive_failures, _UNHEALTHY),
+                    s.latency or 0,
+                ),
+            )
+        ]
+
+    def hedge_delay(self) -> float:
+        """Seconds to wait for an answer before the next endpoint is asked."""
+        latency = self._stats[self.endpoints()[0]].latency
+        if latency is None:
+            return DEFAULT_EGRESS_HEDGE_DELAY
+        return min(max(2 * latency, _MIN_HEDGE_DELAY), DEFAULT_EGRESS_HEDGE_DELAY)
+
+    def stats(self) -> List[EchoStats]:
+        return [replace(self._stats[url]) for url in self.endpoints()]
+
+    def record(self, url: str, latency: float = None):
+        """Answer time of `url`, None if it failed to answer."""
+        stats = self._stats.get(url)
+        if stats is None:
+            return
+        stats.requests += 1
+        if latency is None:
+            stats.failures += 1
+            stats.consecutive_failures += 1
+            return
+        stats.consecutive_failures = 0
+        stats.latency = round(
+            latency
+            if stats.latency is None
+            else _LATENCY_WEIGHT * latency + (1 - _LATENCY_WEIGHT) * stats.latency,
+            4,
+        )
+
+    def record_abandoned(self, url: str, elapsed: float):
+        """
+        Request to `url` was abandoned after `elapsed` seconds, its answer
+        time is at least that. Health counters are left as they are, it did
+        neither answer nor fail.
+        """
+        stats = self._stats.get(url)
+        if stats is None:
+            return
+        stats.latency = round(max(stats.latency or 0, elapsed), 4)
+
+    async def detect(
+        self, env: ContainerEnvironment, timeout: float = 10
+    ) -> Optional[str]:
+        """Egress IP of `env`, None if no endpoint answered in `timeout`."""
+        urls = self.endpoints()
+        delay = self.hedge_delay()
+        async with env.stream_exec(
+            "bash",
+            ["-c", _DETECT, "egress", str(delay), str(timeout), *urls],
+            timeout=timeout + delay * len(urls) + 5,
+        ) as stream:
+            try:
+                return await self._first(
+                    _container_answers(stream), _schedule(urls, delay)
+                )
+            except asyncio.TimeoutError:
+                log.warning("Egress detection timed out")
+                return None
+
+    async def detect_host(self, timeout: float = 10) -> Optional[str]:
+        """Egress IP of the host, None if no endpoint answered in `timeout`."""
+        urls = self.endpoints()
+        delay = self.hedge_delay()
+        async with aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(total=timeout)
+        ) as session:
+            tasks = [
+                asyncio.create_task(_host_answer(session, url, i * delay))
+                for i, url in enumerate(urls)
+            ]
+            try:
+                return await self._first(_completed(tasks), _schedule(urls, delay))
+            finally:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _first(
+        self, answers: AsyncIterator[Answer], schedule: Dict[str, float]
+    ) -> Optional[str]:
+        """
+        IP of the first `agree` equal `answers`, `schedule` has loop times
+        requests start at.
+        """
+        votes: Dict[str, int] = dict()
+        async for url, ip, latency in answers:
+            schedule.pop(url, None)
+            self.record(url, latency if ip else None)
+            if ip is None:
+                log.debug("No egress IP from {}".format(url))
+                continue
+            votes[ip] = votes.get(ip, 0) + 1
+            if votes[ip] >= self._agree:
+                log.debug("Egress {} from {} in {}s".format(ip, url, latency))
+                # Abandoned requests took at least this long
+                now = asyncio.get_event_loop().time()
+                for pending, started in schedule.items():
+                    if started < now:
+                        self.record_abandoned(pending, now - started)
+                return ip
+        if len(votes) > 1:
+            log.warning("Egress IP endpoints disagree: {}".format(votes))
+        return None
+
+
+def _schedule(urls: List[str], delay: float) -> Dict[str, float]:
+    now = asyncio.get_event_loop().time()
+    return {url: now + i * delay for i, url in enumerate(urls)}
+
+
+async def _container_answers(stream) -> AsyncIterator[Answer]:
+    async for output in stream:
+        if output.stream != STDOUT:
+            continue
+        url, rc, *rest = output.line.split(" ") + [""]
+        rest = [part for part in rest if part]
+        if not rest:
+            continue
+        try:
+            latency = float(rest[-1])
+        except ValueError:
+            latency = None
+        ip = egress_ip(" ".join(rest[:-1])) if rc == "0" else None
+        yield url, ip, latency
+
+
+async def _host_answer(
+    session: aiohttp.ClientSession, url: str, delay: float
+) -> Answer:
+    await asyncio.sleep(delay)
+    loop = asyncio.get_event_loop()
+    started = loop.time()
+    try:
+        async with session.get(url) as response:
+            response.raise_for_status()
+            ip = egress_ip((await response.text())[:256])
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        log.debug("Egress IP request to {} failed: {}".format(url, e))
+        ip = None
+    return url, ip, round(loop.time() - started, 4)
+
+
+async def _completed(tasks: List[asyncio.Task]) -> AsyncIterator[Answer]:
+    for task in asyncio.as_completed(tasks):
+        yield await task
+
+
+egress_detector = EgressDetector()
@@ -0,0 +1,304 @@
+import asyncio
+import ipaddress
+import mmap
+import os
+import struct
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, List, Optional, Tuple
+
+import aiohttp
+
+from vpnspeed import log
+from vpnspeed.constans import DEFAULT_GEOIP_CACHE_SIZE, DEFAULT_GEOIP_TTL
+
+
+DEFAULT_GEOIP_PATH = "/var/lib/vpnspeed/GeoLite2-City.mmdb"
+GEO_IP_CHECKER = "https://ipapi.co/{}/json/"
+
+# Metadata section of a MaxMind DB starts after the last marker
+_METADATA_MARKER = b"\xab\xcd\xefMaxMind.com"
+# Zero bytes between search tree and data section
+_SEPARATOR = 16
+# Added to pointer values by pointer size
+_POINTER_BASE = (0, 2048, 526336, 0)
+# Added to extended payload sizes by count of size bytes
+_SIZE_BASE = {1: 29, 2: 285, 3: 65821}
+
+
+@dataclass(frozen=True)
+class GeoLocation:
+    ip: str
+    country_code: str = None
+    country: str = None
+    city: str = None
+    latitude: float = None
+    longitude: float = None
+    provider: str = None
+
+
+class MMDBReader:
+    """
+    Lookup of records by IP address in a MaxMind DB file, e.g. GeoLite2.
+
+    The file is memory mapped, a lookup walks one search tree node per
+    address bit and decodes only the matched record.
+    """
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        start = self._buffer.rfind(_METADATA_MARKER)
+        if start < 0:
+            self._buffer.close()
+            raise ValueError("{} is not a MaxMind DB file".format(path))
+        start += len(_METADATA_MARKER)
+        self.metadata, _ = self._decode(start, start)
+        self._node_count = self.metadata["node_count"]
+        self._record_size = self.metadata["record_size"]
+        if self._record_size not in (24, 28, 32):
+            self._buffer.close()
+            raise ValueError(
+                "Unsupported record size {} in {}".format(self._record_size, path)
+            )
+        self._ip_version = self.metadata["ip_version"]
+        self._tree_size = self._record_size * 2 // 8 * self._node_count
+        self._ipv4_start = 0
+        if self._ip_version == 6:
+            # IPv4 addresses are stored as ::a.b.c.d
+            for _ in range(96):
+                if self._ipv4_start >= self._node_count:
+                    break
+                self._ipv4_start = self._record(self._ipv4_start, 0)
+
+    def close(self):
+        self._buffer.close()
+
+    def get(self, ip: str) -> Optional[Any]:
+        """Record of the network `ip` belongs to, None if there is none."""
+        address = ipaddress.ip_address(ip)
+        if address.version == 6 and self._ip_version == 4:
+            return None
+        node = self._ipv4_start if address.version == 4 else 0
+        bits = int(address)
+        for i in range(address.max_prefixlen - 1, -1, -1):
+            if node >= self._node_count:
+                break
+            node = self._record(node, (bits >> i) & 1)
+        if node <= self._node_count:
+            return None
+        value, _ = self._decode(
+            self._tree_size + node - self._node_count, self._tree_size + _SEPARATOR
+        )
+        return value
+
+    def _record(self, node: int, bit: int) -> int:
+        buffer = self._buffer
+        if self._record_size == 28:
+            offset = node * 7
+            middle = buffer[offset + 3]
+            if bit:
+                return ((middle & 0x0F) << 24) | int.from_bytes(
+                    buffer[offset + 4 : offset + 7], "big"
+                )
+            return ((middle & 0xF0) << 20) | int.from_bytes(
+                buffer[offset : offset + 3], "big"
+            )
+        size = self._record_size // 8
+        offset = node * size * 2 + bit * size
+        return int.from_bytes(buffer[offset : offset + size], "big")
+
+    def _decode(self, offset: int, base: int) -> Tuple[Any, int]:
+        """Value at `offset` and offset after it, pointers are from `base`."""
+        buffer = self._buffer
+        control = buffer[offset]
+        offset += 1
+        kind = control >> 5
+        if kind == 1:
+            size = (control >> 3) & 0x3
+            raw = int.from_bytes(buffer[offset : offset + size + 1], "big")
+            if size < 3:
+                raw |= (control & 0x7) << (8 * (size + 1))
+            value, _ = self._decode(base + raw + _POINTER_BASE[size], base)
+            return value, offset + size + 1
+        if kind == 0:
+            kind = 7 + buffer[offset]
+            offset += 1
+        size = control & 0x1F
+        if size >= 29:
+            count = size - 28
+            size = _SIZE_BASE[count] + int.from_bytes(
+                buffer[offset : offset + count], "big"
+            )
+            offset += count
+
+        if kind == 7:
+            value = dict()
+            for _ in range(size):
+                key, offset = self._decode(offset, base)
+                value[key], offset = self._decode(offset, base)
+            return value, offset
+        if kind == 11:
+            value = []
+            for _ in range(size):
+                item, offset = self._decode(offset, base)
+                value.append(item)
+            return value, offset
+        if kind == 14:
+            return bool(size), offset
+        raw = buffer[offset : offset + size]
+        offset += size
+        if kind == 2:
+            return raw.decode(), offset
+        if kind == 3:
+            return struct.unpack(">d", raw)[0], offset
+        if kind == 4:
+            return raw, offset
+        if kind in (5, 6, 9, 10):
+            return int.from_bytes(raw, "big"), offset
+        if kind == 8:
+            return int.from_bytes(raw.rjust(4, b"\0"), "big", signed=True), offset
+        if kind == 15:
+            return struct.unpack(">f", raw)[0], offset
+        raise ValueError("Unknown MaxMind DB data type {}".format(kind))
+
+
+class GeoBackend(ABC):
+    name: str
+
+    @abstractmethod
+    async def locate(self, ip: str) -> Optional[GeoLocation]:
+        raise NotImplementedError()
+
+    def close(self):
+        pass
+
+
+class MMDBBackend(GeoBackend):
+    """Local GeoLite2 City or Country database."""
+
+    def __init__(self, path: str):
+        self._reader = MMDBReader(path)
+        self.name = "mmdb:{}".format(
+            self._reader.metadata.get("database_type", os.path.basename(path))
+        )
+
+    async def locate(self, ip: str) -> Optional[GeoLocation]:
+        record = self._reader.get(ip)
+        if not isinstance(record, dict):
+            return None
+        country = record.get("country") or record.get("registered_country") or {}
+        city = record.get("city") or {}
+        location = record.get("location") or {}
+        if not country.get("iso_code"):
+            return None
+        return GeoLocation(
+            ip=ip,
+            country_code=country["iso_code"],
+            country=country.get("names", {}).get("en"),
+            city=city.get("names", {}).get("en"),
+            latitude=location.get("latitude"),
+            longitude=location.get("longitude"),
+            provider=self.name,
+        )
+
+    def close(self):
+        self._reader.close()
+
+
+class HTTPBackend(GeoBackend):
+    """Online lookup, slow and rate limited, only used as a fallback."""
+
+    def __init__(self, url: str = GEO_IP_CHECKER, timeout: float = 10):
+        self.name = url
+        self._url = url
+        self._timeout = timeout
+
+    async def locate(self, ip: str) -> Optional[GeoLocation]:
+        log.debug("Checking geo location by {}".format(self._url.format(ip)))
+        try:
+            async with aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=self._timeout)
+            ) as session:
+                async with session.get(self._url.format(ip)) as response:
+                    response.raise_for_status()
+                    res = await response.json(content_type=None)
+        except Exception as e:
+            log.warning("Failed to fetch geo location of {}:\n{}".format(ip, e))
+            return None
+        if not isinstance(res, dict) or not res.get("country_code"):
+            return None
+        return GeoLocation(
+            ip=ip,
+            country_code=res["country_code"],
+            country=res.get("country_name"),
+            city=res.get("city"),
+            latitude=res.get("latitude"),
+            longitude=res.get("longitude"),
+            provider=self.name,
+        )
+
+
+class GeoResolver:
+    """
+    Location of IP addresses, backends are asked in order.
+
+    Found locations are cached by IP for `ttl` seconds, least recently used
+    ones are dropped above `size` entries.
+    """
+
+    backends: List[GeoBackend]
+
+    def __init__(
+        self,
+        backends: List[GeoBackend] = None,
+        size: int = DEFAULT_GEOIP_CACHE_SIZE,
+        ttl: float = DEFAULT_GEOIP_TTL,
+    ):
+        self.backends = backends if backends is not None else [HTTPBackend()]
+        self._size = size
+        self._ttl = ttl
+        self._cache = OrderedDict()
+
+    def open(self, path: str = DEFAULT_GEOIP_PATH):
+        """Use database at `path` ahead of the other backends, if it exists."""
+        try:
+            backend = MMDBBackend(path)
+        except FileNotFoundError:
+            log.info("No GeoIP database at {}, using online lookup".format(path))
+            return
+        except (OSError, ValueError, KeyError) as e:
+            log.warning("Failed to open GeoIP database {}:\n{}".format(path, e))
+            return
+        log.info("Using GeoIP database {}".format(path))
+        self.backends.insert(0, backend)
+        self.clear()
+
+    def clear(self):
+        self._cache.clear()
+
+    def close(self):
+        for backend in self.backends:
+            backend.close()
+
+    async def locate(self, ip: str) -> Optional[GeoLocation]:
+        now = asyncio.get_event_loop().time()
+        cached = self._cache.get(ip)
+        if cached is not None:
+            expires, location = cached
+            if expires > now:
+                self._cache.move_to_end(ip)
+                return location
+            del self._cache[ip]
+        for backend in self.backends:
+            location = await backend.locate(ip)
+            if location is not None:
+                self._cache[ip] = (now + self._ttl, location)
+                while len(self._cache) > self._size:
+                    self._cache.popitem(last=False)
+                return location
+        return None
+
+
+geo_resolver = GeoResolver()
@@ -13,7 +13,7 @@ For upload to remote DB, this data would be normalized to TestRun with all paren
 """
 from enum import Enum
 from dataclasses import dataclass, field
-from typing import List, Set, Dict, Union
+from typing import List, Set, Dict, Tuple, Union
 from datetime import datetime
 
 
@@ -23,6 +23,7 @@ from datetime import datetime
 class Mode(Enum):
     continuous = "continuous"
     once = "once"
+    adaptive = "adaptive"
 
 
 @dataclass(frozen=True)
@@ -53,6 +54,68 @@ class DataSink:
     as_backup: bool = False
 
 
+@dataclass
+class IntervalPolicy:
+    name: str = None
+    min_interval: int = None
+    reference_bytes: int = None
+
+
+@dataclass
+class Adaptive:
+    confidence: float = None
+    min_runs: int = None
+    max_runs: int = None
+
+
+@dataclass
+class Pool:
+    enabled: bool = True
+    max_uses: int = None
+    max_age: int = None
+    # Templated providers share containers of generic technology images
+    share_images: bool = None
+
+
+@dataclass
+class Iperf3:
+    """Options of the iperf3 tester."""
+
+    # Self-hosted servers, "host" or "host:port"
+    servers: List[str] = None
+    # Parallel streams
+    streams: int = None
+    # Seconds measured per direction
+    duration: int = None
+    # Measure download too, in reverse mode the server sends
+    reverse: bool = None
+    # Send UDP at `bitrate` instead of TCP
+    udp: bool = None
+    # Target bits per second of UDP, e.g. "500M"
+    bitrate: str = None
+
+
+@dataclass
+class Resources:
+    """Limits of test containers, unset ones are not limited."""
+
+    # CPUs containers may run on, e.g. "2-3"
+    cpuset: str = None
+    # CPU time quota in CPUs, e.g. 1.5
+    cpus: float = None
+    # Memory limit in MiB
+    memory: int = None
+    # Relative CPU weight under contention
+    cpu_shares: int = None
+
+    def __str__(self):
+        return " ".join(
+            "{}={}".format(key, value)
+            for key, value in vars(self).items()
+            if value is not None
+        )
+
+
 @dataclass(frozen=True)
 class TestGroup:
     vpn_country: str = None
@@ -65,9 +128,22 @@ class TestGroup:
 @dataclass
 class Config:
     interval: int = None
+    interval_policy: IntervalPolicy = None
     mode: Mode = None
     repeats: int = None
     common_cities: bool = False
+    concurrency: int = None
+    vpn_concurrency: dict = None
+    technology_concurrency: dict = None
+    prefetch: int = None
+    pool: Pool = None
+    resources: Resources = None
+    adaptive: Adaptive = None
+    scheduling: str = None
+    ip_echo: List[str] = None
+    server_choice: int = None
+    tester: str = None
+    iperf3: Iperf3 = None
     vpns: List[VPN] = None
     groups: Set[TestGroup] = None
     sinks: List[DataSink] = None
@@ -97,6 +173,25 @@ class TestCase:
     protocol: str = None
 
 
+@dataclass(frozen=True)
+class ServerCheck:
+    """Result of a speedtest server reachability check from a VPN tunnel."""
+
+    host: str
+    port: int
+    valid: bool
+    checked: datetime
+
+
+@dataclass(frozen=True)
+class Phase:
+    """Step of a test run, seconds since the first step started."""
+
+    name: str
+    start: float
+    duration: float
+
+
 @dataclass(frozen=True)
 class TestRun:
     timestamp: datetime
@@ -120,3 +215,11 @@ class TestRun:
     server_name: str = None
     server_host: str = None
     packet_loss: int = None
+    connect_time: float = None
+    # Container and VPN session set up and tear down steps
+    phases: Tuple[Phase, ...] = None
+    # Container resource limits and host 1 minute load average at test start
+    resources: str = None
+    load_average: float = None
+    # Connect time in milliseconds to the speedtest server when it was chosen
+    server_rtt: float = None
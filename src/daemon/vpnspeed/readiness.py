@@ -0,0 +1,111 @@
+import asyncio
+from typing import Optional
+
+from vpnspeed.model import Probe
+from vpnspeed.container import ContainerEnvironment
+from vpnspeed.constans import DEFAULT_CONNECT_TIMEOUT
+from vpnspeed.probe import make_env_probe
+from vpnspeed import log, errors
+
+
+# Seconds for the single egress check after route change
+_PROBE_TIMEOUT = 10
+
+# Seconds a route wait lasts at first and at most, egress is checked after
+# each, so tunnels that leave the route alone are still noticed early
+_WAIT_MIN = 1
+_WAIT_MAX = 16
+
+# Route used by traffic to the internet, tunnels replace it or add policy rules.
+# Trailing blanks are cut, routes are compared with the stripped one taken
+# before connecting.
+_ROUTE = "route() { ip route get 1.1.1.1 2>/dev/null | head -n 1 | sed 's/ uid [0-9]*//; s/ *$//'; }"
+
+# Block until the route differs from `$1` and print the new one. It is
+# checked once right after the monitor starts, then netlink events trigger
+# an immediate check and the one second read timeout covers missed events.
+_WAIT_ROUTE_CHANGE = """
+exec 2>/dev/null
+{route}
+ready() {{ r=$(route); [ -n "$r" ] && [ "$r" != "$1" ]; }}
+coproc ip monitor link address route rule
+while ! ready "$1"; do
+    read -r -t 1 -u "${{COPROC[0]}}" _
+    [ $? -eq 1 ] && sleep 1
+done
+kill $COPROC_PID
+printf 'ready %s\\n' "$r"
+""".format(
+    route=_ROUTE
+)
+
+
+async def egress_route(env: ContainerEnvironment) -> str:
+    """Current route to the internet, taken before connecting."""
+    _, stdout = await env.exec("bash", ["-c", _ROUTE + "; route"], output=True)
+    return (stdout or "").strip()
+
+
+async def _wait_route_change(
+    env: ContainerEnvironment, route: str, timeout: float
+) -> Optional[str]:
+    """New route once it differs from `route`, None if it does not in time."""
+    timeout = max(int(timeout), 1)
+    status, stdout = await env.exec(
+        "timeout",
+        [str(timeout), "bash", "-c", _WAIT_ROUTE_CHANGE, "readiness", route],
+        output=True,
+        timeout=timeout + 5,
+    )
+    if status != 0 or not (stdout or "").startswith("ready "):
+        log.debug("No route change seen in {}s".format(timeout))
+        return None
+    return stdout[len("ready ") :].strip()
+
+
+async def _egress(env: ContainerEnvironment, local_probe: Probe) -> Optional[Probe]:
+    """Probe of the egress if it moved away from `local_probe`."""
+    try:
+        probe = await make_env_probe(env, attempts=1, timeout=_PROBE_TIMEOUT)
+        if probe.ip != local_probe.ip:
+            return probe
+        log.info("Egress is still {}".format(probe.ip))
+    except errors.TestRunError as e:
+        log.info("Egress check failed:\n{}".format(e))
+    return None
+
+
+async def wait_for_connection(
+    env: ContainerEnvironment,
+    local_probe: Probe,
+    route: str,
+    timeout: float = DEFAULT_CONNECT_TIMEOUT,
+) -> Probe:
+    """
+    Wait for the tunnel to take over `route`, then confirm the egress IP.
+
+    Egress is checked once up front, then after each route change or a
+    route wait bounded by a growing back-off, instead of polling the IP
+    checker in a sleep loop.
+    """
+    loop = asyncio.get_event_loop()
+    deadline = loop.time() + timeout
+    wait = _WAIT_MIN
+    # Tunnels may be up already, policy routed ones (e.g. IPsec) do not
+    # change the route at all. Changes are compared with the route of the
+    # last check, so none made in the meantime are missed.
+    probe = await _egress(env, local_probe)
+    while probe is None:
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            raise errors.VPNConnectionFailed(
+                "Not connected after {}s".format(round(timeout))
+            )
+        changed = await _wait_route_change(env, route, min(remaining, wait))
+        if changed is not None:
+            # Route settles before tunnel passes traffic, e.g. handshake
+            # pending, the next wait is for a further change
+            route = changed
+        wait = min(wait * 2, _WAIT_MAX)
+        probe = await _egress(env, local_probe)
+    return probe
@@ -0,0 +1,77 @@
+import math
+from dataclasses import dataclass
+from statistics import NormalDist
+from .model import *
+from vpnspeed.constans import (
+    DEFAULT_ADAPTIVE_CONFIDENCE,
+    DEFAULT_ADAPTIVE_MIN_RUNS,
+    DEFAULT_ADAPTIVE_MAX_RUNS,
+)
+
+
+def with_defaults(adaptive: Adaptive = None) -> Adaptive:
+    adaptive = adaptive or Adaptive()
+    return Adaptive(
+        confidence=adaptive.confidence or DEFAULT_ADAPTIVE_CONFIDENCE,
+        min_runs=adaptive.min_runs or DEFAULT_ADAPTIVE_MIN_RUNS,
+        max_runs=adaptive.max_runs or DEFAULT_ADAPTIVE_MAX_RUNS,
+    )
+
+
+def add_sample(case: Case, download_bandwidth: int, upload_bandwidth: int):
+    """Account test run results in case statistics."""
+    if download_bandwidth is not None:
+        case.download.add(download_bandwidth)
+    if upload_bandwidth is not None:
+        case.upload.add(upload_bandwidth)
+
+
+def _half_width(stats: RunningStats, z: float) -> float:
+    return z * math.sqrt(stats.variance / stats.count)
+
+
+def _separated(a: RunningStats, b: RunningStats, z: float) -> bool:
+    return abs(a.mean - b.mean) > _half_width(a, z) + _half_width(b, z)
+
+
+def _exhausted(case: Case, adaptive: Adaptive) -> bool:
+    return case.run_count >= adaptive.max_runs
+
+
+def _sampled(case: Case, adaptive: Adaptive) -> bool:
+    return min(case.download.count, case.upload.count) >= max(adaptive.min_runs, 2)
+
+
+def update_resolved(group: Group, adaptive: Adaptive):
+    """
+    Mark cases which no longer need runs.
+
+    Case is resolved once its download and upload confidence intervals do not
+    overlap with any competitor in the group, or its run budget is spent.
+    Normal approximation is used for intervals, `min_runs` keeps it sane.
+    """
+    z = NormalDist().inv_cdf((1 + adaptive.confidence) / 2)
+    # Competitors out of budget without enough data can not be ranked anyway
+    ranked = [
+        case
+        for case in group.cases
+        if _sampled(case, adaptive) or not _exhausted(case, adaptive)
+    ]
+    for case in group.cases:
+        if _exhausted(case, adaptive):
+            case.resolved = True
+            continue
+        if not _sampled(case, adaptive):
+            case.resolved = False
+            continue
+        case.resolved = all(
+            _sampled(other, adaptive)
+            and _separated(case.download, other.download, z)
+            and _separated(case.upload, other.upload, z)
+            for other in ranked
+            if other is not case
+        )
+
+
+def all_resolved(groups: List[Group]) -> bool:
+    return all(case.resolved for group in groups for case in group.cases)
@@ -0,0 +1,232 @@
+import json
+import os
+import time
+from dataclasses import asdict
+from typing import Callable, Dict, List, Optional, Tuple
+from .model import *
+from vpnspeed import log, errors
+from vpnspeed.constans import (
+    DEFAULT_BREAKER_THRESHOLD,
+    DEFAULT_BREAKER_COOLDOWN,
+    DEFAULT_BREAKER_MAX_COOLDOWN,
+)
+
+
+DEFAULT_BREAKERS_PATH = "/var/run/vpnspeed/breakers.json"
+
+# Breaker scope: (group, None) for group errors, (None, case) for case
+# errors and (group, case) for failures of a single option
+Key = Tuple[Optional[TestGroup], Optional[TestCase]]
+
+
+class CircuitBreakers:
+    """
+    Circuit breakers of test options.
+
+    Errors are classified by their type: `TestGroupError` counts towards
+    the breaker of the whole group, `TestCaseError` towards the breaker of
+    the case in all groups and `TestRunError` towards the breaker of the
+    (group, case) option. Breakers open after `threshold` consecutive
+    failures. Open breakers move to half open after an exponentially
+    growing cooldown, letting a single trial run decide whether to close or
+    open again, options behind it stay blocked while the trial runs.
+
+    With `path` set, state is kept in a JSON file to survive restarts,
+    hence the wall clock default.
+    """
+
+    _breakers: Dict[Key, Breaker]
+    # Half open breakers with a trial running, by the option running it
+    _trials: Dict[Key, Tuple[TestGroup, TestCase]]
+
+    def __init__(
+        self,
+        path: str = None,
+        clock: Callable[[], float] = time.time,
+        threshold: int = DEFAULT_BREAKER_THRESHOLD,
+        cooldown: float = DEFAULT_BREAKER_COOLDOWN,
+        max_cooldown: float = DEFAULT_BREAKER_MAX_COOLDOWN,
+    ):
+        self._path = path
+        self._clock = clock
+        self._threshold = threshold
+        self._cooldown = cooldown
+        self._max_cooldown = max_cooldown
+        self._breakers = dict()
+        self._trials = dict()
+        if path is not None:
+            self._load()
+
+    def breakers(self) -> List[Breaker]:
+        """Breakers which are not closed."""
+        return [
+            deepcopy(breaker)
+            for breaker in self._breakers.values()
+            if breaker.state != BreakerState.closed
+        ]
+
+    def group_open(self, group: TestGroup) -> bool:
+        return self._is_open((group, None))
+
+    def is_open(self, group: TestGroup, case: TestCase) -> bool:
+        """Option is blocked by its own, its case or its group breaker."""
+        return any(self._is_open(key) for key in _keys(group, case))
+
+    def begin(self, group: TestGroup, case: TestCase) -> bool:
+        """
+        Option starts running, it is the trial of its half open breakers
+        without one. Returns if it is, other options behind them are blocked
+        until `end`.
+        """
+        started = False
+        for key in _keys(group, case):
+            breaker = self._breakers.get(key)
+            if (
+                breaker is not None
+                and breaker.state == BreakerState.half_open
+                and key not in self._trials
+            ):
+                self._trials[key] = (group, case)
+                started = True
+        return started
+
+    def end(self, group: TestGroup, case: TestCase) -> bool:
+        """Option stopped running, returns if it ended trials."""
+        ended = [
+            key for key, option in self._trials.items() if option == (group, case)
+        ]
+        for key in ended:
+            del self._trials[key]
+        return bool(ended)
+
+    def record_success(self, group: TestGroup, case: TestCase):
+        changed = False
+        for key in _keys(group, case):
+            breaker = self._breakers.pop(key, None)
+            if breaker is not None:
+                changed = True
+                if breaker.state != BreakerState.closed:
+                    log.info("Circuit breaker of {} closed".format(_describe(key)))
+        if changed:
+            self._save()
+
+    def record_failure(self, group: TestGroup, case: TestCase, error: Exception):
+        if isinstance(error, errors.TestGroupError):
+            key = (group, None)
+        elif isinstance(error, errors.TestCaseError):
+            key = (None, case)
+        else:
+            key = (group, case)
+
+        breaker = self._breakers.setdefault(key, Breaker(group=key[0], case=key[1]))
+        breaker.failures += 1
+        breaker.error = type(error).__name__
+        if (
+            breaker.state == BreakerState.half_open
+            or breaker.state == BreakerState.closed
+            and breaker.failures >= self._threshold
+        ):
+            self._trip(key, breaker)
+        self._save()
+
+    def poll(self) -> bool:
+        """Move breakers with elapsed cooldown to half open, returns if any did."""
+        now = self._clock()
+        changed = False
+        for key, breaker in self._breakers.items():
+            if (
+                breaker.state == BreakerState.open
+                and now >= breaker.opened_at + breaker.cooldown
+            ):
+                breaker.state = BreakerState.half_open
+                log.info("Circuit breaker of {} half open".format(_describe(key)))
+                changed = True
+        if changed:
+            self._save()
+        return changed
+
+    def next_retry(self) -> Optional[float]:
+        """Seconds until the first open breaker can be retried."""
+        retries = [
+            breaker.opened_at + breaker.cooldown - self._clock()
+            for breaker in self._breakers.values()
+            if breaker.state == BreakerState.open
+        ]
+        return max(min(retries), 0.0) if retries else None
+
+    def rename(self, old: TestGroup, new: TestGroup):
+        for (group, case) in list(self._breakers):
+            if group == old:
+                breaker = self._breakers.pop((group, case))
+                breaker.group = new
+                self._breakers[(new, case)] = breaker
+        for key, (group, case) in list(self._trials.items()):
+            if group == old:
+                del self._trials[key]
+                key = (new, key[1]) if key[0] == old else key
+                self._trials[key] = (new, case)
+        self._save()
+
+    def _is_open(self, key: Key) -> bool:
+        breaker = self._breakers.get(key)
+        if breaker is None:
+            return False
+        if breaker.state == BreakerState.half_open:
+            return key in self._trials
+        return breaker.state == BreakerState.open
+
+    def _trip(self, key: Key, breaker: Breaker):
+        breaker.trips += 1
+        breaker.state = BreakerState.open
+        breaker.opened_at = self._clock()
+        breaker.cooldown = min(
+            self._cooldown * 2 ** (breaker.trips - 1), self._max_cooldown
+        )
+        log.warning(
+            "Circuit breaker of {} open for {}s after {}".format(
+                _describe(key), round(breaker.cooldown), breaker.error
+            )
+        )
+
+    def _load(self):
+        try:
+            with open(self._path) as f:
+                data = json.load(f)
+            for item in data:
+                group = item.pop("group")
+                case = item.pop("case")
+                breaker = Breaker(
+                    group=group and TestGroup(**group),
+                    case=case and TestCase(**case),
+                    state=BreakerState[item.pop("state")],
+                    **item,
+                )
+                self._breakers[(breaker.group, breaker.case)] = breaker
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            log.warning("Failed to load circuit breakers:\n%s", e)
+
+    def _save(self):
+        if self._path is None:
+            return
+        data = [
+            {**asdict(breaker), "state": breaker.state.name}
+            for breaker in self._breakers.values()
+        ]
+        try:
+            temp = self._path + ".tmp"
+            with open(temp, "w") as f:
+                json.dump(data, f)
+            os.replace(temp, self._path)
+        except OSError as e:
+            log.warning("Failed to save circuit breakers:\n%s", e)
+
+
+def _keys(group: TestGroup, case: TestCase) -> Tuple[Key, ...]:
+    """Breakers an option is behind."""
+    return ((group, None), (None, case), (group, case))
+
+
+def _describe(key: Key) -> str:
+    return " - ".join(str(part) for part in key if part is not None)
@@ -226,9 +226,30 @@ def diff_config(old: Config, new: Config) -> (Config, List[Action]):
 
     config = Config(
         interval=new.interval or old.interval,
+        interval_policy=new.interval_policy or old.interval_policy,
         mode=new.mode or old.mode,
         repeats=new.repeats or old.repeats,
         common_cities=new.common_cities or old.common_cities,
+        concurrency=new.concurrency or old.concurrency,
+        vpn_concurrency=(
+            new.vpn_concurrency
+            if new.vpn_concurrency is not None
+            else old.vpn_concurrency
+        ),
+        technology_concurrency=(
+            new.technology_concurrency
+            if new.technology_concurrency is not None
+            else old.technology_concurrency
+        ),
+        prefetch=new.prefetch if new.prefetch is not None else old.prefetch,
+        pool=new.pool or old.pool,
+        resources=new.resources or old.resources,
+        adaptive=new.adaptive or old.adaptive,
+        scheduling=new.scheduling or old.scheduling,
+        ip_echo=new.ip_echo or old.ip_echo,
+        server_choice=new.server_choice or old.server_choice,
+        tester=new.tester or old.tester,
+        iperf3=new.iperf3 or old.iperf3,
         vpns=vpns,
         groups=groups,
         sinks=sinks,
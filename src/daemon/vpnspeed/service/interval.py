@@ -0,0 +1,76 @@
+from abc import ABC, abstractmethod
+from typing import Dict, Type
+from .model import *
+from vpnspeed.constans import DEFAULT_INTERVAL_REFERENCE_BYTES
+
+
+class Policy(ABC):
+    """Decides how long to wait after a test run."""
+
+    NAME: str
+
+    _config: IntervalPolicy
+
+    def __init__(self, config: IntervalPolicy):
+        self._config = config
+
+    @property
+    def min_interval(self) -> int:
+        return self._config.min_interval or 0
+
+    @abstractmethod
+    def delay(self, interval: int, run: TestRun = None) -> float:
+        """
+        Seconds to wait given the configured `interval` and the finished run,
+        `run` is None when no speed test was completed.
+        """
+        raise NotImplementedError()
+
+
+class FixedPolicy(Policy):
+    """Always wait the configured interval."""
+
+    NAME = "fixed"
+
+    def delay(self, interval: int, run: TestRun = None) -> float:
+        return interval
+
+
+class SuccessPolicy(Policy):
+    """Wait the interval only after a speed test, `min_interval` otherwise."""
+
+    NAME = "success"
+
+    def delay(self, interval: int, run: TestRun = None) -> float:
+        if run is None:
+            return min(self.min_interval, interval)
+        return interval
+
+
+class TrafficPolicy(Policy):
+    """
+    Scale interval with the traffic moved by the speed test.
+
+    A run which moved `reference_bytes` or more waits the whole interval,
+    lighter runs proportionally less, but at least `min_interval`.
+    """
+
+    NAME = "traffic"
+
+    def delay(self, interval: int, run: TestRun = None) -> float:
+        if run is None:
+            return min(self.min_interval, interval)
+        moved = (run.download_bytes or 0) + (run.upload_bytes or 0)
+        reference = self._config.reference_bytes or DEFAULT_INTERVAL_REFERENCE_BYTES
+        scaled = interval * min(moved / reference, 1.0)
+        return max(scaled, min(self.min_interval, interval))
+
+
+POLICIES: Dict[str, Type[Policy]] = {
+    policy.NAME: policy for policy in (FixedPolicy, SuccessPolicy, TrafficPolicy)
+}
+
+
+def make_policy(config: IntervalPolicy = None) -> Policy:
+    config = config or IntervalPolicy()
+    return POLICIES[config.name or FixedPolicy.NAME](config)
@@ -1,5 +1,8 @@
 from vpnspeed.model import *
-from dataclasses import dataclass
+from vpnspeed.container import ImageStatus, PoolStats, RegistryStats
+from vpnspeed.egress import EchoStats
+from vpnspeed.tester import CatalogueStats
+from dataclasses import dataclass, field
 from typing import List, Set, Dict
 from copy import deepcopy
 
@@ -13,11 +16,40 @@ class State(Enum):
         return self.name
 
 
+@dataclass
+class RunningStats:
+    """Running mean and variance (Welford's algorithm)."""
+
+    count: int = 0
+    mean: float = 0.0
+    m2: float = 0.0
+
+    @property
+    def variance(self) -> float:
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    def add(self, value: float):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+
 @dataclass
 class Case:
     case: TestCase
     run_count: int = 0
     fail_count: int = 0
+    running: int = 0
+    download: RunningStats = field(default_factory=RunningStats)
+    upload: RunningStats = field(default_factory=RunningStats)
+    resolved: bool = False
+    # Successful runs by hour of day of their timestamp
+    runs_by_hour: List[int] = field(default_factory=lambda: [0] * 24)
+    # Circuit breaker of the case or its group is open
+    blocked: bool = False
+    # Seconds of test run steps (container create, login, ...) by step
+    phases: Dict[str, RunningStats] = field(default_factory=dict)
 
 
 @dataclass
@@ -27,9 +59,45 @@ class Group:
     failing: bool = False
 
 
+class BreakerState(Enum):
+    closed = 0
+    open = 1
+    half_open = 2
+
+    def __getstate__(self):
+        return self.name
+
+
+@dataclass
+class Breaker:
+    group: TestGroup = None
+    case: TestCase = None
+    state: BreakerState = BreakerState.closed
+    # Consecutive failures since last success
+    failures: int = 0
+    # Times opened in a row, cooldown doubles with each
+    trips: int = 0
+    # Clock time when breaker opened and seconds it stays open
+    opened_at: float = None
+    cooldown: float = None
+    error: str = None
+
+
 @dataclass
 class Context:
     state: State = None
     probe: Probe = None
     config: Config = None
     groups: List[Group] = None
+    pool_stats: PoolStats = None
+    # Docker API latency by endpoint
+    docker_stats: dict = None
+    breakers: List[Breaker] = None
+    # Readiness and pull progress of configured provider images
+    images: List[ImageStatus] = None
+    # Test containers of this daemon and orphans removed
+    containers: RegistryStats = None
+    # Answer times and failures of IP echo endpoints, in order they are asked
+    egress: List[EchoStats] = None
+    # Cached speedtest server lists and remembered server checks
+    servers: CatalogueStats = None
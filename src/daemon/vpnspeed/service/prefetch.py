@@ -0,0 +1,52 @@
+import asyncio
+from typing import Awaitable, Callable, Tuple
+
+from vpnspeed import log
+from vpnspeed.model import Probe, TestGroup, TestCase
+from vpnspeed.container import ContainerEnvironment
+from vpnspeed.vpn import VPNSession
+
+
+Prepared = Tuple[ContainerEnvironment, VPNSession, Probe]
+
+
+class Preparation:
+    """
+    Test run environment prepared ahead of time.
+
+    Container start, local probe and provider login are started as soon as the
+    option is selected, so the run can connect as soon as a worker is free.
+    """
+
+    group: TestGroup
+    case: TestCase
+    generation: int
+    _task: asyncio.Task
+
+    def __init__(
+        self,
+        group: TestGroup,
+        case: TestCase,
+        generation: int,
+        prepare: Callable[[TestGroup, TestCase], Awaitable[Prepared]],
+    ):
+        self.group = group
+        self.case = case
+        self.generation = generation
+        self._task = asyncio.create_task(prepare(group, case))
+
+    async def get(self) -> Prepared:
+        return await self._task
+
+    async def discard(self) -> Prepared:
+        """Cancel preparation, returns prepared environment if it was ready."""
+        log.debug(
+            "Discarding prepared run: {} => {}".format(repr(self.group), repr(self.case))
+        )
+        if not self._task.done():
+            self._task.cancel()
+        try:
+            return await self._task
+        except (asyncio.CancelledError, Exception):
+            # Failed or cancelled preparation already cleaned up after itself
+            return None
@@ -1,16 +1,33 @@
 import asyncio
+import itertools
+import os
 import random
+from collections import deque
+from dataclasses import replace
+from datetime import datetime
 from aiorwlock import RWLock
-from typing import List, Set, Dict
+from typing import Callable, List, Set, Dict, Tuple, Deque, Iterator
 from .diff import *
-from .select import select
+from .scheduler import SchedulerIndex, LEAST_RUNNED, HOURLY
+from .breaker import CircuitBreakers
+from . import adaptive
+from .interval import Policy, make_policy
+from .prefetch import Preparation, Prepared
 from .model import *
 from vpnspeed import log, errors
+from vpnspeed.constans import DEFAULT_CONCURRENCY
 from vpnspeed.probe import make_probe, make_env_probe
+from vpnspeed.readiness import egress_route, wait_for_connection
+from vpnspeed.timeline import Timeline
 from vpnspeed.datasink import MasterSink
-from vpnspeed.vpn import DynamicVPN
+from vpnspeed.vpn import DynamicVPN, VPNSession
 from vpnspeed.tester import Tester, SpeedTestCliTester
-from vpnspeed.container import ContainerEnvironment
+from vpnspeed.container import (
+    ContainerEnvironment,
+    ContainerPool,
+    PooledEnvironment,
+    PoolStats,
+)
 
 
 class Runner:
@@ -23,14 +40,38 @@ class Runner:
     _groups: List[Group]
     _group_index: Dict[TestGroup, Group]
     _case_index: Dict[TestGroup, Dict[TestCase, Case]]
+    _scheduler: SchedulerIndex
+    _scheduling: str
+    _now: Callable[[], datetime]
 
     _test_cases: Set[TestCase]
-    _failing_cases: Set[TestCase]
+    _breakers: CircuitBreakers
 
     _interval: int
+    _interval_policy: Policy
     _common_cities: bool
-
-    def __init__(self, vpn, tester, sink):
+    _concurrency: int
+    _vpn_concurrency: Dict[str, int]
+    _technology_concurrency: Dict[str, int]
+    _prefetch: int
+    _generation: int
+    _mode: Mode
+    _adaptive: Adaptive
+
+    _environment: Callable[..., ContainerEnvironment]
+    _pool: ContainerPool
+    _instances: Iterator[int]
+    _probe: Probe
+
+    def __init__(
+        self,
+        vpn,
+        tester,
+        sink,
+        environment=ContainerEnvironment,
+        breakers: CircuitBreakers = None,
+        now: Callable[[], datetime] = datetime.utcnow,
+    ):
         self._clock = RWLock()
         self._vpn = vpn
         self._tester = tester
@@ -39,40 +80,110 @@ class Runner:
         self._groups = list()
         self._group_index = dict()
         self._case_index = dict()
+        self._scheduler = SchedulerIndex()
+        self._scheduling = LEAST_RUNNED
+        # Clock of test run timestamps, hourly scheduling follows it
+        self._now = now
         self._test_cases = set()
-        self._failing_cases = set()
+        self._breakers = breakers or CircuitBreakers()
 
         self._interval = 0
+        self._interval_policy = make_policy()
         self._common_cities = False
-
-    async def set_context_params(self, interval: int, common_cities: bool):
+        self._concurrency = DEFAULT_CONCURRENCY
+        self._vpn_concurrency = dict()
+        self._technology_concurrency = dict()
+        self._prefetch = 0
+        self._resources = None
+        self._generation = 0
+        self._mode = None
+        self._adaptive = adaptive.with_defaults()
+
+        self._environment = environment
+        self._pool = ContainerPool()
+        self._instances = itertools.count()
+        self._probe = None
+
+    async def set_context_params(
+        self,
+        interval: int,
+        common_cities: bool,
+        concurrency: int = None,
+        vpn_concurrency: Dict[str, int] = None,
+        technology_concurrency: Dict[str, int] = None,
+        prefetch: int = None,
+        pool: Pool = None,
+        adaptive_params: Adaptive = None,
+        interval_policy: IntervalPolicy = None,
+        scheduling: str = None,
+        resources: Resources = None,
+    ):
+        if prefetch != self._prefetch:
+            self._generation += 1
+        if resources != self._resources:
+            # Prepared and pooled containers were created with other limits
+            self._generation += 1
+            self._resources = resources
+            await self._pool.clear()
         self._interval = interval
+        self._interval_policy = make_policy(interval_policy)
         self._common_cities = common_cities
+        self._concurrency = concurrency or DEFAULT_CONCURRENCY
+        self._vpn_concurrency = vpn_concurrency or dict()
+        self._technology_concurrency = technology_concurrency or dict()
+        self._prefetch = prefetch or 0
+        self._scheduling = scheduling or LEAST_RUNNED
+        await self._pool.configure(pool)
+        adaptive_params = adaptive.with_defaults(adaptive_params)
+        if adaptive_params != self._adaptive:
+            self._adaptive = adaptive_params
+            async with self._clock.writer:
+                for group in self._groups:
+                    self._refresh_group(group)
+
+    async def set_probe(self, probe: Probe):
+        self._probe = probe
+
+    async def get_pool_stats(self) -> PoolStats:
+        return deepcopy(self._pool.stats)
+
+    async def get_breakers(self) -> List[Breaker]:
+        async with self._clock.reader:
+            return self._breakers.breakers()
 
     async def remove_groups(self, test_groups: Set[TestGroup]):
         async with self._clock.writer:
+            self._generation += 1
             cleaned_groups = []
             for group in self._groups:
                 if group.group in test_groups:
                     del self._group_index[group.group]
                     del self._case_index[group.group]
+                    self._scheduler.remove(group.group)
                 else:
                     cleaned_groups.append(group)
             self._groups = cleaned_groups
 
     async def add_groups(self, test_groups: Set[TestGroup]):
+        rows = await self._stored_runs()
         async with self._clock.writer:
+            self._generation += 1
+            groups = []
             for test_group in test_groups:
                 group = Group(group=deepcopy(test_group), cases=[])
                 self._case_index[test_group] = dict()
                 self._add_cases_for_group(group, self._test_cases)
                 self._group_index[test_group] = group
                 self._groups.append(group)
+                groups.append(group)
+            self._load_history(rows, groups, self._test_cases)
+            for group in groups:
+                self._refresh_group(group)
 
     async def remove_cases(self, test_cases: Set[TestCase]):
         async with self._clock.writer:
+            self._generation += 1
             self._test_cases.difference_update(test_cases)
-            self._failing_cases.difference_update(test_cases)
             for group in self._groups:
                 test_cases = []
                 for case in group.cases:
@@ -81,12 +192,18 @@ class Runner:
                     else:
                         test_cases.append(case)
                 group.cases = test_cases
+                self._refresh_group(group)
 
     async def add_cases(self, test_cases: Set[TestCase]):
+        rows = await self._stored_runs()
         async with self._clock.writer:
+            self._generation += 1
             self._test_cases.update(test_cases)
             for group in self._groups:
                 self._add_cases_for_group(group, test_cases)
+            self._load_history(rows, self._groups, test_cases)
+            for group in self._groups:
+                self._refresh_group(group)
 
     async def get_groups(self) -> List[Group]:
         async with self._clock.reader:
@@ -100,14 +217,34 @@ class Runner:
         return random.choice(list(city))
 
     async def run(self, mode: Mode, repeats: int):
+        workers: Dict[asyncio.Task, Tuple[TestGroup, TestCase]] = dict()
+        prepared: Deque[Preparation] = deque()
+        async with self._clock.writer:
+            self._mode = mode
+            for group in self._groups:
+                self._refresh_group(group)
         try:
             runs = 0
             group = None
             reset_then_no_options_found = False
             while True:
-                groups = await self.get_groups()
-                groups_len = groups and len(groups) or 0
-                cases_len = len(next(iter(groups), Group(group=None, cases=[])).cases)
+                runs -= await self._discard_stale(prepared)
+                await self._poll_breakers()
+                if prepared and len(workers) < self._concurrency:
+                    preparation = prepared.popleft()
+                    self._start_worker(
+                        workers,
+                        preparation.group,
+                        preparation.case,
+                        repeats,
+                        preparation,
+                    )
+                    continue
+                if len(prepared) >= self._prefetch:
+                    await self._wait_for_worker(workers, self._concurrency)
+                async with self._clock.reader:
+                    groups_len = len(self._groups)
+                    cases_len = groups_len and len(self._groups[0].cases)
                 run_target = groups_len * cases_len
                 log.info("Run: {}/{}".format(runs, run_target))
                 log.info("group count: {}".format(groups_len))
@@ -115,12 +252,47 @@ class Runner:
                     log.debug("Ran {} tests, clear all fails".format(runs))
 
                     if mode == Mode.once:
+                        if prepared:
+                            await self._wait_for_worker(workers, self._concurrency)
+                            continue
+                        await self._wait_for_worker(workers, 1)
                         return
                     runs = 0
                     group = None
+                if mode == Mode.adaptive and await self._resolved():
+                    if prepared:
+                        await self._wait_for_worker(workers, self._concurrency)
+                        continue
+                    if workers:
+                        await self._wait_for_worker(workers, len(workers))
+                        continue
+                    log.info("All comparisons resolved, stopping adaptive run")
+                    return
                 # Handle test case where no test option found
-                new_group, case = select(groups) or (None, None)
+                active = list(workers.values()) + [
+                    (p.group, p.case) for p in prepared
+                ]
+                async with self._clock.writer:
+                    self._scheduler.set_hour(self._hour())
+                    new_group, case = self._scheduler.select(
+                        skip=lambda g, c: self._at_limit(active, c)
+                    ) or (None, None)
                 if new_group is None and case is None:
+                    if workers:
+                        log.debug("No option can be started yet, waiting for runs")
+                        await self._wait_for_worker(workers, len(workers))
+                        continue
+                    if prepared:
+                        continue
+                    retry = self._breakers.next_retry()
+                    if retry is not None and mode != Mode.once:
+                        log.info(
+                            "All options are failing, retrying in {}s".format(
+                                round(retry)
+                            )
+                        )
+                        await asyncio.sleep(retry)
+                        continue
                     log.info(
                         "No option found for selecting new group to run. Resetting run and fails..."
                     )
@@ -133,75 +305,387 @@ class Runner:
                     or group.target_country != new_group.target_country
                 ):
                     group = new_group
-                    if self._common_cities and group.vpn_country != "auto":
+                    # Renaming a group under running tests would orphan their results
+                    if (
+                        self._common_cities
+                        and group.vpn_country != "auto"
+                        and not any(g == new_group for g, _ in active)
+                    ):
                         group = TestGroup(
                             vpn_country=group.vpn_country,
                             target_country=group.target_country,
                             vpn_city=await self.random_city_check(group.vpn_country),
                         )
-                        self._group_index[group] = self._group_index.pop(new_group)
-                        self._case_index[group] = self._case_index.pop(new_group)
-                        self._group_index[group].group = group
+                        await self._rename_group(new_group, group)
                 if not group or not case:
                     log.debug("Nothing found to run, clear all fails")
                     await self._clear_fails()
                     continue
 
-                for _ in range(repeats):
-                    await self._run_case(group, case)
+                await self._reserve(group, case)
+                if self._prefetch > 0:
+                    prepared.append(
+                        Preparation(group, case, self._generation, self._prepare)
+                    )
+                else:
+                    self._start_worker(workers, group, case, repeats)
                 runs += 1
         except asyncio.CancelledError:
             log.info("Worker stopped")
         except Exception as e:
             log.exception("Unknown error:\n%s", e)
+        finally:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            while prepared:
+                await self._discard(prepared.popleft())
+            await self._pool.clear()
+
+    async def invalidate_prepared(self):
+        """Mark prepared runs and pooled logins as stale, e.g. after VPN provider changes."""
+        self._generation += 1
+        await self._pool.clear()
+
+    async def _discard_stale(self, prepared: Deque[Preparation]) -> int:
+        stale = [p for p in prepared if p.generation != self._generation]
+        for preparation in stale:
+            prepared.remove(preparation)
+            await self._discard(preparation)
+        return len(stale)
+
+    async def _discard(self, preparation: Preparation):
+        result = await preparation.discard()
+        if result is not None:
+            env, session, _ = result
+            await self._finish_environment(env, session)
+        await self._release(preparation.group, preparation.case)
+
+    def _start_worker(
+        self,
+        workers: Dict[asyncio.Task, Tuple[TestGroup, TestCase]],
+        group: TestGroup,
+        case: TestCase,
+        repeats: int,
+        preparation: Preparation = None,
+    ):
+        task = asyncio.create_task(self._run_worker(group, case, repeats, preparation))
+        workers[task] = (group, case)
+
+    async def _wait_for_worker(
+        self, workers: Dict[asyncio.Task, Tuple[TestGroup, TestCase]], limit: int
+    ):
+        """Wait until less than `limit` workers are running."""
+        while workers and len(workers) >= max(limit, 1):
+            done, _ = await asyncio.wait(
+                workers.keys(), return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                del workers[task]
+                # Propagate unexpected worker failures, same as running inline
+                task.result()
+
+    async def _run_worker(
+        self,
+        group: TestGroup,
+        case: TestCase,
+        repeats: int,
+        preparation: Preparation = None,
+    ):
+        reserved = True
+        try:
+            for _ in range(repeats):
+                if not reserved:
+                    reserved = await self._reserve(group, case)
+                    if not reserved:
+                        return
+                wait, run = await self._run_case(group, case, preparation)
+                preparation = None
+                # Case waiting for the interval is not in flight, otherwise its
+                # group looks uneven and keeps being selected
+                await self._release(group, case)
+                reserved = False
+                if wait:
+                    await self._wait_delay_interval(run)
+        finally:
+            if reserved:
+                await self._release(group, case)
+
+    def _at_limit(self, active: List[Tuple[TestGroup, TestCase]], case: TestCase):
+        vpn_limit = self._vpn_concurrency.get(case.vpn)
+        if vpn_limit is not None:
+            if sum(1 for _, c in active if c.vpn == case.vpn) >= vpn_limit:
+                return True
+        technology_limit = self._technology_concurrency.get(case.technology)
+        if technology_limit is not None:
+            if (
+                sum(1 for _, c in active if c.technology == case.technology)
+                >= technology_limit
+            ):
+                return True
+        return False
 
     def _add_cases_for_group(self, group: Group, test_cases: Set[TestCase]):
         min_runs = min([0, *(c.run_count for c in group.cases)])
         for test_case in test_cases:
-            case = Case(
-                case=deepcopy(test_case),
-                run_count=min_runs,
-                fail_count=-1 if test_case in self._failing_cases else 0,
-            )
+            case = Case(case=deepcopy(test_case), run_count=min_runs)
             group.cases.append(case)
             if group.group not in self._case_index:
                 self._case_index[group.group] = dict()
             self._case_index[group.group][test_case] = case
 
-    async def _wait_delay_interval(self):
-        log.info("Start waiting interval: {}s".format(self._interval))
-        await asyncio.sleep(self._interval)
+    def _hour(self) -> int:
+        """Hour of day runs are balanced in, None when balancing total runs."""
+        return self._now().hour if self._scheduling == HOURLY else None
+
+    def _refresh_group(self, group: Group):
+        """Re-evaluate group after its cases changed, caller holds the lock."""
+        group.failing = self._breakers.group_open(group.group)
+        for case in group.cases:
+            case.blocked = self._breakers.is_open(group.group, case.case)
+        if self._mode == Mode.adaptive:
+            adaptive.update_resolved(group, self._adaptive)
+        else:
+            for case in group.cases:
+                case.resolved = False
+        self._scheduler.update(group)
+
+    async def _resolved(self) -> bool:
+        async with self._clock.reader:
+            return adaptive.all_resolved(self._groups)
+
+    async def _stored_runs(self) -> List[dict]:
+        try:
+            return await self._sink.backup.retrieve()
+        except Exception as e:
+            log.warning("Failed to retrieve stored test runs:\n%s", e)
+            return []
+
+    def _load_history(
+        self, rows: List[dict], groups: List[Group], test_cases: Set[TestCase]
+    ):
+        """Seed statistics and hourly run counts of new cases from stored test runs."""
+        by_countries = dict()
+        for group in groups:
+            key = (group.group.vpn_country, group.group.target_country)
+            by_countries.setdefault(key, []).append(group)
+        for row in rows:
+            test_case = TestCase(
+                vpn=row.get("case_vpn"),
+                technology=row.get("case_technology"),
+                protocol=row.get("case_protocol"),
+            )
+            if test_case not in test_cases:
+                continue
+            key = (row.get("group_vpn_country"), row.get("group_target_country"))
+            for group in by_countries.get(key, []):
+                # Unset group fields (e.g. city) match any stored value
+                if any(
+                    value is not None and row.get("group_" + name) != value
+                    for name, value in vars(group.group).items()
+                ):
+                    continue
+                case = self._case_index[group.group].get(test_case)
+                if case is not None:
+                    timestamp = row.get("run_timestamp")
+                    if timestamp is not None:
+                        if isinstance(timestamp, str):
+                            timestamp = datetime.fromisoformat(timestamp)
+                        case.runs_by_hour[timestamp.hour] += 1
+                    adaptive.add_sample(
+                        case,
+                        row.get("run_download_bandwidth"),
+                        row.get("run_upload_bandwidth"),
+                    )
+
+    async def _wait_delay_interval(self, run: TestRun = None):
+        delay = self._interval_policy.delay(self._interval, run)
+        log.info(
+            "Start waiting interval: {}s ({})".format(
+                round(delay, 1), self._interval_policy.NAME
+            )
+        )
+        await asyncio.sleep(delay)
         log.info("Finished waiting")
 
+    async def _rename_group(self, old: TestGroup, new: TestGroup):
+        async with self._clock.writer:
+            self._group_index[new] = self._group_index.pop(old)
+            self._case_index[new] = self._case_index.pop(old)
+            self._group_index[new].group = new
+            self._breakers.rename(old, new)
+            self._scheduler.remove(old)
+            self._refresh_group(self._group_index[new])
+
+    async def _reserve(self, test_group: TestGroup, test_case: TestCase) -> bool:
+        async with self._clock.writer:
+            case = self._case_index.get(test_group, {}).get(test_case)
+            if case is None:
+                return False
+            case.running += 1
+            started = self._breakers.begin(test_group, test_case)
+            self._refresh_trials(test_group, started)
+            return True
+
+    async def _release(self, test_group: TestGroup, test_case: TestCase):
+        async with self._clock.writer:
+            case = self._case_index.get(test_group, {}).get(test_case)
+            if case is not None:
+                case.running -= 1
+            ended = self._breakers.end(test_group, test_case)
+            if case is not None or ended:
+                self._refresh_trials(test_group, ended)
+
+    def _refresh_trials(self, test_group: TestGroup, changed: bool):
+        """Refresh after a run starts or ends, caller holds the lock."""
+        # Trials of case breakers block the case in every group
+        for group in self._groups if changed else [self._group_index[test_group]]:
+            self._refresh_group(group)
+
     async def _add_run(
         self, test_group: TestGroup, test_case: TestCase, test_run: TestRun
     ):
         async with self._clock.writer:
             case_ = self._case_index[test_group][test_case]
             case_.run_count += 1
+            case_.runs_by_hour[test_run.timestamp.hour] += 1
+            self._breakers.record_success(test_group, test_case)
+            adaptive.add_sample(
+                case_, test_run.download_bandwidth, test_run.upload_bandwidth
+            )
+            self._refresh_group(self._group_index[test_group])
 
-    async def _add_failing_group(self, test_group: TestGroup):
+    async def _poll_breakers(self):
+        async with self._clock.writer:
+            if self._breakers.poll():
+                for group in self._groups:
+                    self._refresh_group(group)
+
+    async def _add_failing_group(self, test_group: TestGroup, error: Exception):
         async with self._clock.writer:
             for case in self._group_index[test_group].cases:
                 case.run_count += 1
                 case.fail_count += 1
-                failing_index = case.run_count / case.fail_count
-                if case.run_count > 3 and failing_index < 1.3:
-                    self._group_index[test_group].failing = True
+            self._breakers.record_failure(test_group, None, error)
+            self._refresh_group(self._group_index[test_group])
 
-    async def _add_failing_case(self, test_case: TestCase):
+    async def _add_failing_case(
+        self, test_group: TestGroup, test_case: TestCase, error: Exception
+    ):
         async with self._clock.writer:
-            self._failing_cases.add(test_case)
             for cases in self._case_index.values():
                 cases[test_case].run_count += 1
-                cases[test_case].fail_count = -1
+                cases[test_case].fail_count += 1
+            self._breakers.record_failure(test_group, test_case, error)
+            for group in self._groups:
+                self._refresh_group(group)
 
-    async def _fail_run(self, group: TestGroup, case: TestCase):
+    async def _add_phases(self, group: TestGroup, case: TestCase, timeline: Timeline):
+        async with self._clock.writer:
+            phases = self._case_index[group][case].phases
+            for name, duration in timeline.durations().items():
+                phases.setdefault(name, RunningStats()).add(duration)
+
+    async def _fail_run(self, group: TestGroup, case: TestCase, error: Exception):
         async with self._clock.writer:
             self._case_index[group][case].run_count += 1
             self._case_index[group][case].fail_count += 1
+            self._breakers.record_failure(group, case, error)
+            self._refresh_group(self._group_index[group])
+
+    async def _prepare(self, group: TestGroup, case: TestCase) -> Prepared:
+        """Start container, probe local connection and login to provider."""
+        if self._pool.enabled:
+            key = self._pool.key(case.vpn, case.technology)
+            pooled = await self._pool.acquire(key)
+            if pooled is not None:
+                pooled.env.timeline = Timeline()
+                session = await self._reuse_session(pooled, group, case)
+                return pooled.env, session, pooled.probe
+
+        env = self._environment(
+            case.vpn, case.technology, next(self._instances), resources=self._resources
+        )
+        try:
+            if await env.start() is None:
+                raise errors.TechnologyNotSupported(
+                    "No container image for {} {}".format(case.vpn, case.technology)
+                )
+            if env.get_error_message() is not None:
+                raise errors.VPNConnectionFailed(
+                    "Failed to create {} container with error:\n{}".format(
+                        case.technology, env.get_error_message()
+                    )
+                )
+            await env.exec(
+                "echo",
+                "{}_{} starting...".format(case.vpn, case.technology.replace("/", "-")),
+            )
+            log.info(
+                "{}_{} starting...".format(case.vpn, case.technology.replace("/", "-"))
+            )
+            with env.timeline.phase("local_probe"):
+                local_probe = await make_env_probe(env)
 
-    async def _run_case(self, group: TestGroup, case: TestCase):
+            session = self._vpn.session(env, group, case)
+            await session.login()
+            if self._pool.enabled:
+                await self._pool.lease(
+                    self._pool.key(case.vpn, case.technology), env, local_probe
+                )
+            return env, session, local_probe
+        except BaseException:
+            await self._pool.dispose(env)
+            raise
+
+    async def _reuse_session(
+        self, pooled: PooledEnvironment, group: TestGroup, case: TestCase
+    ) -> VPNSession:
+        """Session of the pooled container, logged in to the provider of `case`."""
+        if pooled.state.vpn == case.vpn:
+            return pooled.state.renew(group, case)
+        # Container of a shared image, last used by another provider
+        self._pool.shared_reuse()
+        session = self._vpn.session(pooled.env, group, case)
+        try:
+            await session.login()
+        except BaseException:
+            await self._pool.dispose(pooled.env)
+            raise
+        return session
+
+    async def _finish_environment(self, env: ContainerEnvironment, session: VPNSession):
+        """Return clean environment to the pool, stop otherwise."""
+        if not self._pool.owns(env):
+            await self._pool.dispose(env)
+            return
+        try:
+            await self._pool.reset(env)
+            problem = await self._pool.verify(env)
+            if problem is not None:
+                raise errors.VPNConnectionFailed(problem)
+            probe = await make_env_probe(env)
+            expected = (self._probe or self._pool.get(env).probe).ip
+            if probe.ip != expected:
+                raise errors.VPNConnectionFailed(
+                    "Egress {} differs from probe {} after disconnect".format(
+                        probe.ip, expected
+                    )
+                )
+            await session.login()
+        except Exception as e:
+            log.warning("Not reusing container {}:\n{}".format(env.name, e))
+            await self._pool.dispose(env)
+            return
+        await self._pool.release(env, session)
+
+    async def _run_case(
+        self,
+        group: TestGroup,
+        case: TestCase,
+        preparation: Preparation = None,
+    ) -> Tuple[bool, TestRun]:
+        """Run single test, returns if interval should be waited and the run."""
         try:
             log.info(
                 "Testing: {} ({}) <-> {} => {} - {} - {}".format(
@@ -214,38 +698,22 @@ class Runner:
                 )
             )
 
-            async with ContainerEnvironment(case.vpn, case.technology) as env:
-                if env.get_error_message() is not None:
-                    raise errors.VPNConnectionFailed(
-                        "Failed to create {} container with error:\n{}".format(
-                            case.technology, env.get_error_message()
+            if preparation is not None:
+                env, session, local_probe = await preparation.get()
+            else:
+                env, session, local_probe = await self._prepare(group, case)
+            try:
+                route = await egress_route(env)
+                started = asyncio.get_event_loop().time()
+                async with session:
+                    with env.timeline.phase("verify"):
+                        vpn_probe = await wait_for_connection(env, local_probe, route)
+                    connect_time = round(asyncio.get_event_loop().time() - started, 3)
+                    log.info(
+                        "Connected from {} to {} in {}s".format(
+                            local_probe, vpn_probe, connect_time
                         )
                     )
-                await env.exec(
-                    "echo",
-                    "{}_{} starting...".format(
-                        case.vpn, case.technology.replace("/", "-")
-                    ),
-                )
-                log.info(
-                    "{}_{} starting...".format(
-                        case.vpn, case.technology.replace("/", "-")
-                    )
-                )
-                local_probe = await make_env_probe(env)
-
-                async with self._vpn.session(env, group, case):
-                    # Some protocols do not activate instantly, try to verify connection using a back off
-                    vpn_probe = None
-                    for i in range(8):
-                        probe = await make_env_probe(env)
-                        if local_probe.ip != probe.ip:
-                            vpn_probe = probe
-                            break
-                        await asyncio.sleep(1 * (2 ** i))
-                    if vpn_probe is None:
-                        raise errors.VPNConnectionFailed()
-                    log.info("Connected from {} to {}".format(local_probe, vpn_probe))
 
                     if group.vpn_country != "auto":
                         if vpn_probe.country_code != group.vpn_country:
@@ -255,7 +723,19 @@ class Runner:
                                 )
                             )
 
-                    run: TestRun = await self._tester.test(env, group, case)
+                    load_average = _load_average()
+                    # Spares the tester a probe for the city it tests from
+                    city = vpn_probe.city if vpn_probe.city != "Unknown" else None
+                    tested = TestGroup(
+                        **{**vars(group), "vpn_city": city or group.vpn_city}
+                    )
+                    run: TestRun = await self._tester.test(env, tested, case)
+                    run = replace(
+                        run,
+                        connect_time=connect_time,
+                        resources=env.resources and str(env.resources) or None,
+                        load_average=load_average,
+                    )
                     await self._add_run(group, case, run)
 
                     log.info(
@@ -271,21 +751,28 @@ class Runner:
                 detailed_group = TestGroup(
                     **{**vars(group), **{"vpn_city": vpn_probe.city}}
                 )
+            except BaseException:
+                await self._pool.dispose(env)
+                raise
+            await self._finish_environment(env, session)
+            run = replace(run, phases=env.timeline.phases())
+            await self._add_phases(group, case, env.timeline)
 
             asyncio.create_task(self._sink.send_data(detailed_group, case, run))
-            await self._wait_delay_interval()
+            return True, run
         except errors.TestGroupError as e:
             log.error("Test group failed: {}\n{}".format(type(e), e))
-            await self._add_failing_group(group)
+            await self._add_failing_group(group, e)
 
         except errors.TestCaseError as e:
             log.error("Test case failed: {}\n{}".format(type(e), e))
-            await self._add_failing_case(case)
+            await self._add_failing_case(group, case, e)
 
         except errors.TestRunError as e:
             log.error("Test run failed: {}\n{}".format(type(e), e))
-            await self._fail_run(group, case)
-            await self._wait_delay_interval()
+            await self._fail_run(group, case, e)
+            return True, None
+        return False, None
 
     async def _clear_fails(self):
         async with self._clock.writer:
@@ -293,4 +780,12 @@ class Runner:
                 group.failing = False
                 for case in group.cases:
                     case.fail_count = 0
-            self._failing_cases = set()
+                self._refresh_group(group)
+
+
+def _load_average() -> float:
+    """Host 1 minute load average, containers share the host's."""
+    try:
+        return round(os.getloadavg()[0], 2)
+    except OSError:
+        return None
@@ -0,0 +1,213 @@
+import heapq
+import random
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+from .model import *
+from vpnspeed import log
+
+
+Option = Tuple[TestGroup, TestCase]
+
+# Selection methods
+LEAST_RUNNED = "least_runned"
+# Least runs in the current hour of day first, so every hour gets comparable
+# samples, total runs break ties
+HOURLY = "hourly"
+METHODS = (LEAST_RUNNED, HOURLY)
+
+# How many random picks are tried before filtering the whole bucket
+_SKIP_ATTEMPTS = 8
+
+
+def _runs(case: Case) -> int:
+    # In flight runs are counted as done, so parallel workers keep groups even
+    return case.run_count + case.running
+
+
+class _RunCounter:
+    """Multiset of run counts with O(log n) minimum lookup."""
+
+    def __init__(self):
+        self._counts: Dict[Any, int] = dict()
+        self._heap: List[Any] = []
+
+    def __len__(self) -> int:
+        return len(self._counts)
+
+    def add(self, runs):
+        count = self._counts.get(runs, 0)
+        if count == 0:
+            heapq.heappush(self._heap, runs)
+        self._counts[runs] = count + 1
+
+    def remove(self, runs):
+        count = self._counts[runs] - 1
+        if count == 0:
+            del self._counts[runs]
+        else:
+            self._counts[runs] = count
+
+    def min(self) -> Optional[Any]:
+        # Entries of removed run counts are dropped lazily
+        while self._heap and self._heap[0] not in self._counts:
+            heapq.heappop(self._heap)
+        if len(self._heap) > 2 * len(self._counts) + 16:
+            self._heap = list(self._counts)
+            heapq.heapify(self._heap)
+        return self._heap[0] if self._heap else None
+
+
+class _OptionSet:
+    """Set with O(1) add, discard and random choice."""
+
+    def __init__(self):
+        self._items: List[Hashable] = []
+        self._positions: Dict[Hashable, int] = dict()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def add(self, item: Hashable):
+        if item not in self._positions:
+            self._positions[item] = len(self._items)
+            self._items.append(item)
+
+    def discard(self, item: Hashable):
+        position = self._positions.pop(item, None)
+        if position is None:
+            return
+        last = self._items.pop()
+        if position < len(self._items):
+            self._items[position] = last
+            self._positions[last] = position
+
+    def choice(self) -> Hashable:
+        return random.choice(self._items)
+
+
+class SchedulerIndex:
+    """
+    Incremental index of least runned test options.
+
+    Keeps the same semantics as scanning all groups: uneven groups go first,
+    then the least run count among non failing groups, ties are broken at
+    random. Groups are referenced, not copied, and must be passed to
+    `update` after any change to their cases, so selection stays O(log n).
+
+    With `hour` set, runs are counted in that hour of day only and total
+    runs break ties, see `HOURLY`.
+    """
+
+    _groups: Dict[TestGroup, Group]
+    # Contribution of each group: (uneven, [(runs, option or None)])
+    _entries: Dict[TestGroup, Tuple[bool, List[Tuple[Any, Option]]]]
+    # Indexed by "group is uneven"
+    _runs: Dict[bool, _RunCounter]
+    _options: Dict[bool, Dict[Any, _OptionSet]]
+    _hour: Optional[int]
+
+    def __init__(self, groups: Iterable[Group] = (), hour: int = None):
+        self._groups = dict()
+        self._hour = hour
+        self._clear()
+        for group in groups:
+            self.update(group)
+
+    def __len__(self) -> int:
+        return len(self._groups)
+
+    @property
+    def hour(self) -> Optional[int]:
+        return self._hour
+
+    def set_hour(self, hour: Optional[int]):
+        """Switch hour of day runs are counted in, None counts all runs."""
+        if hour == self._hour:
+            return
+        self._hour = hour
+        self._clear()
+        for group in self._groups.values():
+            self.update(group)
+
+    def _clear(self):
+        self._entries = dict()
+        self._runs = {False: _RunCounter(), True: _RunCounter()}
+        self._options = {False: dict(), True: dict()}
+
+    def _key(self, case: Case):
+        if self._hour is None:
+            return _runs(case)
+        return (case.runs_by_hour[self._hour] + case.running, _runs(case))
+
+    def update(self, group: Group):
+        """Add group or refresh it after its cases changed."""
+        self._discard(group.group)
+        self._groups[group.group] = group
+        # Resolved and blocked cases must not hold others back
+        cases = [
+            case for case in group.cases if not case.resolved and not case.blocked
+        ]
+        if group.failing or not cases:
+            return
+
+        runs = [self._key(case) for case in cases]
+        # Evenness is judged by the primary count only
+        primary = [key[0] if self._hour is not None else key for key in runs]
+        uneven = min(primary) != max(primary)
+        contribution = []
+        for case, case_runs in zip(cases, runs):
+            option = None
+            if case.fail_count >= 0 and case.running == 0:
+                option = (group.group, case.case)
+            contribution.append((case_runs, option))
+            for key in (False, True) if uneven else (False,):
+                self._runs[key].add(case_runs)
+                if option is not None:
+                    self._options[key].setdefault(case_runs, _OptionSet()).add(option)
+        self._entries[group.group] = (uneven, contribution)
+
+    def remove(self, test_group: TestGroup):
+        self._discard(test_group)
+        self._groups.pop(test_group, None)
+
+    def select(self, skip: Callable[[TestGroup, TestCase], bool] = None) -> Option:
+        log.info("Selecting least runned group...")
+        uneven = len(self._runs[True]) > 0
+        min_runs = self._runs[uneven].min()
+        if min_runs is None:
+            log.info("No groups to select from")
+            return None
+
+        options = self._options[uneven].get(min_runs)
+        if not options:
+            log.info("Group options is: 0")
+            return None
+        if skip is None:
+            return options.choice()
+
+        for _ in range(min(len(options), _SKIP_ATTEMPTS)):
+            option = options.choice()
+            if not skip(*option):
+                return option
+        remaining = [option for option in options if not skip(*option)]
+        if len(remaining) == 0:
+            log.info("Group options is: 0")
+            return None
+        return random.choice(remaining)
+
+    def _discard(self, test_group: TestGroup):
+        entry = self._entries.pop(test_group, None)
+        if entry is None:
+            return
+        uneven, contribution = entry
+        for case_runs, option in contribution:
+            for key in (False, True) if uneven else (False,):
+                self._runs[key].remove(case_runs)
+                if option is None:
+                    continue
+                options = self._options[key][case_runs]
+                options.discard(option)
+                if len(options) == 0:
+                    del self._options[key][case_runs]
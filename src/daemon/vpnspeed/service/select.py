@@ -1,49 +1,24 @@
-import random
+from datetime import datetime
+from typing import Callable
 from .model import *
-from vpnspeed import log
-
-
-def _all_equal(iterator):
-    iterator = iter(iterator)
-    try:
-        first = next(iterator)
-    except StopIteration:
-        return True
-    return all(first == rest for rest in iterator)
-
-
-def _select_least_runned_in_group(groups: List[Group]) -> (TestGroup, TestCase):
-    log.info("Selecting least runned group...")
-    groups_runs = [
-        (group, min(case.run_count for case in group.cases))
-        for group in groups
-        if not group.failing
-    ]
-    if len(groups_runs) == 0:
-        log.info("Group run is: {}".format(len(groups_runs)))
-        return None
-
-    uneven = [
-        (group, runs)
-        for group, runs in groups_runs
-        if not _all_equal(case.run_count for case in group.cases)
-    ]
-    if len(uneven) > 0:
-        groups_runs = uneven
-
-    min_runs = min(runs for _, runs in groups_runs)
-
-    options = [
-        (group.group, case.case)
-        for group, runs in groups_runs
-        for case in group.cases
-        if case.run_count == min_runs and case.fail_count >= 0
-    ]
-    if len(options) == 0:
-        log.info("Group options is: {}".format(len(options)))
-        return None
-    return random.choice(options)
-
-
-def select(groups: List[Group], *, method: str = None) -> (TestGroup, TestCase):
-    return _select_least_runned_in_group(groups)
+from .scheduler import SchedulerIndex, HOURLY
+
+
+def select(
+    groups: List[Group],
+    *,
+    method: str = None,
+    skip: Callable[[TestGroup, TestCase], bool] = None
+) -> (TestGroup, TestCase):
+    """
+    Select next (TestGroup, TestCase) to run.
+
+    `skip` excludes options that can not be started right now (e.g. concurrency
+    limit reached), without affecting least runned fairness. `method` is one
+    of `scheduler.METHODS`, `hourly` balances runs in the current UTC hour.
+
+    Builds a throwaway index, long running callers should keep their own
+    `SchedulerIndex` updated instead.
+    """
+    hour = datetime.utcnow().hour if method == HOURLY else None
+    return SchedulerIndex(groups, hour=hour).select(skip)
@@ -6,16 +6,32 @@ from typing import List, Set, Dict, Tuple
 
 from vpnspeed import log, errors
 from vpnspeed.probe import make_probe
-from vpnspeed.constans import DEFAULT_TESTING_INTERVAL
+from vpnspeed.geoip import geo_resolver
+from vpnspeed.egress import DEFAULT_IP_ECHO, egress_detector
+from vpnspeed.constans import (
+    DEFAULT_TESTING_INTERVAL,
+    DEFAULT_CONCURRENCY,
+    DEFAULT_SERVER_CHOICE,
+    DEFAULT_TESTER,
+)
 from vpnspeed.datasink import DataSink, DynamicDataSink, DynamicDataBackup, MasterSink
 from vpnspeed.vpn import DynamicVPN
-from vpnspeed.tester import Tester, SpeedTestCliTester
+from vpnspeed.container import (
+    container_registry,
+    docker_clients,
+    image_registry,
+    images_for,
+)
+from vpnspeed.container.registry import DEFAULT_CONTAINERS_PATH
+from vpnspeed.tester import Tester, DynamicTester, server_catalogue
 from vpnspeed.reporting import *
 
 from .model import *
 from .diff import *
 from .select import select
 from .runner import Runner
+from .scheduler import LEAST_RUNNED
+from .breaker import CircuitBreakers, DEFAULT_BREAKERS_PATH
 
 
 class Service:
@@ -32,12 +48,17 @@ class Service:
     _runner: Runner
 
     def __init__(self, tester: Tester = None):
-        self._tester = tester or SpeedTestCliTester()
+        self._tester = tester or DynamicTester()
         self._clock = RWLock()
         self._probe = None
         self._vpn = DynamicVPN()
         self._sink = MasterSink()
-        self._runner = Runner(self._vpn, self._tester, self._sink)
+        self._runner = Runner(
+            self._vpn,
+            self._tester,
+            self._sink,
+            breakers=CircuitBreakers(DEFAULT_BREAKERS_PATH),
+        )
 
     async def make_report(
         self, path: str, filter_: ReportFilter = ReportFilter.default()
@@ -60,9 +81,18 @@ class Service:
                 }
             )
             c.groups = await self._runner.get_groups()
+            c.pool_stats = await self._runner.get_pool_stats()
+            c.docker_stats = docker_clients.stats()
+            c.breakers = await self._runner.get_breakers()
+            c.images = image_registry.status()
+            c.containers = container_registry.stats()
+            c.egress = egress_detector.stats()
+            c.servers = server_catalogue.stats()
             return c
 
     async def start(self, context: Context = None):
+        # Containers of a killed daemon are removed before new ones start
+        await container_registry.start(DEFAULT_CONTAINERS_PATH)
         async with self._clock.writer:
             self._probe = await make_probe()
             if context:
@@ -75,9 +105,24 @@ class Service:
                         mode=Mode.continuous,
                         repeats=1,
                         interval=DEFAULT_TESTING_INTERVAL,
+                        interval_policy=IntervalPolicy(name="fixed"),
+                        concurrency=DEFAULT_CONCURRENCY,
+                        vpn_concurrency={},
+                        technology_concurrency={},
+                        prefetch=0,
+                        pool=Pool(enabled=False),
+                        resources=Resources(),
+                        adaptive=Adaptive(),
+                        scheduling=LEAST_RUNNED,
+                        ip_echo=list(DEFAULT_IP_ECHO),
+                        server_choice=DEFAULT_SERVER_CHOICE,
+                        tester=DEFAULT_TESTER,
+                        iperf3=Iperf3(),
                     ),
                 )
             await self._sink.set_probe(self._probe)
+            await self._runner.set_probe(self._probe)
+            await server_catalogue.set_backup(self._sink.backup)
 
     async def update(self, context: Context, context_config_update: bool = False):
         """Update internal state based on context differences."""
@@ -92,15 +137,45 @@ class Service:
                         mode=Mode.continuous,
                         repeats=1,
                         interval=DEFAULT_TESTING_INTERVAL,
+                        interval_policy=IntervalPolicy(name="fixed"),
+                        concurrency=DEFAULT_CONCURRENCY,
+                        vpn_concurrency={},
+                        technology_concurrency={},
+                        prefetch=0,
+                        pool=Pool(enabled=False),
+                        resources=Resources(),
+                        adaptive=Adaptive(),
+                        scheduling=LEAST_RUNNED,
+                        ip_echo=list(DEFAULT_IP_ECHO),
+                        server_choice=DEFAULT_SERVER_CHOICE,
+                        tester=DEFAULT_TESTER,
+                        iperf3=Iperf3(),
                     ),
                 )
                 self._context, actions = diff_context(self._context, default_context)
                 await self.execute(actions)
                 self._context, actions = diff_context(self._context, context)
             await self._runner.set_context_params(
-                self._context.config.interval, self._context.config.common_cities
+                self._context.config.interval,
+                self._context.config.common_cities,
+                self._context.config.concurrency,
+                self._context.config.vpn_concurrency,
+                self._context.config.technology_concurrency,
+                self._context.config.prefetch,
+                self._context.config.pool,
+                self._context.config.adaptive,
+                self._context.config.interval_policy,
+                self._context.config.scheduling,
+                self._context.config.resources,
             )
+            egress_detector.set_endpoints(self._context.config.ip_echo)
+            server_catalogue.set_choice(self._context.config.server_choice)
+            self._tester.configure(self._context.config)
+            # Pulled in the background, runs wait only for images they need
+            image_registry.prefetch(images_for(self._context.config.vpns))
             await self.execute(actions)
+            # Backup may have changed with the sinks
+            await server_catalogue.set_backup(self._sink.backup)
             if self._context.probe is not None:
                 await self._sink.set_probe(
                     Probe(
@@ -130,6 +205,10 @@ class Service:
 
     async def _quit(self, _=None):
         await self._stop()
+        await image_registry.close()
+        await container_registry.close()
+        await docker_clients.close()
+        geo_resolver.close()
         asyncio.get_event_loop().stop()
 
     async def _start(self, _=None):
@@ -166,12 +245,15 @@ class Service:
 
     async def _add_vpns(self, act: AddVPNs):
         await self._vpn.add_providers(act.vpns)
+        await self._runner.invalidate_prepared()
 
     async def _update_vpns(self, act: UpdateVPNs):
         await self._vpn.update_providers(act.vpns)
+        await self._runner.invalidate_prepared()
 
     async def _remove_vpns(self, act: RemoveVPNs):
         await self._vpn.remove_providers(act.vpns)
+        await self._runner.invalidate_prepared()
 
 
 _ACTION_MAP = {
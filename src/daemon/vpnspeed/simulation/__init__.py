@@ -0,0 +1,13 @@
+from .clock import VirtualClockLoop
+from .echo import EchoServer
+from .fakes import (
+    Latency,
+    Profile,
+    FakeContainerEnvironment,
+    FakeExecStream,
+    FakeGeoBackend,
+    FakeVPNProvider,
+    FakeTester,
+    FakeSink,
+)
+from .harness import Simulation, SimulationReport
@@ -0,0 +1,60 @@
+import argparse
+import logging
+from dataclasses import asdict
+
+from vpnspeed.model import Pool, TestCase, TestGroup
+from vpnspeed.service.scheduler import METHODS, LEAST_RUNNED
+from . import Simulation
+
+
+def _main():
+    parser = argparse.ArgumentParser(
+        description="Simulate test scheduling without Docker and VPN providers"
+    )
+    parser.add_argument("--groups", type=int, default=100)
+    parser.add_argument("--providers", type=int, default=3)
+    parser.add_argument("--days", type=float, default=7)
+    parser.add_argument("--interval", type=int, default=180)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--prefetch", type=int, default=0)
+    parser.add_argument("--pool", action="store_true")
+    parser.add_argument(
+        "--share-images",
+        action="store_true",
+        help="Pooled containers are shared by providers of the same image",
+    )
+    parser.add_argument("--scheduling", choices=METHODS, default=LEAST_RUNNED)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "-l",
+        "--log-level",
+        default="critical",
+        choices=["critical", "error", "warning", "info", "debug", "notset"],
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging._nameToLevel.get(args.log_level.upper()))
+
+    simulation = Simulation(
+        groups={
+            TestGroup(vpn_country="c{}".format(i), target_country="t{}".format(i))
+            for i in range(args.groups)
+        },
+        cases={
+            TestCase(vpn="provider{}".format(i), technology=technology)
+            for i in range(args.providers)
+            for technology in ("openvpn", "wireguard")
+        },
+        seed=args.seed,
+        interval=args.interval,
+        concurrency=args.concurrency,
+        prefetch=args.prefetch,
+        pool=Pool(share_images=args.share_images) if args.pool else None,
+        scheduling=args.scheduling,
+    )
+    report = simulation.run(args.days * 24 * 3600)
+    for key, value in asdict(report).items():
+        print("{}: {}".format(key, value))
+
+
+if __name__ == "__main__":
+    _main()
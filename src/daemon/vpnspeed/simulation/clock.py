@@ -0,0 +1,39 @@
+import asyncio
+import selectors
+
+
+class _VirtualSelector(selectors.DefaultSelector):
+    """Instead of blocking until the next timer, jumps the clock to it."""
+
+    def __init__(self, loop: "VirtualClockLoop"):
+        super().__init__()
+        self._loop = loop
+
+    def select(self, timeout=None):
+        events = super().select(0)
+        if events or timeout == 0:
+            return events
+        if timeout is None:
+            raise RuntimeError("Simulation stalled, nothing is scheduled")
+        self._loop.advance(timeout)
+        return []
+
+
+class VirtualClockLoop(asyncio.SelectorEventLoop):
+    """
+    Event loop with virtual time.
+
+    Sleeps and timeouts complete instantly in wall time, so days of scheduling
+    run in seconds. Only callbacks and timers are supported, code waiting on
+    real I/O or threads stalls the simulation.
+    """
+
+    def __init__(self, start: float = 0.0):
+        self._virtual_time = start
+        super().__init__(selector=_VirtualSelector(self))
+
+    def time(self) -> float:
+        return self._virtual_time
+
+    def advance(self, seconds: float):
+        self._virtual_time += seconds
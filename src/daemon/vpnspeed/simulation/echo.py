@@ -0,0 +1,71 @@
+import asyncio
+from dataclasses import dataclass
+from typing import Dict
+
+from aiohttp import web
+
+
+@dataclass
+class EchoEndpoint:
+    ip: str
+    delay: float = 0.0
+    status: int = 200
+
+
+class EchoServer:
+    """
+    Local stand-in for IP echo endpoints, see `vpnspeed.egress`.
+
+    Every path is an endpoint answering with the server IP in plain text,
+    single endpoints can be made slow, failing or answer another IP.
+    """
+
+    requests: Dict[str, int]
+
+    def __init__(self, ip: str = "192.0.2.1", host: str = "127.0.0.1"):
+        self._ip = ip
+        self._host = host
+        self._endpoints: Dict[str, EchoEndpoint] = dict()
+        self._runner = None
+        self.port = None
+        self.requests = dict()
+
+    async def start(self) -> "EchoServer":
+        app = web.Application()
+        app.router.add_get("/{name}", self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self._host, 0)
+        await site.start()
+        self.port = self._runner.addresses[0][1]
+        return self
+
+    async def close(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def __aenter__(self) -> "EchoServer":
+        return await self.start()
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    def url(self, name: str = "ip") -> str:
+        return "http://{}:{}/{}".format(self._host, self.port, name)
+
+    def set(
+        self, name: str, ip: str = None, delay: float = 0.0, status: int = 200
+    ) -> str:
+        """Configure endpoint `name`, returns its URL."""
+        self._endpoints[name] = EchoEndpoint(ip or self._ip, delay, status)
+        return self.url(name)
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        name = request.match_info["name"]
+        self.requests[name] = self.requests.get(name, 0) + 1
+        endpoint = self._endpoints.get(name) or EchoEndpoint(self._ip)
+        await asyncio.sleep(endpoint.delay)
+        if endpoint.status != 200:
+            return web.Response(status=endpoint.status, text="error\n")
+        return web.Response(text=endpoint.ip + "\n")
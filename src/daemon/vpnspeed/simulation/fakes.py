@@ -0,0 +1,405 @@
+import asyncio
+import hashlib
+import ipaddress
+import random
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Dict, List, Optional, Set
+
+from vpnspeed import errors
+from vpnspeed.model import *
+from vpnspeed.utils import cc_to_iso
+from vpnspeed.geoip import GeoBackend, GeoLocation
+from vpnspeed.tester import Tester
+from vpnspeed.timeline import Timeline
+from vpnspeed.container.stream import STDOUT, ExecOutput
+from vpnspeed.vpn.interfaces import VPNProvider
+
+
+_HOST_IP = "192.0.2.1"
+# First of simulated VPN egress IPs
+_EGRESS_IPS = "198.18.0.1"
+_HOST_ROUTE = "1.1.1.1 via 172.17.0.1 dev eth0 src 172.17.0.2"
+_TUNNEL_ROUTE = "1.1.1.1 dev tun0 src 10.8.0.2"
+
+
+@dataclass
+class Latency:
+    """Normally distributed duration in seconds, never negative."""
+
+    mean: float = 0.0
+    jitter: float = 0.0
+
+    def sample(self, rng: random.Random) -> float:
+        return max(rng.gauss(self.mean, self.jitter), 0.0)
+
+
+@dataclass
+class Profile:
+    """Latencies and failure probabilities of the simulated backends."""
+
+    container_start: Latency = field(default_factory=lambda: Latency(3, 1))
+    exec: Latency = field(default_factory=lambda: Latency(0.05, 0.02))
+    probe: Latency = field(default_factory=lambda: Latency(0.5, 0.2))
+    login: Latency = field(default_factory=lambda: Latency(2, 0.5))
+    connect: Latency = field(default_factory=lambda: Latency(3, 1))
+    tunnel: Latency = field(default_factory=lambda: Latency(2, 1))
+    test: Latency = field(default_factory=lambda: Latency(25, 5))
+    start_failure: float = 0.01
+    login_failure: float = 0.01
+    connect_failure: float = 0.03
+    tunnel_failure: float = 0.02
+    probe_failure: float = 0.01
+    test_failure: float = 0.02
+    # Technologies every simulated provider supports
+    technologies: List[str] = field(
+        default_factory=lambda: ["openvpn", "wireguard", "ipsec/ikev2"]
+    )
+
+
+class FakeContainerEnvironment:
+    """
+    In memory stand-in for `ContainerEnvironment`.
+
+    Emulates the commands the runner relies on: IP checker requests, route
+    lookups and route change waits, file reads and writes.
+    """
+
+    def __init__(
+        self,
+        vpn: str,
+        technology: str = "none",
+        instance: int = None,
+        resources: Resources = None,
+        *,
+        profile: Profile,
+        rng: random.Random,
+        geo: "FakeGeoBackend",
+    ):
+        self._vpn = vpn
+        self._technology = technology
+        self._instance = instance
+        self._profile = profile
+        self._rng = rng
+        self._geo = geo
+        self.timeline = Timeline()
+        self.resources = resources
+        self._files: Dict[str, str] = {"/etc/resolv.conf": "nameserver 192.0.2.53\n"}
+        self._location: TestGroup = None
+        self._tunnel = asyncio.Event()
+        self._error_message = None
+        self.started = False
+
+    @property
+    def name(self) -> str:
+        name = "{}_{}".format(self._vpn, self._technology.replace("/", "-"))
+        if self._instance is not None:
+            name += "_{}".format(self._instance)
+        return name
+
+    def get_error_message(self) -> str:
+        return self._error_message
+
+    async def start(self):
+        await asyncio.sleep(self._profile.container_start.sample(self._rng))
+        if self._rng.random() < self._profile.start_failure:
+            self._error_message = "Simulated container start failure"
+        self.started = True
+        return self
+
+    async def stop(self):
+        self.tunnel_down()
+        self.started = False
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.stop()
+
+    def tunnel_up(self, location: TestGroup):
+        self._location = location
+        self._tunnel.set()
+
+    def tunnel_down(self):
+        self._location = None
+        self._tunnel.clear()
+
+    async def exec(
+        self,
+        cmd: str,
+        args=None,
+        output: bool = False,
+        timeout: int = 600,
+        resp_json: bool = False,
+        allow_error: bool = False,
+        user: str = "root",
+    ) -> list:
+        args = args if isinstance(args, list) else [args]
+        try:
+            return await asyncio.wait_for(self._exec(cmd, args), timeout)
+        except asyncio.TimeoutError:
+            return [-1, "timeout"]
+
+    async def _exec(self, cmd: str, args: list) -> list:
+        await asyncio.sleep(self._profile.exec.sample(self._rng))
+        if cmd == "bash":
+            return [0, self._route()]
+        if cmd == "timeout":
+            return await self._wait_route_change(float(args[0]))
+        if cmd == "cat":
+            content = self._files.get(args[0])
+            return [0, content] if content is not None else [-1, None]
+        if cmd == "write_to_file":
+            self._files[args[1]] = args[0]
+        return [0, ""]
+
+    def stream_exec(
+        self, cmd: str, args=None, timeout: float = 600, user: str = "root"
+    ) -> "FakeExecStream":
+        return FakeExecStream(self._stream(cmd, args or []), timeout)
+
+    async def _stream(self, cmd: str, args: list) -> AsyncIterator[ExecOutput]:
+        await asyncio.sleep(self._profile.exec.sample(self._rng))
+        if cmd == "bash" and "egress" in args:
+            # First endpoint answers, see `vpnspeed.egress`
+            url = args[args.index("egress") + 3]
+            started = asyncio.get_event_loop().time()
+            status, ip = await self._ip_checker()
+            yield ExecOutput(
+                STDOUT,
+                "{} {} {} {:.3f}".format(
+                    url,
+                    0 if status == 0 else 7,
+                    ip or "",
+                    asyncio.get_event_loop().time() - started,
+                ),
+            )
+
+    async def read_file(self, name: str) -> str:
+        return (await self.exec("cat", name, output=True))[1]
+
+    async def write_file(self, name: str, data: str):
+        await self.exec("write_to_file", [data, name])
+
+    async def write_files(self, files: Dict[str, str], mode: int = 0o600) -> bool:
+        await asyncio.sleep(self._profile.exec.sample(self._rng))
+        self._files.update(files)
+        return True
+
+    def _route(self) -> str:
+        return _TUNNEL_ROUTE if self._tunnel.is_set() else _HOST_ROUTE
+
+    async def _wait_route_change(self, timeout: float) -> list:
+        try:
+            await asyncio.wait_for(self._tunnel.wait(), timeout)
+            return [0, "ready"]
+        except asyncio.TimeoutError:
+            return [-1, None]
+
+    async def _ip_checker(self) -> list:
+        await asyncio.sleep(self._profile.probe.sample(self._rng))
+        if self._rng.random() < self._profile.probe_failure:
+            return [-1, None]
+        if self._location is None:
+            return [0, _HOST_IP]
+        country = self._location.vpn_country
+        country = "de" if country in (None, "auto") else country
+        city = self._location.vpn_city or "{}-city".format(country)
+        return [0, self._geo.address(cc_to_iso(country), country, city)]
+
+
+class FakeExecStream:
+    """Output lines of a simulated command, see `ExecStream`."""
+
+    returncode: int = None
+
+    def __init__(self, lines: AsyncIterator[ExecOutput], timeout: float):
+        self._lines = lines
+        self._timeout = timeout
+
+    def __aiter__(self) -> AsyncIterator[ExecOutput]:
+        return self._read()
+
+    async def __aenter__(self) -> "FakeExecStream":
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self._lines.aclose()
+
+    async def _read(self) -> AsyncIterator[ExecOutput]:
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + self._timeout
+        while True:
+            try:
+                output = await asyncio.wait_for(
+                    self._lines.__anext__(), max(deadline - loop.time(), 0)
+                )
+            except StopAsyncIteration:
+                break
+            yield output
+        self.returncode = 0
+
+
+class FakeGeoBackend(GeoBackend):
+    """Locations of simulated egress IPs, one IP per location."""
+
+    name = "simulation"
+
+    def __init__(self):
+        self._ips: Dict[tuple, str] = {}
+        self._locations: Dict[str, GeoLocation] = {}
+        self.address("LT", "Lithuania", "Vilnius", ip=_HOST_IP)
+
+    def address(
+        self, country_code: str, country: str, city: str, ip: str = None
+    ) -> str:
+        key = (country_code, country, city)
+        if key not in self._ips:
+            ip = ip or str(ipaddress.ip_address(_EGRESS_IPS) + len(self._ips))
+            self._ips[key] = ip
+            self._locations[ip] = GeoLocation(
+                ip=ip,
+                country_code=country_code,
+                country=country,
+                city=city,
+                provider=self.name,
+            )
+        return self._ips[key]
+
+    async def locate(self, ip: str) -> Optional[GeoLocation]:
+        return self._locations.get(ip)
+
+
+class FakeVPNProvider(VPNProvider):
+    """Provider which brings up simulated tunnel in `FakeContainerEnvironment`."""
+
+    def __init__(
+        self,
+        name: str = "fake",
+        creds: VPNCredentials = None,
+        *,
+        profile: Profile = None,
+        rng: random.Random = None,
+    ):
+        self._name = name
+        self._profile = profile or Profile()
+        self._rng = rng or random.Random(0)
+        self._env = None
+
+    def get_name(self) -> str:
+        return self._name
+
+    @classmethod
+    def get_technologies(cls) -> List[VPNTechnology]:
+        return [VPNTechnology(name=tech) for tech in Profile().technologies]
+
+    async def login(self, env: FakeContainerEnvironment, creds: VPNCredentials = None):
+        await asyncio.sleep(self._profile.login.sample(self._rng))
+        if self._rng.random() < self._profile.login_failure:
+            raise errors.VPNBadCredentials("Simulated login failure")
+
+    async def connect(
+        self, env: FakeContainerEnvironment, group: TestGroup, case: TestCase
+    ):
+        if case.technology not in self._profile.technologies:
+            raise errors.TechnologyNotSupported()
+        self._env = env
+        await asyncio.sleep(self._profile.connect.sample(self._rng))
+        if self._rng.random() < self._profile.connect_failure:
+            raise errors.ProviderServerNotFound("Simulated connect failure")
+        if self._rng.random() < self._profile.tunnel_failure:
+            # Connected, but the tunnel never passes traffic
+            return
+        asyncio.get_event_loop().call_later(
+            self._profile.tunnel.sample(self._rng), env.tunnel_up, group
+        )
+
+    async def disconnect(self):
+        if self._env is not None:
+            self._env.tunnel_down()
+            self._env = None
+
+    async def get_cities(self, country: str) -> set:
+        return {"{}-city".format(country)}
+
+
+class FakeTester(Tester):
+    """
+    Produces `TestRun`s with stable per (group, case) speed plus noise.
+
+    Timestamps follow the event loop clock from `start`, so runs under
+    a virtual clock look like they were spread over real time.
+    """
+
+    def __init__(
+        self,
+        profile: Profile = None,
+        rng: random.Random = None,
+        start: datetime = datetime(2021, 1, 1),
+    ):
+        self._profile = profile or Profile()
+        self._rng = rng or random.Random(0)
+        self._start = start
+
+    def now(self) -> datetime:
+        return self._start + timedelta(seconds=asyncio.get_event_loop().time())
+
+    async def resolve(self, env, cgroup: TestGroup) -> TestGroup:
+        return cgroup
+
+    @staticmethod
+    def _base_bandwidth(group: TestGroup, case: TestCase) -> int:
+        digest = hashlib.sha256(repr((group, case)).encode()).digest()
+        # 5 - 130 MB/s, stable between simulations
+        return 5000000 + int.from_bytes(digest[:4], "big") % 125000000
+
+    async def test(
+        self, env: FakeContainerEnvironment, group: TestGroup, case: TestCase
+    ) -> TestRun:
+        duration = self._profile.test.sample(self._rng)
+        await asyncio.sleep(duration)
+        if self._rng.random() < self._profile.test_failure:
+            raise errors.TestRunError("Simulated speed test failure")
+
+        base = self._base_bandwidth(group, case)
+        download = int(base * self._rng.lognormvariate(0, 0.1))
+        upload = int(base * 0.4 * self._rng.lognormvariate(0, 0.1))
+        elapsed = int(duration * 1000 / 2)
+        return TestRun(
+            timestamp=self.now(),
+            ping_latency=round(self._rng.uniform(5, 80), 3),
+            ping_jitter=round(self._rng.uniform(0.1, 5), 3),
+            download_bandwidth=download,
+            download_bytes=download * elapsed // 1000,
+            download_elapsed=elapsed,
+            upload_bandwidth=upload,
+            upload_bytes=upload * elapsed // 1000,
+            upload_elapsed=elapsed,
+            isp="Simulated ISP",
+            server_ip="203.0.113.{}".format(self._rng.randint(1, 254)),
+            server_country=group.target_country,
+            server_country_code=group.target_country,
+            server_location="{}-server".format(group.target_country),
+            server_name="Simulated",
+            packet_loss=0,
+        )
+
+
+class FakeBackup:
+    async def retrieve(self, **kwargs) -> List[dict]:
+        return []
+
+
+class FakeSink:
+    """Collects sent results in memory, stands in for `MasterSink`."""
+
+    def __init__(self):
+        self.backup = FakeBackup()
+        self.runs: List[tuple] = []
+
+    async def set_probe(self, probe: Probe):
+        pass
+
+    async def send_data(self, group: TestGroup, case: TestCase, run: TestRun):
+        self.runs.append((group, case, run))
@@ -0,0 +1,151 @@
+import asyncio
+import random
+import time
+from dataclasses import dataclass, field
+from functools import partial
+from typing import List, Set
+
+from vpnspeed.model import *
+from vpnspeed.constans import DEFAULT_TESTING_INTERVAL
+from vpnspeed.service.runner import Runner
+from vpnspeed.service.breaker import CircuitBreakers
+from vpnspeed.service.scheduler import LEAST_RUNNED
+from vpnspeed.vpn import DynamicVPN
+from .clock import VirtualClockLoop
+from vpnspeed.geoip import geo_resolver
+from .fakes import (
+    Profile,
+    FakeContainerEnvironment,
+    FakeGeoBackend,
+    FakeVPNProvider,
+    FakeTester,
+    FakeSink,
+)
+
+
+@dataclass
+class SimulationReport:
+    duration: float
+    wall_time: float
+    runs: int
+    failed_runs: int
+    runs_per_hour: float
+    # Jain's fairness index of run counts over all (group, case) options
+    fairness: float
+    # Same over run counts of every option in every hour of day
+    hourly_fairness: float
+    min_runs: int
+    max_runs: int
+    # Runs served by a pooled container, by one another provider used
+    pool_reuses: int = 0
+    pool_shared: int = 0
+
+
+@dataclass
+class Simulation:
+    """
+    Replays runner scheduling against simulated backends on a virtual clock.
+
+    Same seed and parameters give the same report, which makes scheduling
+    changes comparable without Docker or VPN accounts.
+    """
+
+    groups: Set[TestGroup]
+    cases: Set[TestCase]
+    profile: Profile = field(default_factory=Profile)
+    seed: int = 0
+    mode: Mode = Mode.continuous
+    repeats: int = 1
+    interval: int = DEFAULT_TESTING_INTERVAL
+    interval_policy: IntervalPolicy = None
+    concurrency: int = 1
+    prefetch: int = 0
+    pool: Pool = None
+    scheduling: str = LEAST_RUNNED
+
+    def run(self, duration: float) -> SimulationReport:
+        """Simulate `duration` seconds of testing."""
+        loop = VirtualClockLoop()
+        geo = FakeGeoBackend()
+        backends = geo_resolver.backends
+        # Probes resolve egress IPs of simulated tunnels
+        geo_resolver.backends = [geo]
+        geo_resolver.clear()
+        try:
+            asyncio.set_event_loop(loop)
+            return loop.run_until_complete(self._run(duration, geo))
+        finally:
+            asyncio.set_event_loop(None)
+            loop.close()
+            geo_resolver.backends = backends
+            geo_resolver.clear()
+
+    async def _run(self, duration: float, geo: FakeGeoBackend) -> SimulationReport:
+        started = time.monotonic()
+        # Scheduler ties are broken with the global generator
+        random.seed(self.seed)
+        rng = random.Random(self.seed)
+
+        vpn = DynamicVPN()
+        for name in {case.vpn for case in self.cases}:
+            await vpn.add_provider(
+                name, FakeVPNProvider(name, profile=self.profile, rng=rng)
+            )
+        sink = FakeSink()
+        tester = FakeTester(self.profile, rng)
+        runner = Runner(
+            vpn,
+            tester,
+            sink,
+            environment=partial(
+                FakeContainerEnvironment, profile=self.profile, rng=rng, geo=geo
+            ),
+            breakers=CircuitBreakers(clock=asyncio.get_event_loop().time),
+            now=tester.now,
+        )
+        await runner.set_context_params(
+            self.interval,
+            False,
+            concurrency=self.concurrency,
+            prefetch=self.prefetch,
+            pool=self.pool,
+            interval_policy=self.interval_policy,
+            scheduling=self.scheduling,
+        )
+        await runner.add_cases(self.cases)
+        await runner.add_groups(self.groups)
+
+        loop = asyncio.get_event_loop()
+        begin = loop.time()
+        task = asyncio.create_task(runner.run(self.mode, self.repeats))
+        await asyncio.wait([task], timeout=duration)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        elapsed = loop.time() - begin
+
+        cases = [case for group in await runner.get_groups() for case in group.cases]
+        pool_stats = await runner.get_pool_stats()
+        counts = [case.run_count for case in cases]
+        return SimulationReport(
+            duration=round(elapsed, 3),
+            wall_time=round(time.monotonic() - started, 3),
+            runs=len(sink.runs),
+            failed_runs=sum(counts) - len(sink.runs),
+            runs_per_hour=round(len(sink.runs) * 3600 / elapsed, 3) if elapsed else 0,
+            fairness=_fairness(counts),
+            hourly_fairness=_fairness(
+                [count for case in cases for count in case.runs_by_hour]
+            ),
+            min_runs=min(counts, default=0),
+            max_runs=max(counts, default=0),
+            pool_reuses=pool_stats.reuses,
+            pool_shared=pool_stats.shared,
+        )
+
+
+def _fairness(counts: List[int]) -> float:
+    """Jain's fairness index, 1.0 when all counts are equal."""
+    squares = sum(count ** 2 for count in counts)
+    if not squares:
+        return 1.0
+    return round(sum(counts) ** 2 / (len(counts) * squares), 4)
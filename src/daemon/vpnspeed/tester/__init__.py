@@ -1,2 +1,5 @@
 from .interfaces import Tester, DummyTester
+from .dynamic import DynamicTester, TESTERS
+from .catalogue import CatalogueStats, ServerCatalogue, server_catalogue
 from .speedtestcli import SpeedTestCliTester
+from .iperf3 import Iperf3Tester
@@ -0,0 +1,198 @@
+import asyncio
+import random
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+from vpnspeed import log
+from vpnspeed.model import ServerCheck
+from vpnspeed.constans import (
+    DEFAULT_SERVER_LIST_TTL,
+    DEFAULT_SERVER_LIST_REFRESH,
+    DEFAULT_SERVER_CHECK_TTL,
+    DEFAULT_SERVER_FAILURE_TTL,
+    DEFAULT_SERVER_CHOICE,
+)
+
+
+# Server lists depend on where the tunnel exits
+CatalogueKey = Tuple[str, str, str]
+
+# Connect times also depend on the tunnel, (vpn, technology)
+Tunnel = Tuple[str, str]
+
+
+@dataclass
+class _ServerList:
+    servers: List[dict]
+    fetched: datetime
+
+
+@dataclass
+class _Ranking:
+    measured: List[Tuple[dict, float]]
+    measured_at: datetime
+
+
+@dataclass
+class CatalogueStats:
+    lists: int = 0
+    hits: int = 0
+    misses: int = 0
+    refreshes: int = 0
+    valid_servers: int = 0
+    failed_servers: int = 0
+
+
+class ServerCatalogue:
+    """
+    Speedtest server lists and reachability checks of servers.
+
+    Lists are kept by (vpn country, target country, vpn city) for `ttl`
+    seconds, once older than `refresh` they are still used but due for a
+    refresh. Passed checks are trusted for `check_ttl` seconds, failed
+    servers are skipped for `failure_ttl` seconds. Checks are saved to the
+    backup data sink and loaded from it, so they outlive the daemon.
+    Connect times of the servers of a list are kept by tunnel and reused
+    by its runs until the list is replaced, for `check_ttl` seconds at
+    most, instead of measuring the servers again on every run.
+
+    Measured servers are chosen at random among the `choice` fastest, so
+    runs do not all pile onto a single server.
+    """
+
+    _lists: Dict[CatalogueKey, _ServerList]
+    _checks: Dict[Tuple[str, int], ServerCheck]
+    _rankings: Dict[Tuple[CatalogueKey, Tunnel], _Ranking]
+
+    def __init__(
+        self,
+        ttl: float = DEFAULT_SERVER_LIST_TTL,
+        refresh: float = DEFAULT_SERVER_LIST_REFRESH,
+        check_ttl: float = DEFAULT_SERVER_CHECK_TTL,
+        failure_ttl: float = DEFAULT_SERVER_FAILURE_TTL,
+        choice: int = DEFAULT_SERVER_CHOICE,
+        now: Callable[[], datetime] = datetime.utcnow,
+        rng: random.Random = None,
+    ):
+        self._ttl = timedelta(seconds=ttl)
+        self._refresh = timedelta(seconds=refresh)
+        self._check_ttl = timedelta(seconds=check_ttl)
+        self._failure_ttl = timedelta(seconds=failure_ttl)
+        self._choice = choice
+        self._now = now
+        self._rng = rng or random.Random()
+        self._lists = dict()
+        self._checks = dict()
+        self._rankings = dict()
+        self._backup = None
+        self._loaded = None
+        self._stats = CatalogueStats()
+
+    async def set_backup(self, backup):
+        """Save checks to `backup` and load the ones it has."""
+        self._backup = backup
+        if backup is None or backup is self._loaded:
+            return
+        try:
+            checks = await backup.retrieve_server_checks()
+        except Exception as e:
+            log.warning("Failed to load speedtest server checks:\n{}".format(e))
+            return
+        self._loaded = backup
+        for check in checks:
+            current = self._checks.get((check.host, check.port))
+            if current is None or current.checked < check.checked:
+                self._checks[(check.host, check.port)] = check
+        log.debug("Loaded {} speedtest server checks".format(len(checks)))
+
+    def servers(self, key: CatalogueKey) -> Optional[List[dict]]:
+        """Cached server list, None if there is none or it expired."""
+        entry = self._lists.get(key)
+        if entry is None or self._now() - entry.fetched > self._ttl:
+            self._stats.misses += 1
+            return None
+        self._stats.hits += 1
+        return entry.servers
+
+    def stale(self, key: CatalogueKey) -> bool:
+        entry = self._lists.get(key)
+        return entry is None or self._now() - entry.fetched > self._refresh
+
+    def update(self, key: CatalogueKey, servers: List[dict], refresh: bool = False):
+        if refresh:
+            self._stats.refreshes += 1
+        self._lists[key] = _ServerList(list(servers), self._now())
+        for ranked in [ranked for ranked in self._rankings if ranked[0] == key]:
+            del self._rankings[ranked]
+
+    def check(self, host: str, port: int) -> Optional[bool]:
+        """Recent check result of a server, None if it should be checked."""
+        check = self._checks.get((host, int(port)))
+        if check is None:
+            return None
+        ttl = self._check_ttl if check.valid else self._failure_ttl
+        if self._now() - check.checked > ttl:
+            return None
+        return check.valid
+
+    def record(self, host: str, port: int, valid: bool):
+        check = ServerCheck(host=host, port=int(port), valid=valid, checked=self._now())
+        self._checks[(check.host, check.port)] = check
+        if self._backup is not None:
+            asyncio.create_task(self._save(self._backup, check))
+
+    def ranking(
+        self, key: CatalogueKey, tunnel: Tunnel
+    ) -> Optional[List[Tuple[dict, float]]]:
+        """
+        Recent connect times of servers of `key` through `tunnel`, None if
+        they should be measured. Servers that failed since are left out.
+        """
+        entry = self._rankings.get((key, tunnel))
+        if entry is None or self._now() - entry.measured_at > self._check_ttl:
+            return None
+        measured = [
+            (server, rtt)
+            for server, rtt in entry.measured
+            if self.check(server["host"], server["port"]) is not False
+        ]
+        return measured or None
+
+    def rank(
+        self, key: CatalogueKey, tunnel: Tunnel, measured: List[Tuple[dict, float]]
+    ):
+        self._rankings[(key, tunnel)] = _Ranking(list(measured), self._now())
+
+    def set_choice(self, choice: int):
+        self._choice = choice or DEFAULT_SERVER_CHOICE
+
+    def choose(
+        self, measured: List[Tuple[dict, float]]
+    ) -> Optional[Tuple[dict, float]]:
+        """One of the `choice` servers with the lowest connect time."""
+        if not measured:
+            return None
+        fastest = sorted(measured, key=lambda server: server[1])[: self._choice]
+        return self._rng.choice(fastest)
+
+    def stats(self) -> CatalogueStats:
+        checks = [self.check(host, port) for host, port in self._checks]
+        return CatalogueStats(
+            lists=len(self._lists),
+            hits=self._stats.hits,
+            misses=self._stats.misses,
+            refreshes=self._stats.refreshes,
+            valid_servers=checks.count(True),
+            failed_servers=checks.count(False),
+        )
+
+    @staticmethod
+    async def _save(backup, check: ServerCheck):
+        try:
+            await backup.save_server_check(check)
+        except Exception as e:
+            log.warning("Failed to save speedtest server check:\n{}".format(e))
+
+
+server_catalogue = ServerCatalogue()
@@ -0,0 +1,47 @@
+from typing import Dict
+
+from vpnspeed import log
+from vpnspeed.model import *
+from vpnspeed.constans import DEFAULT_TESTER
+from vpnspeed.container import ContainerEnvironment
+from .interfaces import Tester
+
+TESTERS = {}
+
+
+def dynamic_tester(cls):
+    assert issubclass(cls, Tester), f"{cls} is not subclass of {Tester}"
+    TESTERS[cls.get_name()] = cls
+    return cls
+
+
+class DynamicTester(Tester):
+    """Tester named by the `tester` config, testers are kept once made."""
+
+    _testers: Dict[str, Tester]
+
+    def __init__(self):
+        self._testers = dict()
+        self._name = DEFAULT_TESTER
+
+    @property
+    def current(self) -> Tester:
+        tester = self._testers.get(self._name)
+        if tester is None:
+            tester = self._testers[self._name] = TESTERS[self._name]()
+        return tester
+
+    def configure(self, config: Config):
+        name = config.tester or DEFAULT_TESTER
+        if name != self._name:
+            log.info("Testing with {} instead of {}".format(name, self._name))
+        self._name = name
+        self.current.configure(config)
+
+    async def resolve(self, env: ContainerEnvironment, cgroup: TestGroup) -> TestGroup:
+        return await self.current.resolve(env, cgroup)
+
+    async def test(
+        self, env: ContainerEnvironment, group: TestGroup, case: TestCase
+    ) -> TestRun:
+        return await self.current.test(env, group, case)
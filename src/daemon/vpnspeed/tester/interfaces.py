@@ -8,6 +8,9 @@ from vpnspeed.container import ContainerEnvironment
 
 
 class Tester(ABC):
+    def configure(self, config: Config):
+        """Apply tester options of `config`, nothing to apply by default."""
+
     @abstractmethod
     async def resolve(self, env: ContainerEnvironment, cgroup: TestGroup) -> TestGroup:
         raise NotImplementedError()
@@ -38,7 +41,19 @@ class DummyTester(Tester):
         )
         # await asyncio.sleep(10)
         return TestRun(
-            timestamp=str(datetime.now()),
-            download="100",
-            upload="10",
+            timestamp=datetime.now(),
+            ping_latency=10.0,
+            ping_jitter=1.0,
+            download_bandwidth=12500000,
+            download_bytes=125000000,
+            download_elapsed=10000,
+            upload_bandwidth=1250000,
+            upload_bytes=12500000,
+            upload_elapsed=10000,
+            isp="dummy",
+            server_ip="127.0.0.1",
+            server_country=group.target_country,
+            server_country_code=group.target_country,
+            server_location="dummy",
+            server_name=group.target_server,
         )
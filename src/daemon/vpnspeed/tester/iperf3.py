@@ -0,0 +1,236 @@
+import asyncio
+from dataclasses import replace
+from datetime import datetime
+from statistics import mean
+from typing import List, Optional, Tuple
+
+from vpnspeed import log
+from vpnspeed.errors import *
+from vpnspeed.model import *
+from vpnspeed.constans import (
+    DEFAULT_IPERF3_PORT,
+    DEFAULT_IPERF3_STREAMS,
+    DEFAULT_IPERF3_DURATION,
+    DEFAULT_IPERF3_BITRATE,
+    DEFAULT_IPERF3_GRACE,
+)
+from vpnspeed.probe import locate
+from vpnspeed.container import ContainerEnvironment, json_values
+from .interfaces import Tester
+from .dynamic import dynamic_tester
+
+
+_IPERF3 = "iperf3"
+
+# Errors after which the next server is tried, iperf3 serves one test at
+# a time
+_SERVER_ERRORS = ("busy", "unable to connect", "control socket")
+
+
+class _ServerError(TestRunError):
+    """iperf3 server is busy or can not be reached"""
+
+
+def parse_server(server: str) -> Tuple[str, int]:
+    """Host and port of "host", "host:port" or "[IPv6]:port"."""
+    if server.startswith("["):
+        host, _, port = server[1:].partition("]")
+        return host, int(port.lstrip(":") or DEFAULT_IPERF3_PORT)
+    if server.count(":") == 1:
+        host, port = server.split(":")
+        return host, int(port)
+    return server, DEFAULT_IPERF3_PORT
+
+
+@dynamic_tester
+class Iperf3Tester(Tester):
+    """
+    Raw tunnel throughput to self-hosted iperf3 servers.
+
+    Upload is measured with the client in the test container sending, then
+    download in reverse mode with the server sending. Servers are tried in
+    the configured order, busy or unreachable ones are skipped.
+    """
+
+    NAME = "iperf3"
+
+    _options: Iperf3
+
+    def __init__(self, options: Iperf3 = None):
+        self._options = options or Iperf3()
+
+    @classmethod
+    def get_name(cls) -> str:
+        return cls.NAME
+
+    def configure(self, config: Config):
+        self._options = config.iperf3 or Iperf3()
+
+    def _servers(self) -> List[Tuple[str, int]]:
+        servers = [parse_server(server) for server in self._options.servers or ()]
+        if not servers:
+            raise TesterServersNotFound("No iperf3 servers configured")
+        return servers
+
+    def _args(self, host: str, port: int, reverse: bool) -> List[str]:
+        # Test image has iperf3 3.6, newer options make it exit with usage
+        options = self._options
+        args = [
+            "-c",
+            host,
+            "-p",
+            str(port),
+            "-J",
+            "-P",
+            str(options.streams or DEFAULT_IPERF3_STREAMS),
+            "-t",
+            str(options.duration or DEFAULT_IPERF3_DURATION),
+        ]
+        if reverse:
+            args.append("-R")
+        if options.udp:
+            args.extend(["-u", "-b", str(options.bitrate or DEFAULT_IPERF3_BITRATE)])
+        return args
+
+    async def resolve(self, env: ContainerEnvironment, cgroup: TestGroup) -> TestGroup:
+        host, port = self._servers()[0]
+        return TestGroup(
+            vpn_country=cgroup.vpn_country,
+            target_country=cgroup.target_country,
+            target_server="{}:{}".format(host, port),
+        )
+
+    async def _run(
+        self, env: ContainerEnvironment, host: str, port: int, reverse: bool
+    ) -> dict:
+        args = self._args(host, port, reverse)
+        log.debug("Running iperf3... %s", repr(args))
+        result = None
+        duration = self._options.duration or DEFAULT_IPERF3_DURATION
+        async with env.stream_exec(
+            _IPERF3, args, timeout=duration + DEFAULT_IPERF3_GRACE
+        ) as stream:
+            try:
+                async for value in json_values(stream):
+                    if isinstance(value, dict):
+                        result = value
+            except asyncio.TimeoutError:
+                raise TestCaseError("iperf3 subprocess timeout.")
+
+        if result is not None and result.get("error"):
+            error = result["error"]
+            if any(part in error for part in _SERVER_ERRORS):
+                raise _ServerError("{}:{}: {}".format(host, port, error))
+            raise TestCaseError("iperf3 result was an error: {}".format(error))
+        if stream.returncode != 0:
+            raise TestCaseError(
+                "Exited with: {}\n{}".format(stream.returncode, "\n".join(stream.stderr))
+            )
+        if result is None:
+            raise TestCaseError("iperf3 finished without result.")
+        return result
+
+    async def _measure(
+        self, env: ContainerEnvironment
+    ) -> Tuple[str, int, dict, Optional[dict]]:
+        """Server used with its upload and download results."""
+        for host, port in self._servers():
+            try:
+                with env.timeline.phase("upload"):
+                    upload = await self._run(env, host, port, False)
+            except _ServerError as e:
+                log.info("Skipping iperf3 server {}".format(e))
+                continue
+            download = None
+            if self._options.reverse is not False:
+                with env.timeline.phase("download"):
+                    download = await self._run(env, host, port, True)
+            return host, port, upload, download
+        raise TestRunError("No iperf3 server available")
+
+    async def test(
+        self, env: ContainerEnvironment, group: TestGroup, case: TestCase
+    ) -> TestRun:
+        log.debug(
+            "Testing: {} {} => {} {} {}".format(
+                group.vpn_country,
+                group.target_country,
+                case.vpn,
+                case.technology,
+                case.protocol,
+            )
+        )
+        log.info("Starting iperf3...")
+        host, port, upload, download = await self._measure(env)
+        log.info("iperf3 completed.")
+        try:
+            result = self._result(upload, download)
+        except (KeyError, IndexError, TypeError) as e:
+            raise TestCaseError("Incomplete iperf3 data: " + str(e))
+
+        probe = await locate(result.server_ip)
+        result = replace(
+            result,
+            server_host="{}:{}".format(host, port),
+            server_name=host,
+            server_country=probe and probe.country,
+            server_country_code=probe and probe.country_code,
+            server_location=probe and probe.city,
+        )
+        log.debug("Test passed:\n\t{}".format(result))
+        return result
+
+    def _result(self, upload: dict, download: Optional[dict]) -> TestRun:
+        connected = upload["start"]["connected"][0]
+        up = _summary(upload)
+        down = download and _summary(download)
+        losses = [
+            summary["lost_percent"]
+            for summary in (up, down)
+            if summary and "lost_percent" in summary
+        ]
+        return TestRun(
+            timestamp=datetime.utcfromtimestamp(
+                upload["start"]["timestamp"]["timesecs"]
+            ),
+            ping_latency=_rtt(upload),
+            ping_jitter=(down or up).get("jitter_ms"),
+            download_bandwidth=down and _bandwidth(down),
+            download_bytes=down and down["bytes"],
+            download_elapsed=down and _elapsed(down),
+            upload_bandwidth=_bandwidth(up),
+            upload_bytes=up["bytes"],
+            upload_elapsed=_elapsed(up),
+            isp=None,
+            server_ip=connected["remote_host"],
+            server_country=None,
+            server_country_code=None,
+            server_location=None,
+            interface_internal_ip=connected["local_host"],
+            packet_loss=round(mean(losses), 3) if losses else None,
+        )
+
+
+def _summary(result: dict) -> dict:
+    """Totals of all streams, as received for TCP."""
+    end = result["end"]
+    return end.get("sum_received") or end["sum"]
+
+
+def _bandwidth(summary: dict) -> int:
+    # Bytes per second, like speedtest-cli
+    return int(summary["bits_per_second"] / 8)
+
+
+def _elapsed(summary: dict) -> int:
+    return int(summary["seconds"] * 1000)
+
+
+def _rtt(result: dict) -> Optional[float]:
+    """Mean TCP round trip time of sending streams in milliseconds."""
+    rtts = [
+        stream["sender"]["mean_rtt"]
+        for stream in result["end"].get("streams", ())
+        if "mean_rtt" in stream.get("sender", {})
+    ]
+    return round(mean(rtts) / 1000, 3) if rtts else None
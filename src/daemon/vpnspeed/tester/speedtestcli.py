@@ -3,26 +3,60 @@ import json
 import asyncio
 
 from datetime import datetime
+from typing import List, Optional, Tuple
 from vpnspeed import resources, log
 from pycountry import countries
 
 from vpnspeed.utils import cc_to_iso, iso_to_cc, try_json
 from vpnspeed.errors import *
 from vpnspeed.model import *
-from vpnspeed.constans import DEFAULT_SUBPROCESS_TIMEOUT
+from vpnspeed.constans import (
+    DEFAULT_SUBPROCESS_TIMEOUT,
+    DEFAULT_SERVER_CHECK_CONCURRENCY,
+)
 from vpnspeed.probe import make_env_probe
 from .interfaces import Tester
-from vpnspeed.container import ContainerEnvironment
+from .dynamic import dynamic_tester
+from .catalogue import CatalogueKey, ServerCatalogue, server_catalogue
+from vpnspeed.container import ContainerEnvironment, json_values
 
 
+_SPEEDTEST = "/usr/bin/speedtest"
+
+
+@dynamic_tester
 class SpeedTestCliTester(Tester):
+
+    NAME = "speedtest"
+
+    def __init__(self, catalogue: ServerCatalogue = None):
+        self._catalogue = catalogue or server_catalogue
+
+    @classmethod
+    def get_name(cls) -> str:
+        return cls.NAME
+
     async def validateTestServer(
         self, env: ContainerEnvironment, server: str, port: str
     ) -> bool:
+        return await self.measureTestServer(env, server, port) is not None
+
+    async def measureTestServer(
+        self, env: ContainerEnvironment, server: str, port: str
+    ) -> Optional[float]:
+        """Connect time to the server in milliseconds, None if it is not valid."""
         log.debug("Request: http://{}:{}/hi".format(server, port))
         status, res = await env.exec(
             "curl",
-            ["-s", "--fail", "http://{}:{}/hi".format(server, port)],
+            [
+                "-s",
+                "--fail",
+                "-o",
+                "/dev/null",
+                "-w",
+                "%{time_connect}",
+                "http://{}:{}/hi".format(server, port),
+            ],
             output=True,
             timeout=10,
         )
@@ -30,68 +64,170 @@ class SpeedTestCliTester(Tester):
             log.debug(
                 "Request failed with status: {} and message: {}".format(status, res)
             )
-            return False
-        log.debug("Request succesfull")
-        return True
+            return None
+        try:
+            rtt = round(float(res) * 1000, 3)
+        except (TypeError, ValueError):
+            log.debug("Request succesfull, unexpected connect time: {}".format(res))
+            return None
+        log.debug("Request succesfull in {}ms".format(rtt))
+        return rtt
 
-    async def resolve(self, env: ContainerEnvironment, cgroup: TestGroup) -> TestGroup:
+    def _event(self, event: dict) -> dict:
+        """Result of a speedtest-cli event if it is the final one."""
+        if not isinstance(event, dict):
+            return None
+        kind = event.get("type")
+        if "error" in event:
+            raise TestCaseError(
+                "Speedtest-cli result was an error: {}".format(event["error"])
+            )
+        if kind == "log":
+            # Errors of a stage or server are logged while the test goes on,
+            # only a missing result or exit code fails it
+            report = log.warning if event.get("level") == "error" else log.debug
+            report("Speedtest-cli log: {}".format(event.get("message")))
+        if kind in ("ping", "download", "upload"):
+            log.debug(
+                "Speedtest-cli {} {:.0%}".format(
+                    kind, (event.get(kind) or {}).get("progress", 0)
+                )
+            )
+        if kind == "result" or kind is None and "download" in event:
+            return event
+        return None
+
+    async def _fetch_servers(self, env: ContainerEnvironment) -> List[dict]:
         log.debug("Speedtest-cli fetching server list...")
         args = ["--accept-license", "--accept-gdpr", "-L", "-f", "json"]
-        returncode, stdout = await env.exec(
-            "/usr/bin/speedtest", args, output=True, resp_json=True
-        )
-        if stdout is None:
-            raise TestRunError("Speedtest cli timeout.")
+        servers = None
+        async with env.stream_exec(_SPEEDTEST, args) as stream:
+            try:
+                async for value in json_values(stream):
+                    if isinstance(value, dict) and "servers" in value:
+                        servers = value
+            except asyncio.TimeoutError:
+                raise TestRunError("Speedtest cli timeout.")
 
-        if returncode != 0:
-            raise TestRunError("Exited with: {}\n".format(returncode))
+        if stream.returncode != 0:
+            raise TestRunError(
+                "Exited with: {}\n{}".format(stream.returncode, "\n".join(stream.stderr))
+            )
 
         log.debug("Speedtest-cli server list fetched.")
-        servers = stdout
         if servers is None:
             raise TesterServersNotFound()
+        return servers["servers"]
 
-        target = None
-        target_country = cgroup.target_country and countries.get(
-            alpha_2=cc_to_iso(cgroup.target_country)
-        )
-        probe_city = (await make_env_probe(env)).city
-        target_city = probe_city if probe_city != "Unknown" else cgroup.vpn_city
-        for server in servers["servers"]:
-            if target_country is not None and server["country"] == target_country.name:
-                validServer = await self.validateTestServer(
+    async def _measure(
+        self, env: ContainerEnvironment, servers: List[dict]
+    ) -> List[Tuple[dict, float]]:
+        """
+        Servers that answer with their connect time, measured concurrently.
+        Recently failed servers are skipped.
+        """
+        limit = asyncio.Semaphore(DEFAULT_SERVER_CHECK_CONCURRENCY)
+
+        async def measure(server: dict) -> Optional[float]:
+            async with limit:
+                rtt = await self.measureTestServer(
                     env, server["host"], server["port"]
                 )
-                if not validServer:
-                    log.info(
-                        "Country: {}, server: {}:{} is not valid!".format(
-                            server["country"], server["host"], server["port"]
-                        )
+            self._catalogue.record(server["host"], server["port"], rtt is not None)
+            if rtt is None:
+                log.info(
+                    "Country: {}, server: {}:{} is not valid!".format(
+                        server["country"], server["host"], server["port"]
                     )
-                    continue
-                if target_city is None or target_city in server["location"]:
-                    target = server
-                    break
-                if target is None:
-                    target = server
-
-        if target is None:
+                )
+            return rtt
+
+        servers = [
+            server
+            for server in servers
+            if self._catalogue.check(server["host"], server["port"]) is not False
+        ]
+        rtts = await asyncio.gather(*(measure(server) for server in servers))
+        return [(server, rtt) for server, rtt in zip(servers, rtts) if rtt is not None]
+
+    async def resolve(self, env: ContainerEnvironment, cgroup: TestGroup) -> TestGroup:
+        group, _, _ = await self._resolve(env, cgroup)
+        return group
+
+    async def _resolve(
+        self, env: ContainerEnvironment, cgroup: TestGroup, case: TestCase = None
+    ) -> Tuple[TestGroup, CatalogueKey, Optional[float]]:
+        """
+        Group with the chosen server, its catalogue key and connect time if
+        it was measured by this run. Connect times measured before through
+        the tunnel of `case` are reused.
+        """
+        target_city = cgroup.vpn_city
+        if target_city is None:
+            probe_city = (await make_env_probe(env)).city
+            target_city = probe_city if probe_city != "Unknown" else None
+        key = (cgroup.vpn_country, cgroup.target_country, target_city)
+        servers = self._catalogue.servers(key)
+        if servers is None:
+            servers = await self._fetch_servers(env)
+            self._catalogue.update(key, servers)
+
+        target_country = cgroup.target_country and countries.get(
+            alpha_2=cc_to_iso(cgroup.target_country)
+        )
+        tunnel = case and (case.vpn, case.technology)
+        candidates = tunnel and self._catalogue.ranking(key, tunnel)
+        measured = candidates is None
+        if measured:
+            candidates = await self._measure(
+                env,
+                [
+                    server
+                    for server in servers
+                    if target_country is not None
+                    and server["country"] == target_country.name
+                ],
+            )
+            if tunnel:
+                self._catalogue.rank(key, tunnel, candidates)
+        # Servers in the city of the tunnel exit are preferred
+        in_city = [
+            (server, rtt)
+            for server, rtt in candidates
+            if target_city is not None and target_city in server["location"]
+        ]
+        chosen = self._catalogue.choose(in_city or candidates)
+
+        if chosen is None:
             log_target = cgroup.target_country
             if target_city is not None:
                 log_target = "country: {}, city {}".format(
                     cgroup.target_country, target_city
                 )
-            log.debug("Server list: {}".format(servers["servers"]))
+            log.debug("Server list: {}".format(servers))
             raise TesterServersNotFound(
                 "No servers found for {} in the server list".format(log_target)
             )
 
-        return TestGroup(
+        target, rtt = chosen
+        log.debug("Chosen server {} with {}ms".format(target["host"], rtt))
+        group = TestGroup(
             vpn_country=cgroup.vpn_country,
             target_country=cgroup.target_country,
             target_server=target["host"],
             target_server_id=target["id"],
         )
+        return group, key, rtt if measured else None
+
+    async def _refresh(self, env: ContainerEnvironment, key: CatalogueKey):
+        """Replace stale server list of `key`, measurements are done by now."""
+        if not self._catalogue.stale(key):
+            return
+        try:
+            with env.timeline.phase("refresh"):
+                self._catalogue.update(key, await self._fetch_servers(env), True)
+        except (TestRunError, TesterServersNotFound) as e:
+            log.info("Failed to refresh speedtest server list:\n{}".format(e))
 
     async def test(
         self, env: ContainerEnvironment, group: TestGroup, case: TestCase
@@ -107,36 +243,43 @@ class SpeedTestCliTester(Tester):
             )
         )
 
+        key = rtt = None
         if group.target_country != "auto":
-            group = await self.resolve(env, group)
+            with env.timeline.phase("resolve"):
+                group, key, rtt = await self._resolve(env, group, case)
 
+        # Line per event, progress is seen while the test runs
         args = [
             "--accept-license",
             "--accept-gdpr",
             "-f",
-            "json",
+            "jsonl",
         ]
         if group.target_server:
             args.extend(["-s", str(group.target_server_id)])
 
         log.debug("Running speedtest-cli... %s", repr(args))
         log.info("Starting sppedtest-cli...")
-        returncode, json_stdout = await env.exec(
-            "/usr/bin/speedtest", args, output=True, resp_json=True, allow_error=True
-        )
-        if json_stdout is None:
-            raise TestCaseError("Speedtest-cli subprocess timeout.")
+        speedtest_result = None
+        with env.timeline.phase("speedtest"):
+            async with env.stream_exec(_SPEEDTEST, args) as stream:
+                try:
+                    async for value in json_values(stream):
+                        speedtest_result = self._event(value) or speedtest_result
+                except asyncio.TimeoutError:
+                    raise TestCaseError("Speedtest-cli subprocess timeout.")
 
-        if returncode != 0:
-            raise TestCaseError("Exited with: {}\n".format(returncode))
-
-        if "error" in json_stdout:
+        if stream.returncode != 0:
             raise TestCaseError(
-                "Speedtest-cli result was an error: {}".format(json_stdout["error"])
+                "Exited with: {}\n{}".format(stream.returncode, "\n".join(stream.stderr))
             )
 
+        if speedtest_result is None:
+            raise TestCaseError("Speedtest-cli finished without result.")
+
         log.info("speedtest-cli completed.")
-        speedtest_result = json_stdout
+        if key is not None:
+            await self._refresh(env, key)
         try:
             country = countries.get(name=speedtest_result["server"]["country"])
             result = TestRun(
@@ -161,6 +304,7 @@ class SpeedTestCliTester(Tester):
                 server_country=speedtest_result["server"]["country"],
                 server_country_code=country and iso_to_cc(country.alpha_2),
                 packet_loss=speedtest_result.get("packetLoss"),
+                server_rtt=rtt,
             )
         except KeyError as e:
             raise TestCaseError("Incomplete speedtestcli data: " + str(e))
@@ -0,0 +1,54 @@
+import asyncio
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+
+from vpnspeed.model import Phase
+
+
+class Timeline:
+    """
+    Timed steps of a single test run.
+
+    Steps are recorded by whoever runs them (container environment, VPN
+    session, runner, tester) into the timeline of the environment the run
+    uses, so a prepared or pooled environment carries its steps to the run.
+    """
+
+    _phases: List[Phase]
+
+    def __init__(self):
+        self._origin = None
+        self._phases = []
+
+    @contextmanager
+    def phase(self, name: str):
+        """Time the block as step `name`, failed steps are recorded too."""
+        started = self._now()
+        if self._origin is None:
+            self._origin = started
+        try:
+            yield
+        finally:
+            self._phases.append(
+                Phase(
+                    name=name,
+                    start=round(started - self._origin, 3),
+                    duration=round(self._now() - started, 3),
+                )
+            )
+
+    def phases(self) -> Tuple[Phase, ...]:
+        return tuple(sorted(self._phases, key=lambda phase: phase.start))
+
+    def durations(self) -> Dict[str, float]:
+        """Total seconds by step name, repeated steps are summed."""
+        durations = dict()
+        for phase in self._phases:
+            durations[phase.name] = round(
+                durations.get(phase.name, 0.0) + phase.duration, 3
+            )
+        return durations
+
+    @staticmethod
+    def _now() -> float:
+        return asyncio.get_event_loop().time()
@@ -1,18 +1,23 @@
 import sys
 import asyncio
 import json
-import time
 import socket
-import aiohttp
+import statistics
+from dataclasses import dataclass, field
 from socket import gaierror
 from asyncio.subprocess import Process, PIPE
 from vpnspeed import log
-from typing import List, Tuple
-from .constans import DEFAULT_SUBPROCESS_TIMEOUT
+from vpnspeed.geoip import geo_resolver
+from typing import Dict, List, Optional, Tuple
+from .constans import (
+    DEFAULT_SUBPROCESS_TIMEOUT,
+    DEFAULT_LATENCY_TIMEOUT,
+    DEFAULT_LATENCY_TTL,
+    DEFAULT_LATENCY_CONCURRENCY,
+)
 
 
 TERMINATE_TIMEOUT = 2
-GEO_IP_CHECKER = "https://ipapi.co/{}/json/"
 
 
 async def system_exec(cmd, *args, env=None) -> bool:
@@ -87,50 +92,159 @@ def try_json(myjson):
     return json_object
 
 
-async def measure_hosts_connection_time_task(hosts: list, port: int, id):
-    host_connection_time = 0
-    id = (id % len(hosts)) if id >= len(hosts) else id
+@dataclass
+class HostLatency:
+    """TCP connect times of a host in seconds, fastest address per attempt."""
+
+    host: str
+    rtts: List[float] = field(default_factory=list)
+    failures: int = 0
+
+    @property
+    def min(self) -> Optional[float]:
+        return min(self.rtts) if self.rtts else None
+
+    @property
+    def median(self) -> Optional[float]:
+        return statistics.median(self.rtts) if self.rtts else None
+
+    @property
+    def mean(self) -> Optional[float]:
+        return statistics.mean(self.rtts) if self.rtts else None
+
+    @property
+    def max(self) -> Optional[float]:
+        return max(self.rtts) if self.rtts else None
+
+    def __str__(self):
+        if not self.rtts:
+            return "{}: unreachable".format(self.host)
+        return "{}: min {:.1f} median {:.1f} max {:.1f} ms ({}/{} ok)".format(
+            self.host,
+            self.min * 1000,
+            self.median * 1000,
+            self.max * 1000,
+            len(self.rtts),
+            len(self.rtts) + self.failures,
+        )
+
+
+# Measurements by (hosts, port), with loop time they expire at
+_latency_cache: Dict[Tuple[Tuple[str, ...], int], Tuple[float, Dict[str, HostLatency]]] = {}
+
+
+async def _resolve(host: str, port: int) -> List[str]:
     try:
-        ip_list = socket.gethostbyname_ex(hosts[id])[2]
-    except gaierror:
-        return None
-    for ip in ip_list or []:
-        time_start = time.time()
+        infos = await asyncio.get_event_loop().getaddrinfo(
+            host, port, family=socket.AF_INET, type=socket.SOCK_STREAM
+        )
+    except gaierror as e:
+        log.debug("Failed to resolve {}: {}".format(host, e))
+        return []
+    return list(dict.fromkeys(info[4][0] for info in infos))
+
+
+async def _connect_time(
+    ip: str, port: int, timeout: float, limit: asyncio.Semaphore
+) -> Optional[float]:
+    async with limit:
+        loop = asyncio.get_event_loop()
+        started = loop.time()
+        try:
+            _, writer = await asyncio.wait_for(
+                asyncio.open_connection(ip, port), timeout
+            )
+        except (OSError, asyncio.TimeoutError):
+            return None
+        elapsed = loop.time() - started
+        writer.close()
         try:
-            with socket.socket() as sock:
-                sock.connect((ip, port))
-        except socket.error:
-            continue
-        end_time = time.time() - time_start
-        host_connection_time = (
-            end_time
-            if end_time < host_connection_time or host_connection_time == 0
-            else host_connection_time
+            await writer.wait_closed()
+        except OSError:
+            pass
+        return elapsed
+
+
+async def measure_host_latency(
+    host: str,
+    port: int,
+    retry: int = 5,
+    timeout: float = DEFAULT_LATENCY_TIMEOUT,
+    limit: asyncio.Semaphore = None,
+) -> HostLatency:
+    """Connect `retry` times to every address of `host`, all at once."""
+    limit = limit or asyncio.Semaphore(DEFAULT_LATENCY_CONCURRENCY)
+    latency = HostLatency(host)
+    ips = await _resolve(host, port)
+    if not ips:
+        latency.failures = retry
+        return latency
+
+    async def attempt() -> Optional[float]:
+        times = await asyncio.gather(
+            *(_connect_time(ip, port, timeout, limit) for ip in ips)
+        )
+        return min((t for t in times if t is not None), default=None)
+
+    for rtt in await asyncio.gather(*(attempt() for _ in range(retry))):
+        if rtt is None:
+            latency.failures += 1
+        else:
+            latency.rtts.append(round(rtt, 6))
+    latency.rtts.sort()
+    return latency
+
+
+async def measure_hosts_latency(
+    hosts: List[str],
+    port: int,
+    retry: int = 5,
+    timeout: float = DEFAULT_LATENCY_TIMEOUT,
+    ttl: float = DEFAULT_LATENCY_TTL,
+) -> Dict[str, HostLatency]:
+    """
+    Latency of every host, hosts are measured concurrently.
+
+    Results are reused for `ttl` seconds for the same hosts and port.
+    """
+    key = (tuple(hosts), port)
+    now = asyncio.get_event_loop().time()
+    cached = _latency_cache.get(key)
+    if cached is not None and cached[0] > now:
+        return cached[1]
+    limit = asyncio.Semaphore(DEFAULT_LATENCY_CONCURRENCY)
+    latencies = await asyncio.gather(
+        *(measure_host_latency(host, port, retry, timeout, limit) for host in hosts)
+    )
+    result = {latency.host: latency for latency in latencies}
+    if ttl > 0:
+        now = asyncio.get_event_loop().time()
+        # Host lists differ between runs, expired ones are not asked again
+        expired = [k for k, (expires, _) in _latency_cache.items() if expires <= now]
+        for k in expired:
+            del _latency_cache[k]
+        _latency_cache[key] = (now + ttl, result)
+    return result
+
+
+async def nearest_host_from_list(
+    hosts: list,
+    port: int,
+    retry: int = 5,
+    timeout: float = DEFAULT_LATENCY_TIMEOUT,
+    ttl: float = DEFAULT_LATENCY_TTL,
+):
+    """Reachable host with lowest median connect time, None if there is none."""
+    latencies = await measure_hosts_latency(hosts, port, retry, timeout, ttl)
+    reachable = [latency for latency in latencies.values() if latency.rtts]
+    log.info(
+        "Hosts with connection time: {}".format(
+            "; ".join(str(latency) for latency in latencies.values())
         )
-    if host_connection_time == 0:
+    )
+    if not reachable:
         return None
-    return (hosts[id], round(host_connection_time, 10))
-
-
-async def nearest_host_from_list(hosts: list, port: int, retry: int = 5):
-    hist = dict()
-    taskCount = retry * len(hosts)
-    multiple_tasks = [
-        measure_hosts_connection_time_task(hosts, port, task_id)
-        for task_id in range(taskCount)
-    ]
-    for task_future in asyncio.as_completed(multiple_tasks):
-        ret_tuple = await task_future
-        if ret_tuple is None:
-            continue
-        (host, time) = ret_tuple
-        if host not in hist:
-            hist[host] = 0
-        hist[host] += time
-    if hist:
-        log.info("Hosts with connection time: {}".format(hist))
-        return min(hist, key=hist.get)
-    return None
+    return min(reachable, key=lambda latency: (latency.median, latency.min)).host
 
 
 def trim_new_line(value: str) -> str:
@@ -138,19 +252,7 @@ def trim_new_line(value: str) -> str:
 
 
 async def ip_to_coordinates(ip: str) -> Tuple[str, str]:
-    ip_geocache_checker = GEO_IP_CHECKER.format(ip)
-    log.debug("Checking geo locationa by {}".format(ip_geocache_checker))
-    async with aiohttp.ClientSession() as session:
-        try:
-            async with session.get(ip_geocache_checker) as response:
-                if response.status == 200:
-                    req_json = try_json(await response.text())
-                    if req_json is None:
-                        return (None, None)
-                    longtitude = req_json["longitude"]
-                    latitude = req_json["latitude"]
-                    if longtitude and latitude:
-                        return (longtitude, latitude)
-                return (None, None)
-        except:
-            return (None, None)
+    location = await geo_resolver.locate(ip)
+    if location is None or location.longitude is None or location.latitude is None:
+        return (None, None)
+    return (location.longitude, location.latitude)
@@ -1,5 +1,6 @@
 import asyncio
 import io
+from copy import copy
 from typing import List, Dict
 
 from vpnspeed import log, errors
@@ -23,24 +24,32 @@ class VPNSession:
     _provider: VPNProvider
     _group: TestGroup
     _case: TestCase
+    _logged_in: bool
 
     def __init__(self, env, provider: VPNProvider, group: TestGroup, case: TestCase):
         self._provider = provider
         self._group = group
         self._case = case
         self._env = env
+        self._logged_in = False
 
-    async def __aenter__(self):
-        # Save DNS setting before VPN
+    async def login(self):
+        if self._logged_in:
+            return
         try:
-            await self._provider.login(self._env)
+            with self._env.timeline.phase("login"):
+                await self._provider.login(self._env)
         except:
             log.info("Failed to login!")
             raise errors.TechnologyAuthFailed(
                 "Failed to login in {} provider!".format(self._provider.get_name())
             )
+        self._logged_in = True
+
+    async def connect(self):
         try:
-            await self._provider.connect(self._env, self._group, self._case)
+            with self._env.timeline.phase("connect"):
+                await self._provider.connect(self._env, self._group, self._case)
         except errors.TechnologyNotSupported as eTech:
             if log.getEffectiveLevel() != 20:
                 log.exception("Failed provider connect:\n%s", eTech)
@@ -51,14 +60,32 @@ class VPNSession:
             raise errors.ProviderAPIQueryFailed(
                 "Failed provider connect: {}.".format(e)
             )
+
+    @property
+    def vpn(self) -> str:
+        return self._case.vpn
+
+    def renew(self, group: TestGroup, case: TestCase) -> "VPNSession":
+        """New session on the same provider and environment, keeping login."""
+        session = VPNSession(self._env, self._provider, group, case)
+        session._logged_in = self._logged_in
+        return session
+
+    async def __aenter__(self):
+        # Save DNS setting before VPN
+        await self.login()
+        await self.connect()
         return self
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
         # Restore DNS setting after VPN
 
         log.debug("Session end for: %s", self._provider.get_name())
+        # Some providers logout on disconnect
+        self._logged_in = False
         try:
-            await self._provider.disconnect()
+            with self._env.timeline.phase("disconnect"):
+                await self._provider.disconnect()
         except Exception as e:
             log.exception("Failed provider disconnect:\n%s", e)
 
@@ -73,6 +100,10 @@ class DynamicVPN:
         for vpn in vpns:
             self._providers[vpn.name] = PROVIDERS[vpn.name](vpn.credentials)
 
+    async def add_provider(self, name: str, provider: VPNProvider):
+        """Register already constructed provider, e.g. simulated one."""
+        self._providers[name] = provider
+
     async def get_cities(self, country: str) -> set:
         cities = set()
         log.info("Get cities for country: {}".format(country))
@@ -99,4 +130,6 @@ class DynamicVPN:
         return self._providers
 
     def session(self, env, group: TestGroup, case: TestCase) -> VPNSession:
-        return VPNSession(env, self._providers[case.vpn], group, case)
+        # Providers keep per connection state (env, technology), so every session
+        # works on its own copy to allow parallel sessions of the same provider.
+        return VPNSession(env, copy(self._providers[case.vpn]), group, case)
@@ -136,18 +136,20 @@ class PiaApp(VPNProvider):
 
     async def login(self, env: ContainerEnvironment):
         self._env = env
-        await self._env.write_file(
-            "login_creds", "{}\n{}".format(self._creds.username, self._creds.password)
-        )
-        returncode, stdout = await self._env.exec(_APP, ["login", "login_creds"])
-        ok = True if returncode == 0 else False
-        if not ok:
-            log.info("Failed to login...")
-            log.info("Trying to logout...")
-            await self._env.exec(_APP, "logout")
+        async with self._env.staged_files(
+            {"login_creds": "{}\n{}".format(self._creds.username, self._creds.password)}
+        ):
             returncode, stdout = await self._env.exec(_APP, ["login", "login_creds"])
-            if returncode != 0:
-                raise VPNConnectionFailed("Failed to login pia: {}".format(stdout))
+            ok = True if returncode == 0 else False
+            if not ok:
+                log.info("Failed to login...")
+                log.info("Trying to logout...")
+                await self._env.exec(_APP, "logout")
+                returncode, stdout = await self._env.exec(
+                    _APP, ["login", "login_creds"]
+                )
+                if returncode != 0:
+                    raise VPNConnectionFailed("Failed to login pia: {}".format(stdout))
         log.info("Login successfull: {}, return code: {}".format(ok, returncode))
 
     async def connect(
@@ -23,13 +23,14 @@ class IPSec(VPNTechnology):
         if params is None or "username" not in params or "password" not in params:
             raise TechnologyAuthFailed("IPSec/IKEv2's credentials not supplied.")
 
-        await self._env.write_file(_CONFIG, config)
-        await self._env.write_file(
-            _SECRETS, "{} : EAP {}".format(params["username"], params["password"])
-        )
-        await self._env.exec("/usr/sbin/ipsec", "restart", allow_error=True)
-        await asyncio.sleep(1)
-        await self._env.exec("/usr/sbin/ipsec", ["up", DEFAULT_SESSION_NAME])
+        await self._env.write_files({_CONFIG: config})
+        # Secrets are loaded by the restart, not needed once connected
+        async with self._env.staged_files(
+            {_SECRETS: "{} : EAP {}".format(params["username"], params["password"])}
+        ):
+            await self._env.exec("/usr/sbin/ipsec", "restart", allow_error=True)
+            await asyncio.sleep(1)
+            await self._env.exec("/usr/sbin/ipsec", ["up", DEFAULT_SESSION_NAME])
 
     async def stop(self):
         log.info("Stopping ipsec")
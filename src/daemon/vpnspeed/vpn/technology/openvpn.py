@@ -48,12 +48,11 @@ class OpenVPN(VPNTechnology):
         if params is None or "username" not in params or "password" not in params:
             raise TechnologyAuthFailed("OpenVPN's credentials not supplied.")
 
-        await env.write_file(self._config_file, config)
-        await env.write_file(
-            login_file, "{}\n{}\n".format(params["username"], params["password"])
-        )
-
-        try:
+        await env.write_files({self._config_file: config})
+        # OpenVPN reads credentials once at start
+        async with env.staged_files(
+            {login_file: "{}\n{}\n".format(params["username"], params["password"])}
+        ):
             ret_code, stdout = await self._env.sub_exec(
                 "/usr/sbin/openvpn",
                 [
@@ -76,8 +75,6 @@ class OpenVPN(VPNTechnology):
             if not init_completed:
                 await self.stop()
                 raise VPNConnectionFailed("Failed to initiate OpenVPN's.")
-        finally:
-            await env.delete_file(login_file)
 
     async def stop(self):
         log.info("Stopping openvpn")
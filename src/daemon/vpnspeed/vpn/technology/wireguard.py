@@ -24,7 +24,8 @@ class WireGuard(VPNTechnology):
     async def start(self, env: ContainerEnvironment, config: str, params: dict = None):
         log.info("Starting wireguard")
         self._env = env
-        await self._env.write_file(_CONFIG, config)
+        # Private key inside, wg-quick warns about readable configs
+        await self._env.write_files({_CONFIG: config})
         returncode, stdout = await self._env.exec(
             "wg-quick", ["up", DEFAULT_SESSION_NAME], allow_error=True
         )
@@ -33,3 +34,10 @@ class WireGuard(VPNTechnology):
 
     async def stop(self):
         log.info("Stopping wireguard")
+        try:
+            await self._env.exec(
+                "wg-quick", ["down", DEFAULT_SESSION_NAME], allow_error=True
+            )
+        finally:
+            # Pooled containers are reused, the private key must not stay
+            await self._env.delete_files([_CONFIG])
@@ -47,6 +47,13 @@ class Templated(VPNProvider):
         self.__countries = self.CONFIG["plugin"]["provider"][self.get_name()]["country"]
         self._creds = creds
 
+    def __copy__(self):
+        clone = type(self).__new__(type(self))
+        clone.__dict__.update(self.__dict__)
+        clone.__current_tech = None
+        clone.__tech = {name: type(tech)() for name, tech in self.__tech.items()}
+        return clone
+
     async def login(self, env: ContainerEnvironment, creds: VPNCredentials = None):
         if creds is not None:
             log.info("Updating creds...")
@@ -0,0 +1,158 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+from utils import async_test
+
+from vpnspeed.container.channel import ChannelClosed, CommandChannel, Transport
+
+
+class _ShellTransport(Transport):
+    """Local shell standing in for the attached container shell."""
+
+    def __init__(self, process: asyncio.subprocess.Process):
+        self._process = process
+
+    @classmethod
+    async def start(cls, script: str = "exec bash"):
+        return cls(
+            await asyncio.create_subprocess_exec(
+                "bash",
+                "-c",
+                script,
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.DEVNULL,
+            )
+        )
+
+    async def send(self, data: bytes):
+        self._process.stdin.write(data)
+        await self._process.stdin.drain()
+
+    async def receive(self):
+        return await self._process.stdout.read(4096) or None
+
+    async def stop(self):
+        if self._process.returncode is None:
+            self._process.kill()
+        await self._process.wait()
+
+
+class TestCommandChannel(unittest.TestCase):
+    @async_test
+    async def test_exec(self):
+        transport = await _ShellTransport.start()
+        channel = CommandChannel(transport)
+        try:
+            self.assertEqual(
+                [0, ["hello 'world'\n"]],
+                await channel.exec(["echo", "hello 'world'"], output=True),
+            )
+            self.assertEqual([0, None], await channel.exec(["true"]))
+            # Errors are reported like Docker exec results
+            self.assertEqual(
+                [-1, None], await channel.exec(["cat", "/nonexistent"], output=True)
+            )
+            self.assertEqual([-1, None], await channel.exec(["nonexistent-command"]))
+            self.assertEqual(
+                [0, ["out\n", "err\n"]],
+                await channel.exec(
+                    ["bash", "-c", "echo out; echo err >&2"],
+                    output=True,
+                    allow_error=True,
+                ),
+            )
+            self.assertEqual([-1, None], await channel.exec(["true"], output=True))
+        finally:
+            await channel.close()
+            await transport.stop()
+
+    @async_test
+    async def test_multiplexed(self):
+        transport = await _ShellTransport.start()
+        channel = CommandChannel(transport)
+        try:
+            large = "x" * 20000 + "\n"
+            results = await asyncio.gather(
+                channel.exec(["bash", "-c", "sleep 0.2; echo slow"], output=True),
+                channel.exec(["echo", "fast"], output=True),
+                *(
+                    channel.exec(["printf", "%s", large], output=True)
+                    for _ in range(10)
+                ),
+            )
+            self.assertEqual([0, ["slow\n"]], results[0])
+            self.assertEqual([0, ["fast\n"]], results[1])
+            for result in results[2:]:
+                self.assertEqual([0, [large]], result)
+        finally:
+            await channel.close()
+            await transport.stop()
+
+    @async_test
+    async def test_entrypoint_consuming_input(self):
+        # Input read before the shell starts is resent by the handshake
+        transport = await _ShellTransport.start("read -r _; exec bash")
+        channel = CommandChannel(transport)
+        try:
+            self.assertEqual([0, ["ok\n"]], await channel.exec(["echo", "ok"], True))
+        finally:
+            await channel.close()
+            await transport.stop()
+
+    @async_test
+    async def test_no_shell(self):
+        transport = await _ShellTransport.start("cat > /dev/null")
+        channel = CommandChannel(transport, handshake_timeout=1)
+        try:
+            with self.assertRaises(ChannelClosed):
+                await channel.exec(["true"])
+            self.assertFalse(channel.available)
+        finally:
+            await channel.close()
+            await transport.stop()
+
+    @async_test
+    async def test_other_user(self):
+        # Shell of an image with another USER
+        transport = await _ShellTransport.start()
+        channel = CommandChannel(transport, uid=os.geteuid() + 1)
+        try:
+            with self.assertRaises(ChannelClosed):
+                await channel.exec(["true"])
+            self.assertFalse(channel.available)
+        finally:
+            await channel.close()
+            await transport.stop()
+
+        transport = await _ShellTransport.start()
+        channel = CommandChannel(transport, uid=os.geteuid())
+        try:
+            self.assertEqual([0, None], await channel.exec(["true"]))
+        finally:
+            await channel.close()
+            await transport.stop()
+
+    @async_test
+    async def test_timeout_kills(self):
+        transport = await _ShellTransport.start()
+        channel = CommandChannel(transport)
+        try:
+            with tempfile.TemporaryDirectory() as tmp:
+                pids = os.path.join(tmp, "pids")
+                script = "sleep 30 & echo $$ $! > {}; wait".format(pids)
+                with self.assertRaises(asyncio.TimeoutError):
+                    await asyncio.wait_for(
+                        channel.exec(["bash", "-c", script]), 0.5
+                    )
+                # The command and what it started are gone
+                await channel.exec(["true"])
+                for pid in map(int, Path(pids).read_text().split()):
+                    with self.assertRaises(ProcessLookupError):
+                        os.kill(pid, 0)
+        finally:
+            await channel.close()
+            await transport.stop()
@@ -0,0 +1,128 @@
+import asyncio
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from aiohttp import web
+from yarl import URL
+
+from utils import async_test
+
+from vpnspeed.container import DockerClients
+from vpnspeed.container.client import endpoint
+
+
+class _FakeDocker:
+    """Docker API stand-in on a Unix socket, tracks connections and load."""
+
+    def __init__(self):
+        self.connections = set()
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def version(self, request):
+        return web.json_response({"ApiVersion": "1.41"})
+
+    async def inspect(self, request):
+        self.connections.add(id(request.transport))
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.01)
+        self.in_flight -= 1
+        if request.match_info["id"] == "missing":
+            return web.json_response({"message": "No such container"}, status=404)
+        return web.json_response({"Id": request.match_info["id"]})
+
+
+class TestDockerClients(unittest.TestCase):
+    def test_endpoint(self):
+        self.assertEqual(
+            "GET /containers/{id}/json",
+            endpoint("GET", URL("unix://localhost/v1.41/containers/nordvpn_1/json")),
+        )
+        self.assertEqual(
+            "POST /containers/create",
+            endpoint("POST", URL("unix://localhost/v1.41/containers/create")),
+        )
+        self.assertEqual(
+            "GET /images/{name}/json",
+            endpoint("GET", URL("unix://localhost/v1.41/images/vpnspeed/nordvpn/json")),
+        )
+        self.assertEqual("GET /version", endpoint("GET", URL("unix://localhost/version")))
+
+    @async_test
+    async def test_shared_pooled_client(self):
+        fake = _FakeDocker()
+        app = web.Application()
+        app.router.add_get("/version", fake.version)
+        app.router.add_get("/v1.41/containers/{id}/json", fake.inspect)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "docker.sock")
+            site = web.UnixSite(runner, path)
+            await site.start()
+            clients = DockerClients(concurrency=4)
+            try:
+                with mock.patch.dict(os.environ, {"DOCKER_HOST": "unix://" + path}):
+                    docker = clients.get()
+                self.assertIs(docker, clients.get())
+
+                await asyncio.gather(
+                    *(docker.containers.get("c{}".format(i)) for i in range(20)),
+                    return_exceptions=True,
+                )
+                await asyncio.gather(
+                    docker.containers.get("missing"), return_exceptions=True
+                )
+            finally:
+                await clients.close()
+                await runner.cleanup()
+
+        self.assertLessEqual(fake.max_in_flight, 4)
+        # Keep-alive connections are reused between calls
+        self.assertLessEqual(len(fake.connections), 4)
+        stats = clients.stats()["GET /containers/{id}/json"]
+        self.assertEqual(21, stats.calls)
+        self.assertEqual(1, stats.errors)
+        self.assertGreater(stats.mean_time, 0)
+
+    def test_client_of_old_loop_closed(self):
+        fake = _FakeDocker()
+        app = web.Application()
+        app.router.add_get("/version", fake.version)
+        app.router.add_get("/v1.41/containers/{id}/json", fake.inspect)
+        runner = web.AppRunner(app)
+        server_loop = asyncio.new_event_loop()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "docker.sock")
+            server_loop.run_until_complete(runner.setup())
+            server_loop.run_until_complete(web.UnixSite(runner, path).start())
+            server = threading.Thread(target=server_loop.run_forever)
+            server.start()
+            clients = DockerClients()
+
+            async def inspect():
+                docker = clients.get()
+                await docker.containers.get("c")
+                return docker
+
+            loops = [asyncio.new_event_loop() for _ in range(2)]
+            try:
+                with mock.patch.dict(os.environ, {"DOCKER_HOST": "unix://" + path}):
+                    old = loops[0].run_until_complete(inspect())
+                    # Keep-alive connection of the first loop is closed
+                    self.assertIsNot(old, loops[1].run_until_complete(inspect()))
+                self.assertTrue(old.session.closed)
+                loops[1].run_until_complete(clients.close())
+            finally:
+                for loop in loops:
+                    loop.close()
+                asyncio.run_coroutine_threadsafe(
+                    runner.cleanup(), server_loop
+                ).result()
+                server_loop.call_soon_threadsafe(server_loop.stop)
+                server.join()
+                server_loop.close()
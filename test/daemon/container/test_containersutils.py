@@ -0,0 +1,42 @@
+import io
+import tarfile
+import unittest
+
+from vpnspeed.container.containersutils import host_limits, make_archive
+from vpnspeed.model import Resources
+
+
+class TestMakeArchive(unittest.TestCase):
+    def test_files(self):
+        data = make_archive(
+            {"/tmp/vpnspeed.ovpn": "client\n", "login_creds": b"user\npass"},
+            mode=0o600,
+        )
+        with tarfile.open(fileobj=io.BytesIO(data)) as tar:
+            members = {member.name: member for member in tar.getmembers()}
+            self.assertEqual({"tmp/vpnspeed.ovpn", "login_creds"}, set(members))
+            for member in members.values():
+                self.assertEqual(0o600, member.mode)
+                self.assertEqual(0, member.uid)
+            self.assertEqual(
+                b"client\n", tar.extractfile(members["tmp/vpnspeed.ovpn"]).read()
+            )
+            self.assertEqual(b"user\npass", tar.extractfile(members["login_creds"]).read())
+
+
+class TestHostLimits(unittest.TestCase):
+    def test_limits(self):
+        self.assertEqual({}, host_limits(None))
+        self.assertEqual({}, host_limits(Resources()))
+        self.assertEqual(
+            {
+                "CpusetCpus": "2",
+                "NanoCpus": 1500000000,
+                "Memory": 512 * 1024 ** 2,
+                "CpuShares": 512,
+            },
+            host_limits(Resources(cpuset=2, cpus=1.5, memory=512, cpu_shares=512)),
+        )
+        self.assertEqual(
+            "cpuset=2-3 memory=256", str(Resources(cpuset="2-3", memory=256))
+        )
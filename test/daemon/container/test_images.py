@@ -0,0 +1,113 @@
+import asyncio
+import unittest
+from unittest import mock
+
+from aiodocker.channel import Channel
+from aiodocker.exceptions import DockerError
+
+from vpnspeed.container import images
+from vpnspeed.container.images import ImageRegistry, ImageState, images_for
+from vpnspeed.model import VPN, VPNTechnology
+from utils import async_test
+
+
+class _FakeImages:
+    def __init__(self, present):
+        self.present = dict(present)
+        self.inspects = 0
+        self.pulls = []
+
+    async def inspect(self, name):
+        self.inspects += 1
+        if name not in self.present:
+            raise DockerError(404, {"message": "No such image"})
+        return {"Id": self.present[name]}
+
+    async def pull(self, name, stream=False):
+        self.pulls.append(name)
+        for message in (
+            {"id": "a", "status": "Downloading", "progressDetail": {"current": 5, "total": 10}},
+            {"id": "a", "status": "Pull complete", "progressDetail": {}},
+        ):
+            await asyncio.sleep(0)
+            yield message
+        self.present[name] = "sha256:" + name
+
+
+class _FakeEvents:
+    def __init__(self):
+        self.channel = Channel()
+
+    def subscribe(self, **params):
+        return self.channel.subscribe()
+
+    async def stop(self):
+        pass
+
+
+class _FakeDocker:
+    def __init__(self, present=()):
+        self.images = _FakeImages(present)
+        self.events = _FakeEvents()
+
+
+class TestImagesFor(unittest.TestCase):
+    def test_app_and_technology_images(self):
+        vpns = [
+            VPN(name="nordvpn", technologies=[VPNTechnology(name="openvpn")]),
+            VPN(name="nordvpn-app", technologies=[VPNTechnology(name="openvpn")]),
+        ]
+        self.assertEqual(
+            {"vpnspeed/openvpn", "vpnspeed/nordvpn"}, images_for(vpns)
+        )
+
+
+class TestImageRegistry(unittest.TestCase):
+    def setUp(self):
+        self.docker = _FakeDocker({"vpnspeed/openvpn": "sha256:openvpn"})
+        patcher = mock.patch.object(images.docker_clients, "get", lambda: self.docker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.registry = ImageRegistry()
+
+    @async_test
+    async def test_cached_until_image_event(self):
+        self.assertEqual("sha256:openvpn", await self.registry.ensure("vpnspeed/openvpn"))
+        self.assertEqual("sha256:openvpn", await self.registry.ensure("vpnspeed/openvpn"))
+        self.assertEqual(1, self.docker.images.inspects)
+
+        await self.docker.events.channel.publish(
+            {"Type": "image", "Action": "tag", "Actor": {"ID": "sha256:openvpn"}}
+        )
+        await asyncio.sleep(0)
+        self.assertEqual("sha256:openvpn", await self.registry.ensure("vpnspeed/openvpn"))
+        self.assertEqual(2, self.docker.images.inspects)
+        await self.registry.close()
+
+    @async_test
+    async def test_prefetch_pulls_missing_once(self):
+        self.registry.prefetch(["vpnspeed/openvpn", "vpnspeed/wireguard"])
+        ids = await asyncio.gather(
+            self.registry.ensure("vpnspeed/wireguard"),
+            self.registry.ensure("vpnspeed/wireguard"),
+        )
+        self.assertEqual(["sha256:vpnspeed/wireguard"] * 2, ids)
+        self.assertEqual(["vpnspeed/wireguard"], self.docker.images.pulls)
+
+        status = {s.image: s for s in self.registry.status()}
+        self.assertEqual(ImageState.ready, status["vpnspeed/openvpn"].state)
+        self.assertEqual(ImageState.ready, status["vpnspeed/wireguard"].state)
+        self.assertEqual((1, 1, 10), (
+            status["vpnspeed/wireguard"].layers,
+            status["vpnspeed/wireguard"].layers_done,
+            status["vpnspeed/wireguard"].downloaded,
+        ))
+        await self.registry.close()
+
+    @async_test
+    async def test_cleared_when_events_stop(self):
+        await self.registry.ensure("vpnspeed/openvpn")
+        await self.docker.events.channel.publish(None)
+        await asyncio.sleep(0)
+        self.assertEqual([], self.registry.status())
+        await self.registry.close()
@@ -0,0 +1,121 @@
+import asyncio
+import io
+import os
+import shutil
+import subprocess
+import tarfile
+import tempfile
+import unittest
+from pathlib import Path
+
+from utils import async_test
+
+from vpnspeed.container import ContainerEnvironment
+from vpnspeed.container.channel import CommandChannel, Transport
+from vpnspeed.container.pool import ContainerPool
+from vpnspeed.model import Probe
+
+
+_ENTRYPOINT = Path(__file__).parents[3] / "docker" / "resource" / "entrypoint.sh"
+
+# Docker bind mounts the resolv.conf it manages on the host, the entrypoint
+# runs as the container shell, see docker/vpnspeed/Dockerfile
+_CONTAINER = """
+set -e
+mount --bind "$1/etc" /etc
+mount --bind "$1/managed/resolv.conf" /etc/resolv.conf
+exec bash "$2"
+"""
+
+
+def _namespaces() -> bool:
+    if os.geteuid() != 0 or shutil.which("unshare") is None:
+        return False
+    return (
+        subprocess.run(
+            ["unshare", "-m", "--propagation", "private", "true"],
+            stderr=subprocess.DEVNULL,
+        ).returncode
+        == 0
+    )
+
+
+class _ShellTransport(Transport):
+    def __init__(self, process: asyncio.subprocess.Process):
+        self._process = process
+
+    async def send(self, data: bytes):
+        self._process.stdin.write(data)
+        await self._process.stdin.drain()
+
+    async def receive(self):
+        return await self._process.stdout.read(4096) or None
+
+    async def stop(self):
+        # The entrypoint shell runs as a child, it exits once stdin closes
+        self._process.stdin.close()
+        try:
+            await asyncio.wait_for(self._process.wait(), 5)
+        except asyncio.TimeoutError:
+            self._process.kill()
+            await self._process.wait()
+
+
+class _HostArchive:
+    """Archive uploads land where Docker keeps files, on the host side."""
+
+    def __init__(self, root: str):
+        self._root = root
+
+    async def put_archive(self, path: str, data: bytes):
+        with tarfile.open(fileobj=io.BytesIO(data)) as tar:
+            for member in tar.getmembers():
+                if member.name == "etc/resolv.conf":
+                    Path(self._root, "managed", "resolv.conf").write_bytes(
+                        tar.extractfile(member).read()
+                    )
+
+
+@unittest.skipUnless(_namespaces(), "mount namespaces are not available")
+class TestPoolReset(unittest.TestCase):
+    @async_test
+    async def test_reset_after_entrypoint(self):
+        with tempfile.TemporaryDirectory() as root:
+            # Container /etc is a copy, the host's is never written
+            shutil.copytree("/etc", os.path.join(root, "etc"), symlinks=True)
+            os.makedirs(os.path.join(root, "managed"))
+            managed = Path(root, "managed", "resolv.conf")
+            managed.write_text("nameserver 127.0.0.11\n")
+
+            process = await asyncio.create_subprocess_exec(
+                *("unshare", "-m", "--propagation", "private"),
+                *("bash", "-c", _CONTAINER, "container", root, str(_ENTRYPOINT)),
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.DEVNULL,
+            )
+            transport = _ShellTransport(process)
+            env = ContainerEnvironment("test")
+            env._dockerContainer._channel = CommandChannel(transport)
+            env._dockerContainer._container = _HostArchive(root)
+            pool = ContainerPool()
+            try:
+                await pool.lease(("test", "none"), env, Probe("", "", "", ""))
+                entrypoint_conf = await env.read_file("/etc/resolv.conf")
+                self.assertIn("nameserver 8.8.8.8", entrypoint_conf)
+
+                # VPN connection changes DNS
+                await env.exec(
+                    "bash", ["-c", "echo nameserver 10.8.0.1 > /etc/resolv.conf"]
+                )
+                self.assertIsNotNone(await pool.verify(env))
+
+                await pool.reset(env)
+                self.assertIsNone(await pool.verify(env))
+                self.assertEqual(
+                    entrypoint_conf, await env.read_file("/etc/resolv.conf")
+                )
+                self.assertEqual("nameserver 127.0.0.11\n", managed.read_text())
+            finally:
+                await env._dockerContainer._channel.close()
+                await transport.stop()
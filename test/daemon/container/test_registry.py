@@ -0,0 +1,110 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from aiodocker.containers import DockerContainer
+
+from vpnspeed.container import registry
+from vpnspeed.container.registry import (
+    INSTANCE_LABEL,
+    RUN_LABEL,
+    ContainerRegistry,
+)
+from utils import async_test
+
+
+class _FakeContainers:
+    def __init__(self):
+        self.listed = []
+        self.deleted = []
+
+    def add(self, container_id, instance, run="run", age=3600):
+        self.listed.append(
+            {
+                "Id": container_id,
+                "Labels": {INSTANCE_LABEL: instance, RUN_LABEL: run},
+                "Created": int(time.time() - age),
+            }
+        )
+
+    async def list(self, **kwargs):
+        return [DockerContainer(None, **data) for data in self.listed]
+
+    def container(self, container_id):
+        containers = self
+
+        class _Container:
+            async def delete(self, force=False):
+                containers.deleted.append(container_id)
+
+        return _Container()
+
+
+class _FakeDocker:
+    def __init__(self):
+        self.containers = _FakeContainers()
+
+
+class TestContainerRegistry(unittest.TestCase):
+    def setUp(self):
+        self.docker = _FakeDocker()
+        patcher = mock.patch.object(registry.docker_clients, "get", lambda: self.docker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "containers.json")
+
+    @async_test
+    async def test_state_file_tracks_containers(self):
+        containers = ContainerRegistry()
+        await containers.start(self.path)
+        run = containers.new_run()
+        self.assertEqual(
+            {INSTANCE_LABEL: containers.instance, RUN_LABEL: run}, containers.labels(run)
+        )
+        containers.track("c1", "nordvpn_openvpn_0", run)
+        with open(self.path) as f:
+            state = json.load(f)
+        self.assertEqual(containers.instance, state["instance"])
+        self.assertEqual(["c1"], [c["id"] for c in state["containers"]])
+
+        stats = containers.stats()
+        self.assertEqual(1, stats.running)
+        self.assertEqual("nordvpn_openvpn_0", stats.containers[0].name)
+        self.assertGreaterEqual(stats.oldest_age, 0)
+
+        containers.untrack("c1", run)
+        self.assertEqual(0, containers.stats().running)
+        await containers.close()
+
+    @async_test
+    async def test_orphans_of_previous_instance_reaped(self):
+        with open(self.path, "w") as f:
+            json.dump({"instance": "old", "containers": [{"id": "unlabeled"}]}, f)
+        self.docker.containers.add("orphan", "old")
+        self.docker.containers.add("other_daemon", "other")
+
+        containers = ContainerRegistry()
+        await containers.start(self.path)
+        self.assertEqual(
+            {"orphan", "unlabeled"}, set(self.docker.containers.deleted)
+        )
+        self.assertEqual(2, containers.stats().reaped)
+        await containers.close()
+
+    @async_test
+    async def test_untracked_own_containers_reaped(self):
+        containers = ContainerRegistry()
+        pending = containers.new_run()
+        containers.track("tracked", "tracked", containers.new_run())
+        self.docker.containers.add("tracked", containers.instance)
+        self.docker.containers.add("creating", containers.instance, run=pending)
+        self.docker.containers.add("young", containers.instance, age=1)
+        self.docker.containers.add("leaked", containers.instance)
+
+        self.assertEqual(1, await containers.reap())
+        self.assertEqual(["leaked"], self.docker.containers.deleted)
@@ -0,0 +1,130 @@
+import asyncio
+import json
+import unittest
+
+from aiodocker.stream import Message
+
+from vpnspeed.container.stream import (
+    STDERR,
+    STDOUT,
+    ExecOutput,
+    ExecStream,
+    JSONStreamDecoder,
+    LineDecoder,
+    json_values,
+)
+from utils import async_test
+
+
+class _FakeResultStream:
+    def __init__(self, messages, delay=0):
+        self._messages = list(messages)
+        self._delay = delay
+        self.closed = False
+
+    async def read_out(self):
+        await asyncio.sleep(self._delay)
+        return self._messages.pop(0) if self._messages else None
+
+    async def close(self):
+        self.closed = True
+
+
+class _FakeExec:
+    def __init__(self, stream, code):
+        self.stream = stream
+        self.code = code
+
+    def start(self):
+        return self.stream
+
+    async def inspect(self):
+        return {"ExitCode": self.code}
+
+
+class _FakeContainer:
+    def __init__(self, messages, code=0, delay=0):
+        self.execute = _FakeExec(_FakeResultStream(messages, delay), code)
+
+    async def exec(self, cmd, **kwargs):
+        return self.execute
+
+
+class TestLineDecoder(unittest.TestCase):
+    def test_split_lines(self):
+        decoder = LineDecoder()
+        self.assertEqual([], decoder.feed(b"par"))
+        self.assertEqual(["partial", "next"], decoder.feed(b"tial\r\nnext\nla"))
+        self.assertEqual(["la"], decoder.flush())
+        self.assertEqual([], decoder.flush())
+
+    def test_long_line_cut(self):
+        decoder = LineDecoder(max_line=4)
+        self.assertEqual(["abcd", "efgh"], decoder.feed(b"abcdefghij"))
+        self.assertEqual(["ij"], decoder.flush())
+
+
+class TestJSONStreamDecoder(unittest.TestCase):
+    def test_split_values(self):
+        text = '[info] starting\n{"a": "}{", "b": [1, {"c": "\\""}]}{"d": 2}\n'
+        decoder = JSONStreamDecoder()
+        values = []
+        for i in range(0, len(text), 3):
+            values.extend(decoder.feed(text[i : i + 3]))
+        self.assertEqual([{"a": "}{", "b": [1, {"c": '"'}]}, {"d": 2}], values)
+
+    def test_bracketed_text_skipped(self):
+        decoder = JSONStreamDecoder()
+        self.assertEqual([[1, 2]], decoder.feed("[error] failed [1, 2]"))
+
+    def test_large_value_dropped(self):
+        decoder = JSONStreamDecoder(max_size=10)
+        self.assertEqual([], decoder.feed('{"value": "' + "x" * 20))
+        self.assertEqual([{"a": 1}], decoder.feed('"}\n{"a": 1}'))
+
+
+class TestExecStream(unittest.TestCase):
+    @async_test
+    async def test_lines_and_returncode(self):
+        result = json.dumps({"type": "result", "download": {"bandwidth": 1}})
+        container = _FakeContainer(
+            [
+                Message(STDOUT, b'{"type": "ping"}\n' + result[:10].encode()),
+                Message(STDERR, b"warning\n"),
+                Message(STDOUT, result[10:].encode()),
+            ],
+            code=0,
+        )
+        async with ExecStream(container, ["speedtest"]) as stream:
+            lines = [output async for output in stream]
+        self.assertEqual(
+            [
+                ExecOutput(STDOUT, '{"type": "ping"}'),
+                ExecOutput(STDERR, "warning"),
+                ExecOutput(STDOUT, result),
+            ],
+            lines,
+        )
+        self.assertEqual(0, stream.returncode)
+        self.assertEqual(["warning"], list(stream.stderr))
+        self.assertTrue(container.execute.stream.closed)
+
+    @async_test
+    async def test_json_values(self):
+        container = _FakeContainer(
+            [Message(STDOUT, b'{"a":\n'), Message(STDOUT, b" 1}\n{}\n")], code=1
+        )
+        async with ExecStream(container, ["cmd"]) as stream:
+            values = [value async for value in json_values(stream)]
+        self.assertEqual([{"a": 1}, {}], values)
+        self.assertEqual(1, stream.returncode)
+
+    @async_test
+    async def test_timeout(self):
+        container = _FakeContainer([Message(STDOUT, b"line\n")] * 10, delay=0.05)
+        with self.assertRaises(asyncio.TimeoutError):
+            async with ExecStream(container, ["cmd"], timeout=0.1) as stream:
+                async for _ in stream:
+                    pass
+        self.assertTrue(container.execute.stream.closed)
+        self.assertIsNone(stream.returncode)
@@ -1,5 +1,6 @@
 import os
 import unittest
+from dataclasses import replace
 from datetime import datetime, date
 
 from utils import async_test
@@ -218,3 +219,52 @@ class TestDynamicBackups(unittest.TestCase):
         self.assertEqual(set(GROUPS.values()), await backup.retrieve_groups())
 
         await backup.stop()
+
+    @async_test
+    async def test_run_phases(self):
+        run = replace(
+            RUNS["de"][0][0],
+            phases=(
+                Phase(name="create", start=0.0, duration=1.5),
+                Phase(name="connect", start=2.0, duration=3.25),
+            ),
+        )
+        expected = [
+            {"name": "create", "start": 0.0, "duration": 1.5},
+            {"name": "connect", "start": 2.0, "duration": 3.25},
+        ]
+        path = os.path.join(os.path.realpath(os.path.dirname(__file__)), "phases.csv")
+        for name, url in (("sqlite", ":memory:"), ("csv", path)):
+            backup = DynamicDataBackup(name)
+            await backup.start(url=url)
+            try:
+                await backup.send(PROBES[0], GROUPS["de"], CASES[0], run)
+                await backup.send(*dataset(0, "us", 1, 1, 2))
+                rows = await backup.retrieve()
+                by_country = {row["group_vpn_country"]: row for row in rows}
+                self.assertEqual(expected, by_country["de"]["run_phases"], name)
+                self.assertNotIn("run_phases", by_country["us"], name)
+            finally:
+                await backup.stop()
+        os.remove(path)
+
+    @async_test
+    async def test_server_checks(self):
+        checked = datetime(2021, 1, 1, 12, 0)
+        backup = DynamicDataBackup("sqlite")
+        await backup.start(url=":memory:")
+        try:
+            await backup.save_server_check(
+                ServerCheck(host="a.example", port=8080, valid=True, checked=checked)
+            )
+            # Latest check of a server replaces the previous one
+            await backup.save_server_check(
+                ServerCheck(host="a.example", port=8080, valid=False, checked=checked)
+            )
+            self.assertEqual(
+                [ServerCheck(host="a.example", port=8080, valid=False, checked=checked)],
+                await backup.retrieve_server_checks(),
+            )
+        finally:
+            await backup.stop()
+        self.assertEqual([], await DynamicDataBackup("csv").retrieve_server_checks())
@@ -1,6 +1,7 @@
 import unittest
 import os
 import json
+import tempfile
 import pandas as pd
 import numpy as np
 from pandas import DataFrame, Index
@@ -192,11 +193,9 @@ class TestReportGenerator(unittest.TestCase):
 
         # Just run generation logic to ensure no runtime issues
         self.filter_full.outliers = 0.01
-        path = await self.generator.make_plots(
-            os.path.dirname(__file__), self.filter_full
-        )
-        self.assertTrue(os.path.exists(path))
-        os.remove(path)
+        with tempfile.TemporaryDirectory() as output:
+            path = await self.generator.make_plots(output, self.filter_full)
+            self.assertTrue(os.path.exists(path))
 
     def assertEqualDF(self, first: DataFrame, second: DataFrame):
         self.assertEqual(
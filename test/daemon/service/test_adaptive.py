@@ -0,0 +1,63 @@
+import unittest
+
+import vpnspeed.service.model as m
+from vpnspeed.service import adaptive
+
+GROUP = m.TestGroup(vpn_country="de", target_country="de")
+PARAMS = adaptive.with_defaults(m.Adaptive(confidence=0.95, min_runs=3, max_runs=10))
+
+
+def _case(vpn, *samples):
+    case = m.Case(case=m.TestCase(vpn=vpn), run_count=len(samples))
+    for sample in samples:
+        adaptive.add_sample(case, sample, sample)
+    return case
+
+
+class TestAdaptive(unittest.TestCase):
+    def test_running_stats(self):
+        stats = m.RunningStats()
+        for value in (2, 4, 4, 4, 5, 5, 7, 9):
+            stats.add(value)
+        self.assertEqual(8, stats.count)
+        self.assertAlmostEqual(5.0, stats.mean)
+        self.assertAlmostEqual(32 / 7, stats.variance)
+
+    def test_separated_cases_resolved(self):
+        group = m.Group(
+            group=GROUP,
+            cases=[_case("fast", 100, 101, 99), _case("slow", 50, 51, 49)],
+        )
+        adaptive.update_resolved(group, PARAMS)
+        self.assertTrue(all(case.resolved for case in group.cases))
+        self.assertTrue(adaptive.all_resolved([group]))
+
+    def test_overlapping_cases_unresolved(self):
+        group = m.Group(
+            group=GROUP,
+            cases=[
+                _case("fast", 100, 101, 99),
+                _case("slow", 50, 51, 49),
+                _case("close", 51, 49, 52),
+            ],
+        )
+        adaptive.update_resolved(group, PARAMS)
+        self.assertEqual(
+            [True, False, False], [case.resolved for case in group.cases]
+        )
+
+    def test_not_enough_runs_unresolved(self):
+        group = m.Group(
+            group=GROUP,
+            cases=[_case("fast", 100, 101, 99), _case("slow", 50, 51)],
+        )
+        adaptive.update_resolved(group, PARAMS)
+        self.assertFalse(any(case.resolved for case in group.cases))
+
+    def test_run_budget_resolves(self):
+        group = m.Group(
+            group=GROUP,
+            cases=[_case("same", *[50] * 10), _case("other", *[50] * 10)],
+        )
+        adaptive.update_resolved(group, PARAMS)
+        self.assertTrue(all(case.resolved for case in group.cases))
@@ -0,0 +1,131 @@
+import os
+import tempfile
+import unittest
+
+import vpnspeed.service.model as m
+from vpnspeed import errors
+from vpnspeed.service.breaker import CircuitBreakers
+
+GROUP = m.TestGroup("de", "us")
+OTHER_GROUP = m.TestGroup("fr", "us")
+CASE = m.TestCase("vpn", "openvpn", "udp")
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TestCircuitBreakers(unittest.TestCase):
+    def fail(self, group, case, error, times=2):
+        for _ in range(times):
+            self.breakers.record_failure(group, case, error)
+
+    def setUp(self):
+        self.clock = _Clock()
+        self.breakers = CircuitBreakers(
+            clock=self.clock, threshold=2, cooldown=10, max_cooldown=25
+        )
+
+    def test_run_errors_open_after_threshold(self):
+        self.breakers.record_failure(GROUP, CASE, errors.VPNConnectionFailed())
+        self.assertFalse(self.breakers.is_open(GROUP, CASE))
+        self.breakers.record_failure(GROUP, CASE, errors.VPNConnectionFailed())
+        self.assertTrue(self.breakers.is_open(GROUP, CASE))
+        self.assertFalse(self.breakers.is_open(OTHER_GROUP, CASE))
+        self.assertEqual(10, self.breakers.next_retry())
+
+    def test_success_resets_failures(self):
+        self.breakers.record_failure(GROUP, CASE, errors.VPNConnectionFailed())
+        self.breakers.record_success(GROUP, CASE)
+        self.breakers.record_failure(GROUP, CASE, errors.VPNConnectionFailed())
+        self.assertFalse(self.breakers.is_open(GROUP, CASE))
+
+    def test_case_error_opens_case_in_all_groups(self):
+        self.breakers.record_failure(GROUP, CASE, errors.TechnologyNotSupported())
+        self.assertFalse(self.breakers.is_open(OTHER_GROUP, CASE))
+        self.breakers.record_failure(OTHER_GROUP, CASE, errors.TechnologyNotSupported())
+        self.assertTrue(self.breakers.is_open(GROUP, CASE))
+        self.assertTrue(self.breakers.is_open(OTHER_GROUP, CASE))
+        self.assertFalse(self.breakers.group_open(GROUP))
+
+    def test_group_error_opens_group(self):
+        # A single failing provider does not block the group
+        self.breakers.record_failure(GROUP, None, errors.TesterServersNotFound())
+        self.assertFalse(self.breakers.group_open(GROUP))
+        self.breakers.record_failure(GROUP, None, errors.TesterServersNotFound())
+        self.assertTrue(self.breakers.group_open(GROUP))
+        self.assertTrue(self.breakers.is_open(GROUP, CASE))
+        self.assertFalse(self.breakers.is_open(OTHER_GROUP, CASE))
+
+    def test_half_open_trial(self):
+        self.fail(GROUP, CASE, errors.TechnologyNotSupported())
+        self.clock.now = 9
+        self.assertFalse(self.breakers.poll())
+        self.clock.now = 10
+        self.assertTrue(self.breakers.poll())
+        self.assertFalse(self.breakers.is_open(GROUP, CASE))
+        self.assertEqual(m.BreakerState.half_open, self.breakers.breakers()[0].state)
+
+        # Failed trial opens again with doubled cooldown, capped
+        self.breakers.record_failure(GROUP, CASE, errors.TechnologyNotSupported())
+        self.assertTrue(self.breakers.is_open(GROUP, CASE))
+        self.assertEqual(20, self.breakers.next_retry())
+        self.clock.now = 30
+        self.breakers.poll()
+        self.breakers.record_failure(GROUP, CASE, errors.TechnologyNotSupported())
+        self.assertEqual(25, self.breakers.next_retry())
+
+        self.clock.now = 55
+        self.breakers.poll()
+        self.breakers.record_success(GROUP, CASE)
+        self.assertEqual([], self.breakers.breakers())
+        self.assertIsNone(self.breakers.next_retry())
+
+    def test_single_trial(self):
+        self.fail(None, CASE, errors.TechnologyNotSupported())
+        self.clock.now = 10
+        self.breakers.poll()
+        self.assertFalse(self.breakers.is_open(GROUP, CASE))
+        self.assertTrue(self.breakers.begin(GROUP, CASE))
+        # Only the trial runs, in no other group either
+        self.assertTrue(self.breakers.is_open(GROUP, CASE))
+        self.assertTrue(self.breakers.is_open(OTHER_GROUP, CASE))
+        self.assertFalse(self.breakers.begin(OTHER_GROUP, CASE))
+        self.assertFalse(self.breakers.end(OTHER_GROUP, CASE))
+        self.assertTrue(self.breakers.is_open(OTHER_GROUP, CASE))
+
+        # Trial ended without a result, e.g. cancelled
+        self.assertTrue(self.breakers.end(GROUP, CASE))
+        self.assertFalse(self.breakers.is_open(OTHER_GROUP, CASE))
+
+        self.breakers.begin(OTHER_GROUP, CASE)
+        self.breakers.record_failure(
+            OTHER_GROUP, CASE, errors.TechnologyNotSupported()
+        )
+        self.assertTrue(self.breakers.end(OTHER_GROUP, CASE))
+        self.assertTrue(self.breakers.is_open(GROUP, CASE))
+        self.assertFalse(self.breakers.begin(GROUP, CASE))
+
+    def test_rename(self):
+        self.fail(GROUP, None, errors.TesterServersNotFound())
+        renamed = m.TestGroup("de", "us", "berlin")
+        self.breakers.rename(GROUP, renamed)
+        self.assertFalse(self.breakers.group_open(GROUP))
+        self.assertTrue(self.breakers.group_open(renamed))
+
+    def test_persisted(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "breakers.json")
+            breakers = CircuitBreakers(path, clock=self.clock, threshold=1)
+            breakers.record_failure(GROUP, CASE, errors.TechnologyNotSupported())
+
+            restored = CircuitBreakers(path, clock=self.clock)
+            self.assertTrue(restored.is_open(GROUP, CASE))
+            self.assertEqual(breakers.breakers(), restored.breakers())
+
+            restored.record_success(GROUP, CASE)
+            self.assertEqual([], CircuitBreakers(path, clock=self.clock).breakers())
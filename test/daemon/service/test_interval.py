@@ -0,0 +1,45 @@
+import unittest
+from datetime import datetime
+
+import vpnspeed.service.model as m
+from vpnspeed.service.interval import make_policy
+
+
+def _run(moved: int) -> m.TestRun:
+    return m.TestRun(
+        timestamp=datetime.now(),
+        ping_latency=1.0,
+        ping_jitter=0.1,
+        download_bandwidth=1,
+        download_bytes=moved // 2,
+        download_elapsed=1,
+        upload_bandwidth=1,
+        upload_bytes=moved // 2,
+        upload_elapsed=1,
+        isp="isp",
+        server_ip="1.1.1.1",
+        server_country="Germany",
+        server_country_code="DE",
+        server_location="Berlin",
+    )
+
+
+class TestIntervalPolicy(unittest.TestCase):
+    def test_fixed(self):
+        policy = make_policy()
+        self.assertEqual(180, policy.delay(180))
+        self.assertEqual(180, policy.delay(180, _run(100)))
+
+    def test_success(self):
+        policy = make_policy(m.IntervalPolicy(name="success", min_interval=10))
+        self.assertEqual(10, policy.delay(180))
+        self.assertEqual(180, policy.delay(180, _run(100)))
+
+    def test_traffic(self):
+        policy = make_policy(
+            m.IntervalPolicy(name="traffic", min_interval=10, reference_bytes=1000)
+        )
+        self.assertEqual(10, policy.delay(180))
+        self.assertEqual(10, policy.delay(180, _run(20)))
+        self.assertEqual(90, policy.delay(180, _run(500)))
+        self.assertEqual(180, policy.delay(180, _run(5000)))
@@ -0,0 +1,97 @@
+import unittest
+
+import vpnspeed.service.model as m
+from vpnspeed.service.scheduler import SchedulerIndex
+
+OPTION = [
+    (
+        m.TestGroup(vpn_country=f"from-{i}", target_country=f"to-{i}"),
+        m.TestCase(vpn=f"via-{i}"),
+    )
+    for i in range(3)
+]
+
+
+def _group(i, *run_counts):
+    return m.Group(
+        group=OPTION[i][0],
+        cases=[
+            m.Case(case=OPTION[j][1], run_count=runs, fail_count=0)
+            for j, runs in enumerate(run_counts)
+        ],
+    )
+
+
+class TestSchedulerIndex(unittest.TestCase):
+    def test_update_after_run(self):
+        group = _group(0, 0, 1)
+        index = SchedulerIndex([group])
+        self.assertEqual((OPTION[0][0], OPTION[0][1]), index.select())
+
+        group.cases[0].run_count += 1
+        index.update(group)
+        self.assertIn(
+            index.select(),
+            [(OPTION[0][0], OPTION[0][1]), (OPTION[0][0], OPTION[1][1])],
+        )
+
+        group.cases[0].run_count += 1
+        index.update(group)
+        self.assertEqual((OPTION[0][0], OPTION[1][1]), index.select())
+
+    def test_update_prefers_uneven_group(self):
+        even, uneven = _group(0, 1, 1), _group(1, 5, 5)
+        index = SchedulerIndex([even, uneven])
+        self.assertEqual(OPTION[0][0], index.select()[0])
+
+        uneven.cases[0].run_count += 1
+        index.update(uneven)
+        self.assertEqual((OPTION[1][0], OPTION[1][1]), index.select())
+
+    def test_update_failing_group(self):
+        first, second = _group(0, 0), _group(1, 3)
+        index = SchedulerIndex([first, second])
+
+        first.failing = True
+        index.update(first)
+        self.assertEqual((OPTION[1][0], OPTION[0][1]), index.select())
+
+        first.failing = False
+        index.update(first)
+        self.assertEqual((OPTION[0][0], OPTION[0][1]), index.select())
+
+    def test_remove_group(self):
+        first, second = _group(0, 0), _group(1, 3)
+        index = SchedulerIndex([first, second])
+
+        index.remove(first.group)
+        self.assertEqual((OPTION[1][0], OPTION[0][1]), index.select())
+
+        index.remove(second.group)
+        self.assertIsNone(index.select())
+
+    def test_select_covers_all_ties(self):
+        groups = [_group(i, 0, 0, 0) for i in range(3)]
+        index = SchedulerIndex(groups)
+        expected = {(g.group, c.case) for g in groups for c in g.cases}
+        selected = {index.select() for _ in range(500)}
+        self.assertEqual(expected, selected)
+
+    def test_hourly(self):
+        group = _group(0, 2, 5)
+        group.cases[0].runs_by_hour[10] = 2
+        group.cases[1].runs_by_hour[11] = 5
+        index = SchedulerIndex([group], hour=10)
+        # Case with more runs overall, but none in this hour, goes first
+        self.assertEqual((OPTION[0][0], OPTION[1][1]), index.select())
+
+        index.set_hour(11)
+        self.assertEqual((OPTION[0][0], OPTION[0][1]), index.select())
+
+        index.set_hour(None)
+        self.assertEqual((OPTION[0][0], OPTION[0][1]), index.select())
+
+    def test_hourly_ties_broken_by_runs(self):
+        group = _group(0, 3, 1)
+        index = SchedulerIndex([group], hour=0)
+        self.assertEqual((OPTION[0][0], OPTION[1][1]), index.select())
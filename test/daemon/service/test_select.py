@@ -246,3 +246,72 @@ class TestSelect(unittest.TestCase):
         ]
 
         self.assertIsNone(select(groups))
+
+    def test_select_counts_running_as_runs(self):
+        groups = [
+            m.Group(
+                group=OPTION[0][0],
+                cases=[
+                    m.Case(
+                        case=OPTION[0][1],
+                        run_count=1,
+                        fail_count=0,
+                        running=1,
+                    ),
+                    m.Case(
+                        case=OPTION[1][1],
+                        run_count=1,
+                        fail_count=0,
+                    ),
+                ],
+            )
+        ]
+
+        self.assertEqual((OPTION[0][0], OPTION[1][1]), select(groups))
+
+    def test_select_ignore_running_case(self):
+        groups = [
+            m.Group(
+                group=OPTION[0][0],
+                cases=[
+                    m.Case(
+                        case=OPTION[0][1],
+                        run_count=0,
+                        fail_count=0,
+                        running=1,
+                    ),
+                ],
+            ),
+        ]
+
+        self.assertIsNone(select(groups))
+
+    def test_select_skip_keeps_least_run(self):
+        groups = [
+            m.Group(
+                group=OPTION[0][0],
+                cases=[
+                    m.Case(
+                        case=OPTION[0][1],
+                        run_count=1,
+                        fail_count=0,
+                    ),
+                    m.Case(
+                        case=OPTION[1][1],
+                        run_count=1,
+                        fail_count=0,
+                    ),
+                    m.Case(
+                        case=OPTION[2][1],
+                        run_count=2,
+                        fail_count=0,
+                    ),
+                ],
+            ),
+        ]
+
+        skip = lambda group, case: case == OPTION[0][1]
+        self.assertEqual((OPTION[0][0], OPTION[1][1]), select(groups, skip=skip))
+
+        skip = lambda group, case: case != OPTION[2][1]
+        self.assertIsNone(select(groups, skip=skip))
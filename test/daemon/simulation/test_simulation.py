@@ -0,0 +1,54 @@
+import unittest
+
+from vpnspeed.model import *
+from vpnspeed.simulation import Simulation, Profile
+
+GROUPS = {TestGroup(f"c{i}", f"t{i}") for i in range(20)}
+CASES = {TestCase(f"provider{i}", "openvpn") for i in range(3)}
+DAY = 24 * 3600
+
+
+class TestSimulation(unittest.TestCase):
+    def test_deterministic(self):
+        first = Simulation(GROUPS, CASES, seed=1).run(DAY)
+        second = Simulation(GROUPS, CASES, seed=1).run(DAY)
+        first.wall_time = second.wall_time = None
+        self.assertEqual(first, second)
+        self.assertEqual(DAY, first.duration)
+        self.assertGreater(first.runs, 0)
+
+    def test_concurrent_runs_stay_fair(self):
+        report = Simulation(GROUPS, CASES, concurrency=4).run(DAY)
+        self.assertGreaterEqual(report.fairness, 0.9)
+        self.assertLessEqual(report.max_runs - report.min_runs, 3)
+
+    def test_failures_counted(self):
+        profile = Profile(test_failure=1.0)
+        report = Simulation(GROUPS, CASES, profile=profile).run(DAY)
+        self.assertEqual(0, report.runs)
+        self.assertGreater(report.failed_runs, 0)
+
+    def test_broken_case_retried_with_cooldown(self):
+        groups = {TestGroup(f"c{i}", f"t{i}") for i in range(2)}
+        cases = {TestCase("provider0", "openvpn"), TestCase("provider0", "unknown")}
+        report = Simulation(groups, cases, interval=10).run(DAY)
+        # Every cycle would fail the unknown technology without breakers
+        self.assertLess(report.failed_runs, 300)
+        self.assertGreater(report.runs, 1000)
+
+    def test_hourly_scheduling_balances_hours(self):
+        default = Simulation(GROUPS, CASES, concurrency=2).run(7 * DAY)
+        hourly = Simulation(GROUPS, CASES, concurrency=2, scheduling="hourly").run(
+            7 * DAY
+        )
+        self.assertGreater(hourly.hourly_fairness, default.hourly_fairness)
+        self.assertGreaterEqual(hourly.hourly_fairness, 0.95)
+        self.assertGreaterEqual(hourly.fairness, 0.99)
+
+    def test_shared_image_pool(self):
+        own = Simulation(GROUPS, CASES, pool=Pool()).run(DAY)
+        shared = Simulation(GROUPS, CASES, pool=Pool(share_images=True)).run(DAY)
+        self.assertEqual(0, own.pool_shared)
+        self.assertGreater(shared.pool_shared, 0)
+        # Every provider reuses containers of the others
+        self.assertGreater(shared.pool_reuses, own.pool_reuses)
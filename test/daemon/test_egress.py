@@ -0,0 +1,139 @@
+import asyncio
+import shutil
+import unittest
+from asyncio.subprocess import PIPE
+
+from vpnspeed.container.stream import STDERR, STDOUT, ExecOutput
+from vpnspeed.egress import EgressDetector, egress_ip
+from vpnspeed.simulation import EchoServer, FakeExecStream
+from utils import async_test
+
+
+class _ShellEnv:
+    """Runs commands locally instead of in a container."""
+
+    def stream_exec(self, cmd, args=None, timeout=600, user="root"):
+        return FakeExecStream(self._run(cmd, args or []), timeout)
+
+    async def _run(self, cmd, args):
+        proc = await asyncio.create_subprocess_exec(cmd, *args, stdout=PIPE)
+        try:
+            async for line in proc.stdout:
+                yield ExecOutput(STDOUT, line.decode().rstrip("\n"))
+        finally:
+            if proc.returncode is None:
+                proc.kill()
+            await proc.wait()
+
+
+class _CannedEnv:
+    def __init__(self, lines):
+        self.lines = lines
+
+    def stream_exec(self, cmd, args=None, timeout=600, user="root"):
+        return FakeExecStream(self._lines(), timeout)
+
+    async def _lines(self):
+        for line in self.lines:
+            yield line
+
+
+class TestEgressDetector(unittest.TestCase):
+    def test_egress_ip(self):
+        self.assertEqual("192.0.2.1", egress_ip("192.0.2.1\n"))
+        self.assertEqual("2001:db8::1", egress_ip(" 2001:db8::1"))
+        self.assertIsNone(egress_ip("<html>"))
+        self.assertIsNone(egress_ip(None))
+
+    def test_ordering(self):
+        detector = EgressDetector(["a", "b", "c"])
+        self.assertEqual(["a", "b", "c"], detector.endpoints())
+        detector.record("a", 0.3)
+        detector.record("b", 0.1)
+        detector.record("c")
+        self.assertEqual(["b", "a", "c"], detector.endpoints())
+        self.assertAlmostEqual(0.2, detector.hedge_delay())
+
+        detector.record("b", 0.5)
+        self.assertEqual(0.22, detector.stats()[0].latency)
+        self.assertEqual(("c", 1, 1), tuple(vars(detector.stats()[-1]).values())[:3])
+
+    @async_test
+    async def test_hedged_host_detection(self):
+        async with EchoServer() as server:
+            slow = server.set("slow", ip="192.0.2.10", delay=2)
+            fast = server.set("fast", ip="192.0.2.20")
+            detector = EgressDetector([slow, fast])
+            # Slow endpoint is believed fastest, hedge after 0.1s
+            detector.record(slow, 0.05)
+            detector.record(fast, 0.06)
+            self.assertEqual("192.0.2.20", await detector.detect_host(timeout=5))
+            self.assertEqual({"slow": 1, "fast": 1}, server.requests)
+            self.assertEqual([fast, slow], detector.endpoints())
+
+    def test_abandoned(self):
+        detector = EgressDetector(["a", "b"])
+        detector.record("a")
+        detector.record("a", 0.1)
+        detector.record("a")
+        detector.record_abandoned("a", 0.5)
+        # Slower at least, but not healthy again
+        stats = detector.stats()[-1]
+        self.assertEqual(("a", 3, 2, 1, 0.5), tuple(vars(stats).values()))
+        detector.record_abandoned("a", 0.2)
+        self.assertEqual(0.5, detector.stats()[-1].latency)
+
+    @async_test
+    async def test_failing_endpoint_skipped(self):
+        async with EchoServer() as server:
+            broken = server.set("broken", status=500)
+            detector = EgressDetector([broken, server.url("ok")])
+            detector.record(broken, 0.01)
+            detector.record(server.url("ok"), 0.02)
+            self.assertEqual("192.0.2.1", await detector.detect_host(timeout=5))
+            stats = {s.url: s for s in detector.stats()}
+            self.assertEqual(1, stats[broken].consecutive_failures)
+            self.assertEqual(server.url("ok"), detector.endpoints()[0])
+
+    @async_test
+    async def test_agreement(self):
+        async with EchoServer() as server:
+            urls = [
+                server.set("a", ip="192.0.2.1"),
+                server.set("b", ip="192.0.2.2"),
+                server.set("c", ip="192.0.2.1", delay=0.1),
+            ]
+            detector = EgressDetector(urls, agree=2)
+            for url in urls:
+                detector.record(url, 0.05)
+            self.assertEqual("192.0.2.1", await detector.detect_host(timeout=5))
+
+    @async_test
+    async def test_container_answers(self):
+        env = _CannedEnv(
+            [
+                ExecOutput(STDERR, "noise"),
+                ExecOutput(STDOUT, "a 22 0.010"),
+                ExecOutput(STDOUT, "b 0 <html> 0.020"),
+                ExecOutput(STDOUT, "c 0 198.51.100.7 0.030"),
+            ]
+        )
+        detector = EgressDetector(["a", "b", "c"])
+        self.assertEqual("198.51.100.7", await detector.detect(env))
+        stats = {s.url: s for s in detector.stats()}
+        self.assertEqual(1, stats["a"].failures)
+        self.assertEqual(1, stats["b"].failures)
+        self.assertEqual(0.03, stats["c"].latency)
+
+    @unittest.skipIf(shutil.which("curl") is None, "curl is not installed")
+    @async_test
+    async def test_container_script(self):
+        async with EchoServer(ip="198.51.100.1") as server:
+            broken = server.set("broken", status=503)
+            detector = EgressDetector([broken, server.url("ok")])
+            detector.record(broken, 0.01)
+            detector.record(server.url("ok"), 0.02)
+            self.assertEqual("198.51.100.1", await detector.detect(_ShellEnv(), 5))
+            stats = {s.url: s for s in detector.stats()}
+            self.assertEqual(1, stats[broken].failures)
+            self.assertIsNotNone(stats[server.url("ok")].latency)
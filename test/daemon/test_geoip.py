@@ -0,0 +1,214 @@
+import ipaddress
+import os
+import struct
+import tempfile
+import unittest
+from typing import NamedTuple
+
+from vpnspeed.geoip import (
+    GeoBackend,
+    GeoLocation,
+    GeoResolver,
+    MMDBBackend,
+    MMDBReader,
+)
+from utils import async_test
+
+
+class _Pointer(NamedTuple):
+    offset: int
+
+
+def _control(kind: int, size: int) -> bytes:
+    if kind <= 7:
+        return bytes([(kind << 5) | size])
+    return bytes([size, kind - 7])
+
+
+def _encode(value) -> bytes:
+    if isinstance(value, _Pointer):
+        return bytes([(1 << 5) | (value.offset >> 8), value.offset & 0xFF])
+    if isinstance(value, dict):
+        return _control(7, len(value)) + b"".join(
+            _encode(key) + _encode(item) for key, item in value.items()
+        )
+    if isinstance(value, list):
+        return _control(11, len(value)) + b"".join(_encode(item) for item in value)
+    if isinstance(value, str):
+        raw = value.encode()
+        return _control(2, len(raw)) + raw
+    if isinstance(value, float):
+        return _control(3, 8) + struct.pack(">d", value)
+    raw = value.to_bytes(4, "big").lstrip(b"\0")
+    return _control(6, len(raw)) + raw
+
+
+def _write_db(path: str, networks: dict, ip_version: int = 4, record_size: int = 24):
+    """MaxMind DB of `networks`, record keys "en" are stored once."""
+    en = _Pointer(0)
+    data = bytearray(_encode("en"))
+    nodes = [[None, None]]
+    width = 32 if ip_version == 4 else 128
+    for network, record in networks.items():
+        network = ipaddress.ip_network(network)
+        offset = len(data)
+        data += _encode(_replace_names(record, en))
+        prefix = network.prefixlen + width - network.max_prefixlen
+        bits = int(network.network_address)
+        node = 0
+        for i in range(prefix):
+            bit = (bits >> (width - 1 - i)) & 1
+            if i == prefix - 1:
+                nodes[node][bit] = ("data", offset)
+            else:
+                if nodes[node][bit] is None:
+                    nodes.append([None, None])
+                    nodes[node][bit] = len(nodes) - 1
+                node = nodes[node][bit]
+
+    count = len(nodes)
+
+    def value(record):
+        if record is None:
+            return count
+        if isinstance(record, tuple):
+            return count + 16 + record[1]
+        return record
+
+    tree = bytearray()
+    for left, right in nodes:
+        left, right = value(left), value(right)
+        if record_size == 28:
+            tree += (left & 0xFFFFFF).to_bytes(3, "big")
+            tree.append(((left >> 24) << 4) | (right >> 24))
+            tree += (right & 0xFFFFFF).to_bytes(3, "big")
+        else:
+            tree += left.to_bytes(record_size // 8, "big")
+            tree += right.to_bytes(record_size // 8, "big")
+    metadata = {
+        "node_count": count,
+        "record_size": record_size,
+        "ip_version": ip_version,
+        "database_type": "Test-City",
+        "languages": ["en"],
+    }
+    with open(path, "wb") as f:
+        f.write(tree + b"\0" * 16 + data)
+        f.write(b"\xab\xcd\xefMaxMind.com" + _encode(metadata))
+
+
+def _replace_names(record, en):
+    if isinstance(record, dict):
+        return {
+            (en if key == "en" else key): _replace_names(value, en)
+            for key, value in record.items()
+        }
+    return record
+
+
+NETWORKS = {
+    "81.2.0.0/16": {
+        "country": {"iso_code": "DE", "names": {"en": "Germany"}},
+        "city": {"names": {"en": "Berlin"}},
+        "location": {"latitude": 52.5, "longitude": 13.4},
+    },
+    "2.0.0.0/8": {
+        "registered_country": {"iso_code": "FR", "names": {"en": "France"}},
+    },
+}
+
+
+class TestMMDBReader(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "test.mmdb")
+
+    def test_ipv4_database(self):
+        _write_db(self.path, NETWORKS)
+        reader = MMDBReader(self.path)
+        self.addCleanup(reader.close)
+        self.assertEqual(NETWORKS["81.2.0.0/16"], reader.get("81.2.3.4"))
+        self.assertEqual(NETWORKS["2.0.0.0/8"], reader.get("2.255.0.1"))
+        self.assertIsNone(reader.get("8.8.8.8"))
+        self.assertIsNone(reader.get("::1"))
+
+    def test_ipv4_in_ipv6_database(self):
+        _write_db(self.path, NETWORKS, ip_version=6, record_size=28)
+        reader = MMDBReader(self.path)
+        self.addCleanup(reader.close)
+        self.assertEqual(NETWORKS["81.2.0.0/16"], reader.get("81.2.3.4"))
+        self.assertIsNone(reader.get("81.3.0.1"))
+
+    def test_not_database(self):
+        with open(self.path, "wb") as f:
+            f.write(b"\0" * 64)
+        with self.assertRaises(ValueError):
+            MMDBReader(self.path)
+
+    @async_test
+    async def test_backend_location(self):
+        _write_db(self.path, NETWORKS)
+        backend = MMDBBackend(self.path)
+        self.addCleanup(backend.close)
+        self.assertEqual(
+            GeoLocation(
+                ip="81.2.3.4",
+                country_code="DE",
+                country="Germany",
+                city="Berlin",
+                latitude=52.5,
+                longitude=13.4,
+                provider="mmdb:Test-City",
+            ),
+            await backend.locate("81.2.3.4"),
+        )
+        location = await backend.locate("2.0.0.1")
+        self.assertEqual(("FR", None), (location.country_code, location.city))
+
+
+class _CountingBackend(GeoBackend):
+    def __init__(self, name, locations):
+        self.name = name
+        self.locations = locations
+        self.lookups = []
+
+    async def locate(self, ip):
+        self.lookups.append(ip)
+        country = self.locations.get(ip)
+        return country and GeoLocation(ip=ip, country_code=country, provider=self.name)
+
+
+class TestGeoResolver(unittest.TestCase):
+    @async_test
+    async def test_fallback_and_cache(self):
+        local = _CountingBackend("local", {"192.0.2.1": "LT"})
+        online = _CountingBackend("online", {"192.0.2.2": "DE"})
+        resolver = GeoResolver([local, online])
+        self.assertEqual("local", (await resolver.locate("192.0.2.1")).provider)
+        self.assertEqual("online", (await resolver.locate("192.0.2.2")).provider)
+        self.assertIsNone(await resolver.locate("192.0.2.3"))
+
+        await resolver.locate("192.0.2.1")
+        await resolver.locate("192.0.2.2")
+        self.assertEqual(["192.0.2.1", "192.0.2.2", "192.0.2.3"], local.lookups)
+        self.assertEqual(["192.0.2.2", "192.0.2.3"], online.lookups)
+
+    @async_test
+    async def test_expiry_and_size(self):
+        backend = _CountingBackend("local", {"192.0.2.1": "LT", "192.0.2.2": "DE"})
+        resolver = GeoResolver([backend], size=1, ttl=0)
+        await resolver.locate("192.0.2.1")
+        await resolver.locate("192.0.2.1")
+        self.assertEqual(2, len(backend.lookups))
+
+        resolver = GeoResolver([backend], size=1)
+        await resolver.locate("192.0.2.1")
+        await resolver.locate("192.0.2.2")
+        await resolver.locate("192.0.2.1")
+        self.assertEqual(5, len(backend.lookups))
+
+    def test_missing_database(self):
+        resolver = GeoResolver([])
+        resolver.open("/nonexistent/GeoLite2-City.mmdb")
+        self.assertEqual([], resolver.backends)
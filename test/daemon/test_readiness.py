@@ -0,0 +1,75 @@
+import unittest
+from unittest.mock import patch
+
+from vpnspeed.errors import TestRunError, VPNConnectionFailed
+from vpnspeed.model import Probe
+from vpnspeed.readiness import _WAIT_MAX, wait_for_connection
+from utils import async_test
+
+
+LOCAL = Probe("192.0.2.1", "Germany", "de", "Berlin")
+TUNNEL = Probe("198.51.100.1", "Netherlands", "nl", "Amsterdam")
+
+
+class _Env:
+    """Route waits return at once, reporting `routes` as changes in turn."""
+
+    def __init__(self, routes=()):
+        self.routes = list(routes)
+        self.waits = []
+
+    async def exec(self, cmd, args=None, output=False, timeout=600, **kwargs):
+        # timeout <seconds> bash -c <script> readiness <route>
+        self.waits.append((int(args[0]), args[-1]))
+        if not self.routes:
+            return [-1, None]
+        return [0, "ready {}\n".format(self.routes.pop(0))]
+
+
+class TestWaitForConnection(unittest.TestCase):
+    @async_test
+    async def test_connected_before_route_change(self):
+        # e.g. IPsec policies leave the route as it was
+        env = _Env()
+        with patch("vpnspeed.readiness.make_env_probe", return_value=TUNNEL):
+            probe = await wait_for_connection(env, LOCAL, "eth0", timeout=5)
+        self.assertEqual(TUNNEL, probe)
+        self.assertEqual([], env.waits)
+
+    @async_test
+    async def test_connected_after_route_change(self):
+        env = _Env(routes=["wg0"])
+        probes = [LOCAL, TestRunError("no answer"), TUNNEL]
+        with patch(
+            "vpnspeed.readiness.make_env_probe", side_effect=probes
+        ), self.assertLogs("vpnspeed", "INFO"):
+            probe = await wait_for_connection(env, LOCAL, "eth0", timeout=60)
+        self.assertEqual(TUNNEL, probe)
+        # Once changed, the next wait is for a further change, bounded
+        self.assertEqual([(1, "eth0"), (2, "wg0")], env.waits)
+
+    @async_test
+    async def test_route_unchanged(self):
+        # Waits are bounded, egress is checked after each
+        env = _Env()
+        probes = [LOCAL] * 7 + [TUNNEL]
+        with patch(
+            "vpnspeed.readiness.make_env_probe", side_effect=probes
+        ), self.assertLogs("vpnspeed", "INFO"):
+            probe = await wait_for_connection(env, LOCAL, "eth0", timeout=180)
+        self.assertEqual(TUNNEL, probe)
+        self.assertEqual(
+            [1, 2, 4, 8, _WAIT_MAX, _WAIT_MAX, _WAIT_MAX],
+            [seconds for seconds, _ in env.waits],
+        )
+        self.assertEqual({"eth0"}, {route for _, route in env.waits})
+
+    @async_test
+    async def test_timeout(self):
+        env = _Env()
+        with patch(
+            "vpnspeed.readiness.make_env_probe", return_value=LOCAL
+        ), self.assertLogs("vpnspeed", "INFO"):
+            with self.assertRaises(VPNConnectionFailed):
+                await wait_for_connection(env, LOCAL, "eth0", timeout=0)
+        self.assertEqual([], env.waits)
@@ -0,0 +1,27 @@
+import asyncio
+import unittest
+
+from vpnspeed.timeline import Timeline
+from utils import async_test
+
+
+class TestTimeline(unittest.TestCase):
+    @async_test
+    async def test_phases(self):
+        timeline = Timeline()
+        with timeline.phase("create"):
+            await asyncio.sleep(0.02)
+        with self.assertRaises(RuntimeError):
+            with timeline.phase("login"):
+                raise RuntimeError()
+        with timeline.phase("login"):
+            await asyncio.sleep(0.01)
+
+        phases = timeline.phases()
+        self.assertEqual(["create", "login", "login"], [p.name for p in phases])
+        self.assertEqual(0.0, phases[0].start)
+        self.assertGreaterEqual(phases[0].duration, 0.02)
+        self.assertGreaterEqual(phases[2].start, phases[0].duration)
+        durations = timeline.durations()
+        self.assertEqual({"create", "login"}, set(durations))
+        self.assertGreaterEqual(durations["login"], 0.01)
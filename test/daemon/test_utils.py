@@ -0,0 +1,75 @@
+import asyncio
+import socket
+import unittest
+
+from vpnspeed import utils
+from vpnspeed.utils import (
+    HostLatency,
+    measure_hosts_latency,
+    nearest_host_from_list,
+)
+from utils import async_test
+
+
+def _closed_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class TestHostLatency(unittest.TestCase):
+    def setUp(self):
+        utils._latency_cache.clear()
+        self.addCleanup(utils._latency_cache.clear)
+
+    async def _serve(self):
+        connections = []
+
+        def accept(reader, writer):
+            connections.append(writer)
+            writer.close()
+
+        server = await asyncio.start_server(accept, "127.0.0.1", 0)
+        self.addCleanup(server.close)
+        return server.sockets[0].getsockname()[1], connections
+
+    def test_distribution(self):
+        latency = HostLatency("host", rtts=[0.001, 0.003, 0.002], failures=1)
+        self.assertEqual(0.001, latency.min)
+        self.assertEqual(0.002, latency.median)
+        self.assertEqual(0.003, latency.max)
+        self.assertIn("3/4 ok", str(latency))
+        self.assertIsNone(HostLatency("host").median)
+
+    @async_test
+    async def test_nearest_reachable_host(self):
+        port, connections = await self._serve()
+        host = await nearest_host_from_list(
+            ["127.0.0.1", "unresolvable.invalid"], port, retry=3, timeout=1
+        )
+        self.assertEqual("127.0.0.1", host)
+        self.assertEqual(3, len(connections))
+
+        latencies = await measure_hosts_latency(
+            ["127.0.0.1", "unresolvable.invalid"], port, retry=3, timeout=1
+        )
+        self.assertEqual(3, len(latencies["127.0.0.1"].rtts))
+        self.assertEqual(3, latencies["unresolvable.invalid"].failures)
+        # Served from cache
+        self.assertEqual(3, len(connections))
+
+    @async_test
+    async def test_unreachable(self):
+        port = _closed_port()
+        self.assertIsNone(
+            await nearest_host_from_list(["127.0.0.1"], port, retry=2, ttl=0)
+        )
+        self.assertEqual({}, utils._latency_cache)
+
+    @async_test
+    async def test_expired_dropped(self):
+        port = _closed_port()
+        await measure_hosts_latency(["127.0.0.1"], port, retry=1, ttl=0.01)
+        await asyncio.sleep(0.02)
+        await measure_hosts_latency(["localhost"], port, retry=1, ttl=60)
+        self.assertEqual([(("localhost",), port)], list(utils._latency_cache))
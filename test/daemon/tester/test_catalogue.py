@@ -0,0 +1,253 @@
+import asyncio
+import json
+import random
+import unittest
+from datetime import datetime, timedelta
+
+from vpnspeed.constans import DEFAULT_SERVER_CHECK_CONCURRENCY
+from vpnspeed.container.stream import STDOUT, ExecOutput
+from vpnspeed.errors import TesterServersNotFound
+from vpnspeed.model import ServerCheck, TestCase, TestGroup
+from vpnspeed.simulation import FakeExecStream
+from vpnspeed.tester import ServerCatalogue, SpeedTestCliTester
+from vpnspeed.timeline import Timeline
+from utils import async_test
+
+
+SERVERS = [
+    {"id": i, "host": host, "port": 8080, "location": city, "country": "Germany"}
+    for i, host, city in (
+        (1, "a.example", "Frankfurt"),
+        (2, "b.example", "Berlin"),
+        (3, "c.example", "Berlin"),
+    )
+]
+
+
+class _Clock:
+    def __init__(self):
+        self.time = datetime(2021, 1, 1)
+
+    def __call__(self):
+        return self.time
+
+    def advance(self, seconds):
+        self.time += timedelta(seconds=seconds)
+
+
+class _Env:
+    """
+    Serves the server list, `/hi` of `down` hosts fails, others answer with
+    their connect time in `rtts`, 10ms by default.
+    """
+
+    def __init__(self, down=(), rtts=None, servers=SERVERS):
+        self.down = set(down)
+        self.rtts = rtts or dict()
+        self.servers = servers
+        self.lists = 0
+        self.checks = []
+        self.running = self.most_running = 0
+        self.timeline = Timeline()
+
+    def stream_exec(self, cmd, args=None, timeout=600, user="root"):
+        self.lists += 1
+        return FakeExecStream(self._list(), timeout)
+
+    async def _list(self):
+        yield ExecOutput(STDOUT, json.dumps({"servers": self.servers}))
+
+    async def exec(self, cmd, args=None, output=False, timeout=600, **kwargs):
+        host = args[-1].split("/")[2].split(":")[0]
+        self.checks.append(host)
+        self.running += 1
+        self.most_running = max(self.running, self.most_running)
+        await asyncio.sleep(0.01)
+        self.running -= 1
+        if host in self.down:
+            return [7, None]
+        return [0, "{:.6f}".format(self.rtts.get(host, 0.01))]
+
+
+class _Backup:
+    def __init__(self, checks=()):
+        self.checks = list(checks)
+
+    async def retrieve_server_checks(self):
+        return list(self.checks)
+
+    async def save_server_check(self, check):
+        self.checks.append(check)
+
+
+GROUP = TestGroup(vpn_country="de", target_country="de", vpn_city="Berlin")
+CASE = TestCase(vpn="nordvpn-app", technology="nordlynx")
+OTHER_CASE = TestCase(vpn="expressvpn-app", technology="lightway")
+
+
+class TestServerCatalogue(unittest.TestCase):
+    def test_list_expiry(self):
+        clock = _Clock()
+        catalogue = ServerCatalogue(ttl=100, refresh=10, now=clock)
+        key = ("de", "de", "Berlin")
+        self.assertIsNone(catalogue.servers(key))
+        self.assertTrue(catalogue.stale(key))
+        catalogue.update(key, SERVERS)
+        self.assertEqual(SERVERS, catalogue.servers(key))
+        self.assertFalse(catalogue.stale(key))
+
+        clock.advance(50)
+        self.assertEqual(SERVERS, catalogue.servers(key))
+        self.assertTrue(catalogue.stale(key))
+        clock.advance(51)
+        self.assertIsNone(catalogue.servers(key))
+        stats = catalogue.stats()
+        self.assertEqual((1, 2, 2), (stats.lists, stats.hits, stats.misses))
+
+    def test_check_expiry(self):
+        clock = _Clock()
+        catalogue = ServerCatalogue(check_ttl=100, failure_ttl=10, now=clock)
+        catalogue.record("a.example", "8080", True)
+        catalogue.record("b.example", 8080, False)
+        self.assertTrue(catalogue.check("a.example", 8080))
+        self.assertFalse(catalogue.check("b.example", "8080"))
+        clock.advance(11)
+        self.assertTrue(catalogue.check("a.example", 8080))
+        self.assertIsNone(catalogue.check("b.example", 8080))
+        self.assertIsNone(catalogue.check("c.example", 8080))
+
+    def test_ranking_expiry(self):
+        clock = _Clock()
+        catalogue = ServerCatalogue(check_ttl=100, now=clock)
+        key = ("de", "de", "Berlin")
+        tunnel = ("nordvpn-app", "nordlynx")
+        measured = [(SERVERS[0], 10.0), (SERVERS[2], 12.0)]
+        self.assertIsNone(catalogue.ranking(key, tunnel))
+        catalogue.rank(key, tunnel, measured)
+        self.assertEqual(measured, catalogue.ranking(key, tunnel))
+        self.assertIsNone(catalogue.ranking(key, ("nordvpn-app", "openvpn")))
+        clock.advance(101)
+        self.assertIsNone(catalogue.ranking(key, tunnel))
+
+        # Empty measurements are measured again
+        catalogue.rank(key, tunnel, [])
+        self.assertIsNone(catalogue.ranking(key, tunnel))
+
+        # New lists are measured again
+        catalogue.rank(key, tunnel, measured)
+        catalogue.update(key, SERVERS)
+        self.assertIsNone(catalogue.ranking(key, tunnel))
+
+    @async_test
+    async def test_checks_persisted(self):
+        clock = _Clock()
+        stored = ServerCheck("b.example", 8080, False, clock() - timedelta(seconds=5))
+        backup = _Backup([stored])
+        catalogue = ServerCatalogue(failure_ttl=10, now=clock)
+        await catalogue.set_backup(backup)
+        self.assertFalse(catalogue.check("b.example", 8080))
+
+        catalogue.record("a.example", 8080, True)
+        # Saved in the background
+        await asyncio.sleep(0)
+        self.assertEqual(
+            ServerCheck("a.example", 8080, True, clock()), backup.checks[-1]
+        )
+
+
+class TestCachedResolve(unittest.TestCase):
+    @async_test
+    async def test_resolve_from_memory(self):
+        clock = _Clock()
+        catalogue = ServerCatalogue(ttl=100, refresh=10, now=clock)
+        tester = SpeedTestCliTester(catalogue)
+
+        env = _Env(down={"b.example"})
+        group, _, rtt = await tester._resolve(env, GROUP, CASE)
+        self.assertEqual(
+            ("c.example", 3), (group.target_server, group.target_server_id)
+        )
+        self.assertEqual(10.0, rtt)
+        self.assertEqual(1, env.lists)
+        self.assertEqual(["a.example", "b.example", "c.example"], env.checks)
+
+        # Connect times of the tunnel are reused, nothing is measured again
+        # and no connect time is reported for the run
+        env = _Env(down={"b.example"})
+        group, _, rtt = await tester._resolve(env, GROUP, CASE)
+        self.assertEqual(("c.example", None), (group.target_server, rtt))
+        self.assertEqual((0, []), (env.lists, env.checks))
+
+        # Other tunnels measure their own, known failures are skipped
+        group, _, rtt = await tester._resolve(env, GROUP, OTHER_CASE)
+        self.assertEqual(10.0, rtt)
+        self.assertEqual(["a.example", "c.example"], env.checks)
+
+        # Servers failed since are left out of the ranking
+        env = _Env(down={"b.example"})
+        catalogue.record("c.example", 8080, False)
+        group, _, _ = await tester._resolve(env, GROUP, CASE)
+        self.assertEqual(("a.example", []), (group.target_server, env.checks))
+
+        # Stale lists are replaced after the measurement
+        clock.advance(20)
+        await tester._refresh(env, ("de", "de", "Berlin"))
+        self.assertEqual(1, env.lists)
+        self.assertEqual(["refresh"], [p.name for p in env.timeline.phases()])
+        self.assertEqual(1, catalogue.stats().refreshes)
+
+        # and servers of the new list are measured, failed ones skipped
+        group, _, _ = await tester._resolve(env, GROUP, CASE)
+        self.assertEqual("a.example", group.target_server)
+        self.assertEqual(["a.example"], env.checks)
+
+    @async_test
+    async def test_failed_servers_skipped(self):
+        catalogue = ServerCatalogue()
+        tester = SpeedTestCliTester(catalogue)
+        for server in SERVERS:
+            catalogue.record(server["host"], server["port"], False)
+        env = _Env()
+        with self.assertRaises(TesterServersNotFound):
+            await tester.resolve(env, GROUP)
+        self.assertEqual([], env.checks)
+
+
+class TestServerChoice(unittest.TestCase):
+    def test_choose(self):
+        catalogue = ServerCatalogue(choice=2, rng=random.Random(1))
+        measured = [({"host": host}, rtt) for host, rtt in zip("abcd", (4, 1, 3, 2))]
+        chosen = {catalogue.choose(measured)[0]["host"] for _ in range(50)}
+        self.assertEqual({"b", "d"}, chosen)
+        catalogue.set_choice(1)
+        self.assertEqual(({"host": "b"}, 1), catalogue.choose(measured))
+        self.assertIsNone(catalogue.choose([]))
+
+    @async_test
+    async def test_ranked_by_latency(self):
+        servers = SERVERS + [
+            {
+                "id": i,
+                "host": "{}.example".format(i),
+                "port": 8080,
+                "location": "Berlin",
+                "country": "Germany",
+            }
+            for i in range(4, 24)
+        ]
+        rtts = {"a.example": 0.001, "b.example": 0.030, "c.example": 0.005}
+        env = _Env(rtts=rtts, servers=servers)
+        tester = SpeedTestCliTester(ServerCatalogue(choice=1))
+        group, _, rtt = await tester._resolve(env, GROUP)
+        # Frankfurt answers fastest, but Berlin servers come first
+        self.assertEqual(("c.example", 5.0), (group.target_server, rtt))
+        self.assertEqual(len(servers), len(env.checks))
+        self.assertEqual(DEFAULT_SERVER_CHECK_CONCURRENCY, env.most_running)
+
+    @async_test
+    async def test_country_fallback(self):
+        rtts = {"a.example": 0.002}
+        env = _Env(down={"b.example", "c.example"}, rtts=rtts)
+        tester = SpeedTestCliTester(ServerCatalogue())
+        group, _, rtt = await tester._resolve(env, GROUP)
+        self.assertEqual(("a.example", 2.0), (group.target_server, rtt))
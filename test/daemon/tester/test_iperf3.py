@@ -0,0 +1,295 @@
+import asyncio
+import json
+import shutil
+import socket
+import unittest
+from asyncio.subprocess import DEVNULL, PIPE
+from datetime import datetime
+
+from vpnspeed.container.stream import STDOUT, ExecOutput
+from vpnspeed.errors import TestCaseError, TestRunError, TesterServersNotFound
+from vpnspeed.geoip import geo_resolver
+from vpnspeed.model import Config, Iperf3, TestCase, TestGroup
+from vpnspeed.simulation import FakeExecStream, FakeGeoBackend
+from vpnspeed.tester import DynamicTester, Iperf3Tester, SpeedTestCliTester
+from vpnspeed.tester.iperf3 import parse_server
+from vpnspeed.timeline import Timeline
+from utils import async_test
+
+
+GROUP = TestGroup(vpn_country="de", target_country="auto")
+CASE = TestCase(vpn="nordvpn-app", technology="nordlynx")
+
+# Client options of iperf3 3.6 shipped with the test image (Debian 10),
+# newer ones such as --connect-timeout (3.7) make it exit with usage
+IPERF3_36_OPTIONS = {
+    *("-c", "-p", "-J", "-P", "-t", "-R", "-u", "-b", "-i", "-O", "-w", "-l"),
+    *("-4", "-6", "-B", "-M", "-N", "-Z", "-T", "-C", "-S", "-k", "-n", "-F"),
+}
+
+
+def _tcp(remote, reverse, bits_per_second, seconds=10.0):
+    """iperf3 -J output of a TCP test with two streams."""
+    sent = {"seconds": seconds, "bytes": int(bits_per_second * seconds / 8)}
+    # Round trip times are known for streams the client sends
+    streams = [
+        {"sender": {"socket": 5 + i, "bytes": sent["bytes"] // 2}}
+        for i in range(2)
+    ]
+    if not reverse:
+        for stream, rtt in zip(streams, (21000, 23000)):
+            stream["sender"].update(max_rtt=30000, min_rtt=15000, mean_rtt=rtt)
+    return {
+        "start": {
+            "connected": [
+                {
+                    "socket": 5,
+                    "local_host": "10.5.0.2",
+                    "local_port": 40000,
+                    "remote_host": remote,
+                    "remote_port": 5201,
+                }
+            ],
+            "timestamp": {
+                "time": "Fri, 01 Jan 2021 00:00:00 GMT",
+                "timesecs": 1609459200,
+            },
+            "test_start": {
+                "protocol": "TCP",
+                "num_streams": 2,
+                "reverse": int(reverse),
+            },
+        },
+        "intervals": [],
+        "end": {
+            "streams": streams,
+            "sum_sent": dict(sent, bits_per_second=bits_per_second, retransmits=3),
+            "sum_received": dict(
+                sent,
+                bytes=sent["bytes"] - 1000,
+                bits_per_second=bits_per_second * 0.99,
+            ),
+        },
+    }
+
+
+def _udp(remote, bits_per_second, lost_percent, jitter_ms):
+    result = _tcp(remote, False, bits_per_second)
+    result["end"] = {
+        "streams": [{"udp": {"jitter_ms": jitter_ms}}],
+        "sum": {
+            "seconds": 10.0,
+            "bytes": int(bits_per_second * 10 / 8),
+            "bits_per_second": bits_per_second,
+            "jitter_ms": jitter_ms,
+            "lost_packets": 10,
+            "packets": 1000,
+            "lost_percent": lost_percent,
+        },
+    }
+    return result
+
+
+def _error(message):
+    return {"start": {"connected": []}, "intervals": [], "end": {}, "error": message}
+
+
+class _CannedEnv:
+    """Answers iperf3 runs with `outputs` by server host."""
+
+    def __init__(self, outputs):
+        self.outputs = outputs
+        self.runs = []
+        self.timeline = Timeline()
+
+    def stream_exec(self, cmd, args=None, timeout=600, user="root"):
+        host = args[args.index("-c") + 1]
+        self.runs.append((host, args))
+        output = self.outputs[host]
+        if isinstance(output, list):
+            output = output["-R" in args]
+        return FakeExecStream(self._lines(output), timeout)
+
+    async def _lines(self, output):
+        # iperf3 pretty prints its JSON over many lines
+        for line in json.dumps(output, indent=4).splitlines():
+            yield ExecOutput(STDOUT, line)
+
+
+class _ShellEnv:
+    """Runs commands locally instead of in a container."""
+
+    def __init__(self):
+        self.timeline = Timeline()
+
+    def stream_exec(self, cmd, args=None, timeout=600, user="root"):
+        return FakeExecStream(self._run(cmd, args or []), timeout)
+
+    async def _run(self, cmd, args):
+        proc = await asyncio.create_subprocess_exec(cmd, *args, stdout=PIPE)
+        try:
+            async for line in proc.stdout:
+                yield ExecOutput(STDOUT, line.decode().rstrip("\n"))
+        finally:
+            if proc.returncode is None:
+                proc.kill()
+            await proc.wait()
+
+
+class TestIperf3Tester(unittest.TestCase):
+    def setUp(self):
+        self.geo = FakeGeoBackend()
+        self.server_ip = self.geo.address("NL", "Netherlands", "Amsterdam")
+        self.backends = geo_resolver.backends
+        geo_resolver.backends = [self.geo]
+        geo_resolver.clear()
+
+    def tearDown(self):
+        geo_resolver.backends = self.backends
+        geo_resolver.clear()
+
+    def test_parse_server(self):
+        self.assertEqual(("a.example", 5201), parse_server("a.example"))
+        self.assertEqual(("a.example", 9000), parse_server("a.example:9000"))
+        self.assertEqual(("2001:db8::1", 5201), parse_server("2001:db8::1"))
+        self.assertEqual(("2001:db8::1", 9000), parse_server("[2001:db8::1]:9000"))
+
+    def test_args_supported(self):
+        # Every option must be known to iperf3 3.6 of the test image
+        for options in (Iperf3(), Iperf3(udp=True, bitrate="10M", streams=4)):
+            tester = Iperf3Tester(options)
+            for reverse in (False, True):
+                args = tester._args("a.example", 5201, reverse)
+                flags = [arg for arg in args if arg.startswith("-")]
+                self.assertLessEqual(set(flags), IPERF3_36_OPTIONS, args)
+
+    @async_test
+    async def test_tcp_both_directions(self):
+        env = _CannedEnv(
+            {
+                "a": [
+                    _tcp(self.server_ip, False, 400e6),
+                    _tcp(self.server_ip, True, 800e6),
+                ]
+            }
+        )
+        tester = Iperf3Tester(Iperf3(servers=["a"], streams=2, duration=5))
+        run = await tester.test(env, GROUP, CASE)
+
+        upload, download = env.runs
+        self.assertEqual(
+            ["-c", "a", "-p", "5201", "-J", "-P", "2", "-t", "5"], upload[1]
+        )
+        self.assertNotIn("-R", upload[1])
+        self.assertIn("-R", download[1])
+        self.assertNotIn("-u", upload[1])
+        self.assertEqual(
+            ["upload", "download"], [p.name for p in env.timeline.phases()]
+        )
+
+        self.assertEqual(datetime(2021, 1, 1), run.timestamp)
+        self.assertEqual(int(400e6 * 0.99 / 8), run.upload_bandwidth)
+        self.assertEqual(int(800e6 * 0.99 / 8), run.download_bandwidth)
+        self.assertEqual(int(800e6 * 10 / 8) - 1000, run.download_bytes)
+        self.assertEqual(10000, run.download_elapsed)
+        # Mean RTT of sending streams, microseconds to milliseconds
+        self.assertEqual(22.0, run.ping_latency)
+        self.assertIsNone(run.ping_jitter)
+        self.assertIsNone(run.packet_loss)
+        self.assertEqual(
+            (self.server_ip, "10.5.0.2"), (run.server_ip, run.interface_internal_ip)
+        )
+        self.assertEqual(("a:5201", "a"), (run.server_host, run.server_name))
+        self.assertEqual(
+            ("Netherlands", "nl", "Amsterdam"),
+            (run.server_country, run.server_country_code, run.server_location),
+        )
+
+    @async_test
+    async def test_udp_upload_only(self):
+        env = _CannedEnv({"a": _udp(self.server_ip, 200e6, 1.5, 0.25)})
+        tester = Iperf3Tester(
+            Iperf3(servers=["a:9000"], reverse=False, udp=True, bitrate="200M")
+        )
+        run = await tester.test(env, GROUP, CASE)
+
+        (_, args), = env.runs
+        self.assertEqual(["-u", "-b", "200M"], args[-3:])
+        self.assertEqual("9000", args[args.index("-p") + 1])
+        self.assertEqual(int(200e6 / 8), run.upload_bandwidth)
+        self.assertIsNone(run.download_bandwidth)
+        self.assertEqual((0.25, 1.5), (run.ping_jitter, run.packet_loss))
+        self.assertIsNone(run.ping_latency)
+
+    @async_test
+    async def test_busy_server_skipped(self):
+        env = _CannedEnv(
+            {
+                "a": _error("the server is busy running a test. try again later"),
+                "b": _error("unable to connect to server: Connection refused"),
+                "c": [
+                    _tcp(self.server_ip, False, 100e6),
+                    _tcp(self.server_ip, True, 100e6),
+                ],
+            }
+        )
+        tester = Iperf3Tester(Iperf3(servers=["a", "b", "c"]))
+        run = await tester.test(env, GROUP, CASE)
+        self.assertEqual(["a", "b", "c", "c"], [host for host, _ in env.runs])
+        self.assertEqual("c:5201", run.server_host)
+
+        env = _CannedEnv({"a": _error("the server is busy running a test.")})
+        with self.assertRaises(TestRunError):
+            await Iperf3Tester(Iperf3(servers=["a"])).test(env, GROUP, CASE)
+
+    @async_test
+    async def test_errors(self):
+        env = _CannedEnv({"a": _error("unable to set TCP window")})
+        with self.assertRaises(TestCaseError):
+            await Iperf3Tester(Iperf3(servers=["a"])).test(env, GROUP, CASE)
+        with self.assertRaises(TesterServersNotFound):
+            await Iperf3Tester().test(env, GROUP, CASE)
+
+    @async_test
+    async def test_dynamic_tester(self):
+        tester = DynamicTester()
+        self.assertIsInstance(tester.current, SpeedTestCliTester)
+        tester.configure(Config(tester="iperf3", iperf3=Iperf3(servers=["a"])))
+        self.assertIsInstance(tester.current, Iperf3Tester)
+        group = await tester.resolve(None, GROUP)
+        self.assertEqual("a:5201", group.target_server)
+
+    @unittest.skipIf(shutil.which("iperf3") is None, "iperf3 is not installed")
+    @async_test
+    async def test_local_server(self):
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        servers = []
+
+        async def serve():
+            # Serves a single test, then exits
+            servers.append(
+                await asyncio.create_subprocess_exec(
+                    *("iperf3", "-s", "-1", "-B", "127.0.0.1", "-p", str(port)),
+                    stdout=DEVNULL,
+                )
+            )
+            await asyncio.sleep(0.5)
+
+        tester = Iperf3Tester(Iperf3(streams=2, duration=1))
+        try:
+            await serve()
+            upload = await tester._run(_ShellEnv(), "127.0.0.1", port, False)
+            await serve()
+            download = await tester._run(_ShellEnv(), "127.0.0.1", port, True)
+            run = tester._result(upload, download)
+        finally:
+            for server in servers:
+                if server.returncode is None:
+                    server.kill()
+                await server.wait()
+        self.assertEqual("127.0.0.1", run.server_ip)
+        self.assertGreater(run.upload_bandwidth, 0)
+        self.assertGreater(run.download_bandwidth, 0)
+        self.assertAlmostEqual(1000, run.upload_elapsed, delta=200)
@@ -0,0 +1,87 @@
+import json
+import unittest
+
+from vpnspeed.container.stream import STDOUT, ExecOutput
+from vpnspeed.errors import TestCaseError
+from vpnspeed.model import TestCase, TestGroup
+from vpnspeed.simulation import FakeExecStream
+from vpnspeed.tester import ServerCatalogue, SpeedTestCliTester
+from vpnspeed.timeline import Timeline
+from utils import async_test
+
+
+GROUP = TestGroup(vpn_country="de", target_country="auto")
+CASE = TestCase(vpn="nordvpn-app", technology="nordlynx")
+
+RESULT = {
+    "type": "result",
+    "timestamp": "2021-01-01T00:00:00Z",
+    "ping": {"jitter": 0.5, "latency": 12.0},
+    "download": {"bandwidth": 1000, "bytes": 10000, "elapsed": 10000},
+    "upload": {"bandwidth": 500, "bytes": 5000, "elapsed": 10000},
+    "packetLoss": 0,
+    "isp": "Example",
+    "interface": {
+        "internalIp": "10.5.0.2",
+        "name": "nordlynx",
+        "externalIp": "203.0.113.1",
+    },
+    "server": {
+        "id": 1,
+        "host": "a.example",
+        "port": 8080,
+        "name": "Example",
+        "location": "Frankfurt",
+        "country": "Germany",
+        "ip": "198.51.100.1",
+    },
+}
+
+
+class _Env:
+    """speedtest-cli prints `events` as JSON lines."""
+
+    def __init__(self, events):
+        self.events = events
+        self.timeline = Timeline()
+
+    def stream_exec(self, cmd, args=None, timeout=600, user="root"):
+        return FakeExecStream(self._lines(), timeout)
+
+    async def _lines(self):
+        for event in self.events:
+            yield ExecOutput(STDOUT, json.dumps(event))
+
+
+class TestSpeedTestCliEvents(unittest.TestCase):
+    @async_test
+    async def test_error_log_continues(self):
+        env = _Env(
+            [
+                {"type": "testStart", "server": RESULT["server"]},
+                {
+                    "type": "log",
+                    "level": "error",
+                    "message": "Latency test failed for 198.51.100.2",
+                },
+                {"type": "ping", "ping": {"progress": 1.0}},
+                RESULT,
+            ]
+        )
+        tester = SpeedTestCliTester(ServerCatalogue())
+        with self.assertLogs("vpnspeed", "WARNING") as logs:
+            run = await tester.test(env, GROUP, CASE)
+        self.assertIn("Latency test failed", logs.output[0])
+        self.assertEqual(1000, run.download_bandwidth)
+        self.assertEqual("de", run.server_country_code)
+
+    @async_test
+    async def test_errors(self):
+        tester = SpeedTestCliTester(ServerCatalogue())
+        # Error logs alone give no result
+        env = _Env([{"type": "log", "level": "error", "message": "Timeout"}])
+        with self.assertRaises(TestCaseError), self.assertLogs("vpnspeed"):
+            await tester.test(env, GROUP, CASE)
+        env = _Env([{"error": "Configuration - Could not retrieve"}])
+        with self.assertRaises(TestCaseError):
+            await tester.test(env, GROUP, CASE)